@@ -17,6 +17,7 @@ https://github.com/Carglglz/NFC_PN532_SPI
 """
 
 import time
+from array import array
 from machine import Pin
 from micropython import const
 
@@ -41,9 +42,15 @@ _COMMAND_SETPARAMETERS = const(0x12)
 _COMMAND_SAMCONFIGURATION = const(0x14)
 
 _COMMAND_INLISTPASSIVETARGET = const(0x4A)
+_SEL_RES_ISO14443_4 = const(0x20)
+# Worst case of one InListPassiveTarget 106 kbps type A target: Tg, SENS_RES,
+# SEL_RES, NFCID length, a 10-byte NFCID and an ATS of at most 62 bytes (the
+# PN532 asks for FSD 64, ATS included, minus the CRC).
+_TARGET_MAX_BYTES = const(5 + 10 + 62)
 
 _COMMAND_INDATAEXCHANGE = const(0x40)
 _COMMAND_INCOMMUNICATETHRU = const(0x42)
+_COMMAND_INAUTOPOLL = const(0x60)
 
 
 _RESPONSE_INDATAEXCHANGE = const(0x41)
@@ -53,12 +60,21 @@ _WAKEUP = const(0x55)
 
 _MIFARE_ISO14443A = const(0x00)
 
+# InAutoPoll target types
+AUTOPOLL_GENERIC_106A = const(0x00)  # generic passive 106 kbps ISO14443-A
+AUTOPOLL_MIFARE = const(0x10)        # MIFARE card (106 kbps type A)
+
 # Mifare Commands
 MIFARE_CMD_AUTH_A = const(0x60)
 MIFARE_CMD_AUTH_B = const(0x61)
 MIFARE_CMD_READ = const(0x30)
 MIFARE_CMD_WRITE = const(0xA0)
 MIFARE_ULTRALIGHT_CMD_WRITE = const(0xA2)
+NTAG2XX_CMD_FAST_READ = const(0x3A)
+
+# Largest number of NTAG pages read by one FAST_READ, keeps the response
+# frame under the 255 byte PN532 frame limit.
+NTAG2XX_FAST_READ_MAX_PAGES = const(60)
 
 
 _ACK = b'\x00\x00\xFF\x00\xFF\x00'
@@ -69,6 +85,14 @@ _SPI_DATAWRITE = const(0x01)
 _SPI_DATAREAD = const(0x03)
 _SPI_READY = const(0x01)
 
+# call_function outcomes counted by CommandTrace
+TRACE_OK = const(0)
+TRACE_TIMEOUT = const(1)      # no status ready within the timeout (before or after the ACK)
+TRACE_ACK_ERROR = const(2)    # something other than an ACK frame came back
+TRACE_FRAME_ERROR = const(3)  # bad preamble, length/data checksum or response code
+TRACE_WAKEUP = const(4)       # OSError while writing, the chip was woken up again
+TRACE_BUCKETS = (10, 20, 50, 100, 200, 500, 1000)  # latency histogram upper bounds, ms
+
 
 def _reset(pin):
     """Perform a hardware reset toggle"""
@@ -86,6 +110,50 @@ class BusyError(Exception):
     pass
 
 
+class CommandTrace:
+    """Per command code counters of call_function: outcomes, time to ACK,
+    total time and a fixed-bucket latency histogram.  Each command gets one
+    array('I') the first time it is seen, recording allocates nothing.
+    """
+    FIELDS = ('count', 'ok', 'timeouts', 'ack_errors', 'frame_errors', 'wakeups', 'total_ms', 'ack_ms', 'max_ms')
+
+    def __init__(self, buckets=TRACE_BUCKETS):
+        self.buckets = buckets
+        self.commands = {}  # command code -> array('I'), FIELDS then histogram
+
+    def record(self, command, start, outcome, acked=None):
+        now = time.ticks_ms()
+        stats = self.commands.get(command)
+        if stats is None:
+            stats = self.commands[command] = array('I', [0] * (len(self.FIELDS) + len(self.buckets) + 1))
+        elapsed = time.ticks_diff(now, start)
+        stats[0] += 1
+        stats[1 + outcome] += 1
+        stats[6] += elapsed
+        if acked is not None:
+            stats[7] += time.ticks_diff(acked, start)
+        if elapsed > stats[8]:
+            stats[8] = elapsed
+        i = 9
+        for bound in self.buckets:
+            if elapsed <= bound:
+                break
+            i += 1
+        stats[i] += 1
+
+    def snapshot(self):
+        """Returns {'0x4a': {'count': .., ..., 'buckets': [..]}, ...}."""
+        result = {}
+        for command, stats in self.commands.items():
+            entry = {name: stats[i] for i, name in enumerate(self.FIELDS)}
+            entry['buckets'] = list(stats[len(self.FIELDS):])
+            result['0x%02x' % command] = entry
+        return result
+
+    def reset(self):
+        self.commands = {}
+
+
 def reverse_bit(num):
     """Turn an LSB byte to an MSB byte, and vice versa. Used for SPI as
     it is LSB for the PN532, but 99% of SPI implementations are MSB only!"""
@@ -102,17 +170,28 @@ class PN532:
     SPI device & chip select digitalInOut pin. Optional IRQ pin (not used),
     reset pin and debugging output."""
 
-    def __init__(self, spi, cs_pin, irq=None, reset=None, debug=False):
-        """Create an instance of the PN532 class using SPI"""
+    def __init__(self, spi, cs_pin, irq=None, reset=None, debug=False, wakeup=True):
+        """Create an instance of the PN532 class using SPI.  With wakeup=False
+        the caller wakes the chip (see ReaderPool.wakeup), which avoids the
+        blocking sleeps of _wakeup()."""
         self.debug = debug
         self._irq = irq
         self.CSB = cs_pin
         self._spi = spi
         self.CSB.on()
+        # ATQA (SENS_RES) and SAK (SEL_RES) of the last selected target
+        self.sens_res = None
+        self.sel_res = None
+        # ticks_ms of the last ACK, every acknowledged command proves the chip is alive
+        self.last_ack_ms = None
+        # CommandTrace while tracing is enabled, see enable_trace()
+        self.trace = None
         if reset:
             if debug:
                 print("Resetting")
             _reset(reset)
+        if not wakeup:
+            return
 
         try:
             self._wakeup()
@@ -257,6 +336,9 @@ class PN532:
         for a response and return a bytearray of response bytes, or None if no
         response is available within the timeout.
         """
+        trace = self.trace
+        if trace is not None:
+            start = time.ticks_ms()
         # Build frame data with command and parameters.
         data = bytearray(2+len(params))
         data[0] = _HOSTTOPN532
@@ -268,22 +350,61 @@ class PN532:
             self._write_frame(data)
         except OSError:
             self._wakeup()
+            if trace is not None:
+                trace.record(command, start, TRACE_WAKEUP)
             return None
         if not self._wait_ready(timeout):
+            if trace is not None:
+                trace.record(command, start, TRACE_TIMEOUT)
             return None
         # Verify ACK response and wait to be ready for function response.
         if not _ACK == self._read_data(len(_ACK)):
+            if trace is not None:
+                trace.record(command, start, TRACE_ACK_ERROR)
             raise RuntimeError('Did not receive expected ACK from PN532!')
+        self.last_ack_ms = time.ticks_ms()
         if not self._wait_ready(timeout):
+            if trace is not None:
+                trace.record(command, start, TRACE_TIMEOUT, self.last_ack_ms)
             return None
         # Read response bytes.
-        response = self._read_frame(response_length+2)
+        try:
+            response = self._read_frame(response_length+2)
+        except RuntimeError:
+            if trace is not None:
+                trace.record(command, start, TRACE_FRAME_ERROR, self.last_ack_ms)
+            raise
         # Check that response is for the called function.
         if not (response[0] == _PN532TOHOST and response[1] == (command+1)):
+            if trace is not None:
+                trace.record(command, start, TRACE_FRAME_ERROR, self.last_ack_ms)
             raise RuntimeError('Received unexpected command response!')
+        if trace is not None:
+            trace.record(command, start, TRACE_OK, self.last_ack_ms)
         # Return response data.
         return response[2:]
 
+    def enable_trace(self, enabled=True):
+        """Start (with fresh counters) or stop tracing call_function.  While
+        disabled the only cost is one attribute check per exit of call_function.
+        """
+        self.trace = CommandTrace() if enabled else None
+
+    def trace_stats(self):
+        """Per command trace counters (see CommandTrace.snapshot), None if tracing is off."""
+        return self.trace.snapshot() if self.trace is not None else None
+
+    def abort(self):
+        """Send an ACK frame, which makes the PN532 drop the command it is
+        still processing (e.g. an InListPassiveTarget that timed out on the
+        host side).  Otherwise its late response would be read as the answer
+        to the next command.
+        """
+        try:
+            self._write_data(_ACK)
+        except OSError:
+            self._wakeup()
+
     def get_firmware_version(self):
         """Call PN532 GetFirmwareVersion function and return a tuple with the IC,
         Ver, Rev, and Support values.
@@ -294,6 +415,70 @@ class PN532:
             raise RuntimeError('Failed to detect the PN532')
         return tuple(response)
 
+    def is_ready(self):
+        """Check once, without waiting, whether the PN532 has a response ready.
+        Uses the IRQ pin if one was given (no SPI traffic), otherwise one SPI
+        status read.
+        """
+        if self._irq is not None:
+            return self._irq.value() == 0
+        status = bytearray([reverse_bit(_SPI_STATREAD), 0])
+        self.CSB.off()
+        time.sleep_ms(2)
+        self._spi.write_readinto(status, status)
+        time.sleep_ms(2)
+        self.CSB.on()
+        return reverse_bit(status[1]) == _SPI_READY
+
+    def start_autopoll(self, period=2, types=(AUTOPOLL_MIFARE,), polls=0xFF):
+        """Start InAutoPoll: the PN532 keeps scanning for the given target types
+        on its own, every period * 150 ms, up to polls times (0xFF = until a
+        target is found).  Returns once the command is acknowledged, the result
+        is collected later with read_autopoll() when is_ready() says so.
+        Returns False if the PN532 did not acknowledge the command.
+        """
+        data = bytearray(4+len(types))
+        data[0] = _HOSTTOPN532
+        data[1] = _COMMAND_INAUTOPOLL
+        data[2] = polls & 0xFF
+        data[3] = period & 0x0F
+        data[4:] = bytes(types)
+        try:
+            self._write_frame(data)
+        except OSError:
+            self._wakeup()
+            return False
+        if not self._wait_ready(100):
+            return False
+        if not _ACK == self._read_data(len(_ACK)):
+            raise RuntimeError('Did not receive expected ACK from PN532!')
+        self.last_ack_ms = time.ticks_ms()
+        return True
+
+    def read_autopoll(self, response_length=32):
+        """Read the result of a finished InAutoPoll.  Returns a list with the
+        UID of every ISO14443-A target found (the first one is selected as
+        Tg 1), or an empty list.
+        """
+        response = self._read_frame(response_length+2)
+        if not (response[0] == _PN532TOHOST and response[1] == _COMMAND_INAUTOPOLL+1):
+            raise RuntimeError('Received unexpected command response!')
+        uids = []
+        offset = 3
+        for _ in range(response[2]):
+            # [Type, Length, Tg, SENS_RES(2), SEL_RES, NFCIDLength, NFCID...]
+            target_type, length = response[offset], response[offset+1]
+            if target_type in (AUTOPOLL_GENERIC_106A, AUTOPOLL_MIFARE):
+                uid_len = response[offset+6]
+                if uid_len > 7:
+                    raise RuntimeError('Found card with unexpectedly long UID!')
+                if not uids:
+                    self.sens_res = (response[offset+3] << 8) | response[offset+4]
+                    self.sel_res = response[offset+5]
+                uids.append(response[offset+7:offset+7+uid_len])
+            offset += 2 + length
+        return uids
+
     def SAM_configuration(self):   # pylint: disable=invalid-name
         """Configure the PN532 to read MiFare cards."""
         # Send SAM configuration command with configuration for:
@@ -305,30 +490,102 @@ class PN532:
         self.call_function(_COMMAND_SAMCONFIGURATION,
                            params=[0x01, 0x14, 0x01])
 
-    def read_passive_target(self, card_baud=_MIFARE_ISO14443A, timeout=1000):
+    def read_passive_target(self, card_baud=_MIFARE_ISO14443A, timeout=1000, uid=None):
         """Wait for a MiFare card to be available and return its UID when found.
         Will wait up to timeout seconds and return None if no card is found,
         otherwise a bytearray with the UID of the found card is returned.
+        With `uid` (106 kbps type A only) the PN532 selects that card and no
+        other, e.g. to select a card again when a second one is in the field.
         """
         # Send passive read command for 1 card.  Expect at most a 7 byte UUID.
         try:
             response = self.call_function(_COMMAND_INLISTPASSIVETARGET,
-                                          params=[0x01, card_baud],
+                                          params=[0x01, card_baud] + list(uid or b''),
                                           response_length=19,
                                           timeout=timeout)
         except BusyError:
             return None  # no card found!
         # If no response is available return None to indicate no card is present.
         if response is None:
+            self.abort()
             return None
         # Check only 1 card with up to a 7 byte UID is present.
         if response[0] != 0x01:
             raise RuntimeError('More than one card detected!')
         if response[5] > 7:
             raise RuntimeError('Found card with unexpectedly long UID!')
+        self.sens_res = (response[2] << 8) | response[3]
+        self.sel_res = response[4]
         # Return UID of card.
         return response[6:6+response[5]]
 
+    def read_passive_targets(self, max_targets=2, card_baud=_MIFARE_ISO14443A, timeout=1000):
+        """Like read_passive_target, but lets the PN532 select up to max_targets
+        (1 or 2) cards in one InListPassiveTarget.  Returns a list with the UID
+        of every card found, in target number order (the first one is Tg 1,
+        the target used by the MiFare functions), or an empty list.
+        """
+        assert 1 <= max_targets <= 2, 'PN532 selects at most 2 targets.'
+        try:
+            response = self.call_function(_COMMAND_INLISTPASSIVETARGET,
+                                          params=[max_targets, card_baud],
+                                          response_length=1+_TARGET_MAX_BYTES*max_targets,
+                                          timeout=timeout)
+        except BusyError:
+            return []
+        if response is None:
+            self.abort()
+            return []
+        uids = []
+        offset = 1
+        for _ in range(min(response[0], max_targets)):
+            # [Tg, SENS_RES(2), SEL_RES, NFCIDLength, NFCID..., ATS...]
+            uid_len = response[offset+4]
+            if uid_len > 7:
+                raise RuntimeError('Found card with unexpectedly long UID!')
+            sel_res = response[offset+3]
+            if not uids:
+                self.sens_res = (response[offset+1] << 8) | response[offset+2]
+                self.sel_res = sel_res
+            uids.append(response[offset+5:offset+5+uid_len])
+            offset += 5 + uid_len
+            if sel_res & _SEL_RES_ISO14443_4 and offset < len(response):
+                # ISO14443-4 targets (DESFire, phones) are followed by their
+                # ATS, whose first byte (TL) is its length, itself included.
+                offset += max(1, response[offset])
+        return uids
+
+    def card_class(self):
+        """Return the ATQA/SAK of the last selected target packed into one int,
+        or None if no target was selected yet.
+        """
+        if self.sens_res is None:
+            return None
+        return (self.sens_res << 8) | self.sel_res
+
+    def mifare_classic_authenticate_block(self, uid, block_number, key_number, key):  # pylint: disable=invalid-name
+        """Authenticate specified block number for a MiFare classic card.  Uid
+        should be a byte array with the UID of the card, block number should be
+        the block to authenticate, key number should be the key type (like
+        MIFARE_CMD_AUTH_A or MIFARE_CMD_AUTH_B), and key should be a byte array
+        with the key data.  Returns True if the block was authenticated, or False
+        if not authenticated.  A failed authentication drops the card out of the
+        selected state, it has to be selected again before the next attempt.
+        """
+        # PN532 MIFARE Classic auth wants a 4-byte UID slice. For 7-byte UIDs, use the last 4 bytes.
+        uid4 = uid[-4:]
+        # InDataExchange params: [Tg=0x01, key_number, block, key[6], uid[4]]
+        params = bytearray(3 + len(key) + 4)
+        params[0] = 0x01
+        params[1] = key_number & 0xFF
+        params[2] = block_number & 0xFF
+        params[3:3+len(key)] = key
+        params[3+len(key):] = uid4
+        response = self.call_function(_COMMAND_INDATAEXCHANGE,
+                                      params=params,
+                                      response_length=1)
+        return bool(response) and response[0] == 0x00
+
     def ntag2xx_write_block(self, block_number, data):
         """Write a block of data to the card.  Block number should be the block
         to write and data should be a byte array of length 4 with the data to
@@ -373,34 +630,111 @@ class PN532:
             return None
         # Return first 4 bytes since 16 bytes are always returned.
         return response[1:]
-    
-def read_card_code_from_block4(pn532, uid, key_a=b'\xFF\xFF\xFF\xFF\xFF\xFF', block=4):
+
+    def mifare_classic_read_sector(self, uid, sector, key_number, key, buf=None):
+        """Read all data blocks of a MiFare classic sector under a single
+        authentication.  Uid and key are used like in
+        mifare_classic_authenticate_block, key number is MIFARE_CMD_AUTH_A or
+        MIFARE_CMD_AUTH_B.  The sector trailer is not read.  Data is written
+        into buf (a bytearray of at least 48 bytes, 240 for the 16-block
+        sectors of a 4K card) or into a new bytearray if buf is None.  Returns
+        the buffer, or None if authentication or a block read failed.
+        """
+        if sector < 32:
+            first_block, blocks = sector * 4, 3
+        else:  # MIFARE Classic 4K: the last 8 sectors have 16 blocks each
+            first_block, blocks = 128 + (sector - 32) * 16, 15
+        if buf is None:
+            buf = bytearray(blocks * 16)
+        elif len(buf) < blocks * 16:
+            raise ValueError('Buffer too small for sector data')
+        if not self.mifare_classic_authenticate_block(uid, first_block, key_number, key):
+            return None
+        mv = memoryview(buf)
+        for i in range(blocks):
+            data = self.mifare_classic_read_block(first_block + i)
+            if data is None or len(data) < 16:
+                return None
+            mv[i*16:(i+1)*16] = data[0:16]
+        return buf
+
+    def ntag2xx_fast_read(self, start_page, end_page, buf=None):
+        """Read NTAG2xx pages start_page..end_page (inclusive) with the
+        FAST_READ (0x3A) command, one InCommunicateThru transaction per
+        NTAG2XX_FAST_READ_MAX_PAGES pages instead of one per 4 pages.  Data is
+        written into buf (a bytearray of at least 4 bytes per page) or into a
+        new bytearray if buf is None.  Returns the buffer, or None if the tag
+        did not answer.
+        """
+        pages = end_page - start_page + 1
+        if pages < 1:
+            raise ValueError('End page must not be before start page')
+        if buf is None:
+            buf = bytearray(pages * 4)
+        elif len(buf) < pages * 4:
+            raise ValueError('Buffer too small for page data')
+        mv = memoryview(buf)
+        params = bytearray(3)
+        params[0] = NTAG2XX_CMD_FAST_READ
+        page = start_page
+        while page <= end_page:
+            last = min(end_page, page + NTAG2XX_FAST_READ_MAX_PAGES - 1)
+            count = (last - page + 1) * 4
+            params[1] = page & 0xFF
+            params[2] = last & 0xFF
+            response = self.call_function(_COMMAND_INCOMMUNICATETHRU,
+                                          params=params,
+                                          response_length=count+1)
+            # First byte is the PN532 status, 0x00 on success.
+            if not response or response[0] != 0x00 or len(response) < count+1:
+                return None
+            offset = (page - start_page) * 4
+            mv[offset:offset+count] = response[1:count+1]
+            page = last + 1
+        return buf
+
+
+def authenticate_with_keyring(pn532, uid, keyring, block=4, reselect_timeout=100):
+    """
+    Tries the keys of a MifareKeyRing on a block, hinted key first.
+    Every failed AUTH deselects the card, so it is selected again with a short
+    InListPassiveTarget naming its UID before the next key: with a second card
+    in the field a plain one may select the other card. Gives up if the card is gone.
+    Returns:
+      index of the key that worked
+      or None   (no key worked or the card left the field)
+    """
+    card_class = pn532.card_class()
+    keyring.taps += 1
+    for attempt, index in enumerate(keyring.order(uid, card_class)):
+        if attempt and pn532.read_passive_target(timeout=reselect_timeout, uid=uid) != uid:
+            break
+        keyring.attempts += 1
+        if pn532.mifare_classic_authenticate_block(uid, block, MIFARE_CMD_AUTH_A, keyring.keys[index]):
+            keyring.remember(uid, card_class, index)
+            return index
+    keyring.failures += 1
+    keyring.forget(uid)
+    return None
+
+def read_card_code_from_block4(pn532, uid, key_a=b'\xFF\xFF\xFF\xFF\xFF\xFF', block=4, keyring=None):
     """
     Replicates the C++ read_card() behavior:
-      - AUTH_A on block 4 with FF FF FF FF FF FF
+      - AUTH_A on block 4 with FF FF FF FF FF FF (or with the keys of `keyring`)
       - read 16 bytes from block 4
       - return first 8 bytes packed into a 64-bit big-endian int
     Returns:
       int code  (matching your DB)
       or None   (if no auth/read)
     """
-    # PN532 MIFARE Classic auth wants a 4-byte UID slice. For 7-byte UIDs, use the last 4 bytes.
-    if len(uid) >= 4:
-        uid4 = uid[-4:]
-    else:
+    if len(uid) < 4:
         return None
 
     # Authenticate block 4 with Key A
-    # InDataExchange params: [Tg=0x01, MIFARE_CMD_AUTH_A, block, key[6], uid[4]]
-    params = bytearray(3 + 6 + 4)
-    params[0] = 0x01
-    params[1] = MIFARE_CMD_AUTH_A
-    params[2] = block & 0xFF
-    params[3:9] = key_a
-    params[9:13] = uid4
-
-    resp = pn532.call_function(_COMMAND_INDATAEXCHANGE, params=params, response_length=1)
-    if not resp or resp[0] != 0x00:
+    if keyring is not None:
+        if authenticate_with_keyring(pn532, uid, keyring, block) is None:
+            return None  # auth failed
+    elif not pn532.mifare_classic_authenticate_block(uid, block, MIFARE_CMD_AUTH_A, key_a):
         return None  # auth failed
 
     data = pn532.mifare_classic_read_block(block)
@@ -412,4 +746,4 @@ def read_card_code_from_block4(pn532, uid, key_a=b'\xFF\xFF\xFF\xFF\xFF\xFF', bl
     for i in range(8):
         code = (code << 8) | (data[i] & 0xFF)
 
-    return code
\ No newline at end of file
+    return code
@@ -0,0 +1,376 @@
+import time
+import struct
+from array import array
+import logger
+
+log = logger.get('access')
+
+# Decisions, compare with `is`
+GRANTED = 'granted'
+UNKNOWN = 'unknown_card'
+SCHEDULE = 'outside_schedule'
+DOOR = 'door_not_allowed'
+
+DAYS = ('mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun')
+CARDS_MAGIC = b'ACR1'
+MAX_DOORS = 16
+NO_GROUP = 255
+MAX_CARDS = 65535  # positions in the bucket index are 16-bit
+BUCKETS = 512      # UID length (4 or 7) and first byte
+
+def parse_uid(text):
+    """'86-225-141-90' (decimal, as in WHITELIST and uid_dec) -> bytes."""
+    return bytes(int(b) for b in text.split('-'))
+
+def uid_key(uid):
+    """
+    Packs a 4 or 7-byte UID with its length into four 16-bit words, compared
+    in this order. Returns None for other lengths (10-byte UIDs).
+    """
+    n = len(uid)
+    if n == 4:
+        return (0x400 | uid[0], uid[1] << 8 | uid[2], uid[3] << 8, 0)
+    if n == 7:
+        return (0x700 | uid[0], uid[1] << 8 | uid[2], uid[3] << 8 | uid[4], uid[5] << 8 | uid[6])
+    return None
+
+def _bucket(k0):
+    return (k0 >> 8 == 7) << 8 | (k0 & 0xFF)
+
+def _days(spec):
+    """'mon-fri', 'sat,sun', 'wed' -> list of day numbers, Monday = 0."""
+    days = []
+    for part in spec.lower().split(','):
+        if '-' in part:
+            first, last = part.split('-')
+            a, b = DAYS.index(first.strip()), DAYS.index(last.strip())
+            days.extend((a + i) % 7 for i in range((b - a) % 7 + 1))
+        else:
+            days.append(DAYS.index(part.strip()))
+    return days
+
+def _minutes(hhmm):
+    h, m = hhmm.split(':')
+    return int(h) * 60 + int(m)
+
+def compile_schedule(windows, slot_min):
+    """
+    [["mon-fri", "08:00", "18:00"], ...] -> bitmap with one bit per slot of
+    the week. A slot is allowed when its start lies in a window. A window
+    ending before it starts (22:00-06:00) runs over midnight.
+    """
+    per_day = 1440 // slot_min
+    bitmap = bytearray((7 * per_day + 7) // 8)
+    for days, start, end in windows:
+        start, end = _minutes(start), _minutes(end)
+        if end <= start:
+            end += 1440
+        for day in _days(days):
+            first = day * per_day + (start + slot_min - 1) // slot_min
+            for slot in range(first, day * per_day + (end + slot_min - 1) // slot_min):
+                slot %= 7 * per_day
+                bitmap[slot >> 3] |= 1 << (slot & 7)
+    return bitmap
+
+class AccessRules:
+    """
+    Offline access decisions from compiled tables. A policy (schedules, groups
+    with their schedule and doors) is compiled into one bitmap of allowed
+    week slots per group and one door mask per group. Cards are kept as a
+    sorted table of packed UIDs (8 bytes each) plus one group byte, so 10k
+    cards take ~90 KB instead of the ~450 KB of a dict of bytes. A bucket
+    index on the UID length and first byte narrows the table to ~20 cards,
+    so a decision is a short binary search and two bit tests, without
+    allocating.
+    """
+    def __init__(self, doors, tz_offset_min=0):
+        """
+        :param doors: Names of the readers (NFC_READERS names), as used in the group door lists.
+        :param tz_offset_min: Local time minus RTC time (UTC), for the schedules.
+        """
+        self.doors = {name: i for i, name in enumerate(doors[:MAX_DOORS])}
+        self.tz_offset_s = tz_offset_min * 60
+        self.active = False     # a policy was loaded, otherwise main keeps the old behaviour
+        self.policy = None      # as received, stored by save()
+        self.slot_min = 30
+        self.slot_bytes = 0
+        self.groups = []        # group names, index = group number
+        self.slots = bytearray()
+        self.door_masks = array('H')
+        self.always = bytearray()  # 1 if the group schedule covers the whole week
+        self.keys = array('H')  # 4 words per card, sorted
+        self.card_groups = bytearray()
+        self.count = 0
+        self.index = array('H', bytearray(2 * (BUCKETS + 1)))  # first card of each bucket, narrows the search
+        self._slot = 0
+        self._slot_until = None  # ticks_ms the cached slot ends
+        self.decisions = 0
+        self.denied = 0
+
+    @classmethod
+    def from_config(cls, config, doors):
+        rules = cls(doors, config.get('ACCESS_TZ_OFFSET_MIN', 0))
+        rules.load(config.get('ACCESS_POLICY_FILE', 'access.json'), config.get('ACCESS_CARDS_FILE', 'access_cards.bin'))
+        return rules
+
+    # --- Policy ---
+    def set_policy(self, policy):
+        """
+        Compiles {"slot_min": 30, "schedules": {name: windows}, "groups":
+        {name: {"schedule": name, "doors": [reader names]}}}. A group without
+        schedule is allowed all week, without doors at every door. Cards of
+        groups that no longer exist are dropped.
+        """
+        slot_min = policy.get('slot_min', 30)
+        if 1440 % slot_min:
+            raise ValueError('slot_min must divide a day')
+        schedules = {name: compile_schedule(windows, slot_min) for name, windows in policy.get('schedules', {}).items()}
+        names = sorted(policy.get('groups', {}))
+        if len(names) >= NO_GROUP:
+            raise ValueError('at most %d groups' % (NO_GROUP - 1))
+        slot_bytes = (7 * 1440 // slot_min + 7) // 8
+        slots = bytearray(slot_bytes * len(names))
+        door_masks = array('H', bytearray(2 * len(names)))  # a bytearray is copied as raw bytes
+        always = bytearray(len(names))
+        for g, name in enumerate(names):
+            group = policy['groups'][name]
+            bitmap = schedules[group['schedule']] if group.get('schedule') else None
+            if bitmap is None:
+                bitmap = bytearray(b'\xff' * slot_bytes)
+            slots[g * slot_bytes:(g + 1) * slot_bytes] = bitmap
+            always[g] = all(bitmap[s >> 3] >> (s & 7) & 1 for s in range(7 * 1440 // slot_min))
+            mask = 0
+            for door in group.get('doors') or self.doors:
+                if door in self.doors:
+                    mask |= 1 << self.doors[door]
+                else:
+                    log.warning("Group %s: unknown door %s", name, door)
+            door_masks[g] = mask
+        self._remap(names)
+        self.slot_min, self.slot_bytes, self.groups = slot_min, slot_bytes, names
+        self.slots, self.door_masks, self.always = slots, door_masks, always
+        self._slot_until = None
+        self.policy = policy
+        self.active = True
+
+    def _remap(self, names):
+        """Renumbers the cards for a new group list, dropping the cards of removed groups."""
+        if names == self.groups or not self.count:
+            return
+        new = bytearray(b'\xff' * 256)  # old -> new group number, NO_GROUP if removed
+        for g, name in enumerate(self.groups):
+            if name in names:
+                new[g] = names.index(name)
+        for i in range(self.count):
+            self.card_groups[i] = new[self.card_groups[i]]
+        self._compact()
+
+    # --- Cards ---
+    def add_cards(self, cards):
+        """Adds or moves cards: {group: [uid strings]}. Merged into the sorted table, send big lists in batches."""
+        latest = {}  # a UID listed twice ends up in the last group given
+        skipped = 0
+        for name, uids in cards.items():
+            if name not in self.groups:
+                raise ValueError('unknown group ' + name)
+            g = self.groups.index(name)
+            for text in uids:
+                key = uid_key(parse_uid(text))
+                if key is None:
+                    skipped += 1
+                else:
+                    latest[key] = g
+        self._merge(sorted(key + (g,) for key, g in latest.items()))
+        return skipped
+
+    def remove_cards(self, uids):
+        """Removes cards by uid string. Returns how many were found."""
+        found = 0
+        for text in uids:
+            key = uid_key(parse_uid(text))
+            i = self._find(*key) if key else -1
+            if i >= 0:
+                self.card_groups[i] = NO_GROUP
+                found += 1
+        self._compact()
+        return found
+
+    def clear_cards(self):
+        self._set_cards(array('H'), bytearray())
+
+    def _set_cards(self, keys, card_groups):
+        if len(card_groups) > MAX_CARDS:
+            raise ValueError('at most %d cards' % MAX_CARDS)
+        self.keys, self.card_groups, self.count = keys, card_groups, len(card_groups)
+        index = self.index
+        bucket = 0
+        for i in range(self.count):
+            b = _bucket(keys[4 * i])
+            while bucket <= b:
+                index[bucket] = i
+                bucket += 1
+        while bucket <= BUCKETS:
+            index[bucket] = self.count
+            bucket += 1
+
+    def _merge(self, batch):
+        """Merges sorted (k0, k1, k2, k3, group) tuples into the table, a batch entry replaces the same UID."""
+        keys, groups, n = self.keys, self.card_groups, self.count
+        out_keys = array('H')
+        out_groups = bytearray()
+        i = j = 0
+        while i < n or j < len(batch):
+            if j < len(batch):
+                entry = batch[j]
+                if i < n:
+                    k = 4 * i
+                    c = keys[k] - entry[0] or keys[k + 1] - entry[1] or keys[k + 2] - entry[2] or keys[k + 3] - entry[3]
+                else:
+                    c = 1
+                if c >= 0:
+                    for word in entry[:4]:
+                        out_keys.append(word)  # MicroPython extends arrays from buffers only
+                    out_groups.append(entry[4])
+                    j += 1
+                    if c == 0:
+                        i += 1
+                    continue
+            out_keys.extend(keys[4 * i:4 * i + 4])
+            out_groups.append(groups[i])
+            i += 1
+        self._set_cards(out_keys, out_groups)
+
+    def _compact(self):
+        keep = [i for i in range(self.count) if self.card_groups[i] != NO_GROUP]
+        if len(keep) == self.count:
+            return
+        keys = array('H')
+        for i in keep:
+            keys.extend(self.keys[4 * i:4 * i + 4])
+        self._set_cards(keys, bytearray(self.card_groups[i] for i in keep))
+
+    def _find(self, k0, k1, k2, k3):
+        keys = self.keys
+        b = (k0 >> 8 == 7) << 8 | (k0 & 0xFF)  # _bucket(), inlined
+        lo, hi = self.index[b], self.index[b + 1]
+        while lo < hi:
+            mid = (lo + hi) >> 1
+            i = mid << 2
+            c = keys[i] - k0 or keys[i + 1] - k1 or keys[i + 2] - k2 or keys[i + 3] - k3
+            if c < 0:
+                lo = mid + 1
+            elif c > 0:
+                hi = mid
+            else:
+                return mid
+        return -1
+
+    def group_of(self, uid):
+        """Group number of a card (bytes UID), -1 if unknown."""
+        n = len(uid)
+        if n == 4:
+            i = self._find(0x400 | uid[0], uid[1] << 8 | uid[2], uid[3] << 8, 0)
+        elif n == 7:
+            i = self._find(0x700 | uid[0], uid[1] << 8 | uid[2], uid[3] << 8 | uid[4], uid[5] << 8 | uid[6])
+        else:
+            return -1
+        return self.card_groups[i] if i >= 0 else -1
+
+    # --- Decisions ---
+    def slot(self):
+        """Slot of the week now (local time), cached until the slot ends."""
+        now = time.ticks_ms()
+        if self._slot_until is None or time.ticks_diff(now, self._slot_until) >= 0:
+            t = time.localtime(time.time() + self.tz_offset_s)
+            seconds = t[3] * 3600 + t[4] * 60 + t[5]
+            slot_s = self.slot_min * 60
+            self._slot = t[6] * (1440 // self.slot_min) + seconds // slot_s
+            self._slot_until = time.ticks_add(now, (slot_s - seconds % slot_s) * 1000)
+        return self._slot
+
+    def decide(self, uid, door, slot):
+        """
+        Decision for a card (bytes UID) at a door (reader name) in a week
+        slot, None when the time is not known (only the groups allowed all
+        week pass). Returns GRANTED or the reason of the denial.
+        """
+        self.decisions += 1
+        g = self.group_of(uid)
+        if g < 0:
+            reason = UNKNOWN
+        elif not self.door_masks[g] >> self.doors.get(door, MAX_DOORS) & 1:
+            reason = DOOR
+        elif slot is None and not self.always[g]:
+            reason = SCHEDULE
+        elif slot is not None and not self.slots[g * self.slot_bytes + (slot >> 3)] >> (slot & 7) & 1:
+            reason = SCHEDULE
+        else:
+            return GRANTED
+        self.denied += 1
+        return reason
+
+    # --- Storage ---
+    def load(self, policy_file, cards_file):
+        """
+        Loads the stored policy (JSON) and card table (binary). A missing or
+        unreadable policy leaves the rules inactive; a missing or unreadable
+        card table leaves the policy without cards, so only the whitelist opens.
+        """
+        import ujson
+        try:
+            with open(policy_file) as f:
+                self.set_policy(ujson.load(f))
+        except OSError:
+            return False
+        except Exception as e:  # torn or hand-edited file: boot without the rules rather than not at all
+            log.error("Access policy %s unusable, rules inactive: %s", policy_file, e)
+            return False
+        try:
+            with open(cards_file, 'rb') as f:
+                head = f.read(9)
+                if len(head) != 9 or head[:4] != CARDS_MAGIC:
+                    raise ValueError('not a card table')
+                magic, count, n_groups = struct.unpack('<4sIB', head)
+                if count > MAX_CARDS:
+                    raise ValueError('%d cards' % count)
+                stored = [f.read(f.read(1)[0]).decode() for _ in range(n_groups)]
+                keys = array('H', bytearray(8 * count))
+                card_groups = bytearray(count)
+                if f.readinto(keys) != 8 * count or f.readinto(card_groups) != count:
+                    raise ValueError('truncated card table')
+        except OSError:
+            return True  # policy without cards yet
+        except Exception as e:
+            log.error("Card table %s unusable, only the whitelist opens: %s", cards_file, e)
+            return True
+        self.groups, names = stored, self.groups
+        self._set_cards(keys, card_groups)
+        self._remap(names)  # the policy may have changed after the table was saved
+        self.groups = names
+        log.info("Access rules: %d groups, %d cards", len(self.groups), self.count)
+        return True
+
+    def save(self, policy_file, cards_file):
+        """
+        Stores the policy as received and the compiled card table. Each is
+        written to a .tmp file renamed over the old one, so a reset during
+        the write leaves the previous file, not a torn one.
+        """
+        import os
+        import ujson
+        with open(policy_file + '.tmp', 'w') as f:
+            ujson.dump(self.policy, f)
+        with open(cards_file + '.tmp', 'wb') as f:
+            f.write(struct.pack('<4sIB', CARDS_MAGIC, self.count, len(self.groups)))
+            for name in self.groups:
+                name = name.encode()
+                f.write(bytes([len(name)]) + name)
+            f.write(self.keys)
+            f.write(self.card_groups)
+        os.rename(cards_file + '.tmp', cards_file)
+        os.rename(policy_file + '.tmp', policy_file)
+
+    def stats(self):
+        return {'active': self.active, 'groups': len(self.groups), 'cards': self.count,
+                'table_bytes': len(self.keys) * 2 + len(self.card_groups) + len(self.slots),
+                'decisions': self.decisions, 'denied': self.denied}
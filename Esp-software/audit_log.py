@@ -0,0 +1,295 @@
+import os
+import struct
+import time
+import uasyncio as asyncio # type: ignore
+from array import array
+import logger
+from access_rules import GRANTED, UNKNOWN, SCHEDULE, DOOR
+from passback import PASSBACK, RATE
+
+log = logger.get('audit')
+
+# Verdicts and deciders stored as one byte, in this order (never reorder, the log outlives firmware updates)
+VERDICTS = (GRANTED, UNKNOWN, SCHEDULE, DOOR, PASSBACK, RATE, 'denied_online')
+SOURCES = ('local', 'online', 'cache', 'fallback')
+SYNCS = ('none', 'ok', 'stale')
+OTHER = 255
+
+RECORD = '<IB7sBBBB'  # unix s, uid length, uid, door, verdict, source, time sync
+RECORD_SIZE = 16
+BLOCK = 64            # records per index entry (1 KB of log)
+ENTRY_WORDS = 6       # index entry: min ts, max ts, 128-bit UID filter
+NO_TS = 0xFFFFFFFF
+
+def _codes(names):
+    return {name: n for n, name in enumerate(names)}
+
+def _uid_bits(uid, n):
+    """Two bit positions (0-127) of a UID in the block filter."""
+    h = 0x1505
+    for i in range(min(n, 7)):
+        h = ((h ^ uid[i]) * 403) & 0x1FFFFF
+    h ^= h >> 11
+    return h & 127, (h >> 7) & 127
+
+class AuditLog:
+    """
+    Append-only log of every access decision, denials included, on flash.
+    Records are 16 bytes (see RECORD) in segment files of `segment_records`
+    records; the oldest of `segments` files is deleted when a new one starts.
+    Each segment has an index file with one entry per BLOCK records: the
+    lowest and highest time and a 128-bit filter of the UIDs in the block,
+    so a query only reads the blocks that can match.
+    record() only packs into a RAM buffer; run() writes it every `flush_ms`,
+    a reset loses at most that much of the log. `count` is the number of
+    records of the current segment on flash, the buffered ones are added once written.
+    """
+    def __init__(self, doors, directory='audit', segment_records=4096, segments=8, flush_ms=1000):
+        """
+        :param doors: Reader names, stored as their index (one byte).
+        :param segment_records: Records per segment file, rounded up to a multiple of BLOCK.
+        :param segments: Segment files kept, the log holds segment_records * segments decisions at most.
+        """
+        self.doors = list(doors)
+        self._door_codes = _codes(self.doors)
+        self._verdict_codes = _codes(VERDICTS)
+        self._source_codes = _codes(SOURCES)
+        self._sync_codes = _codes(SYNCS)
+        self.directory = directory
+        self.segment_records = max(BLOCK, (segment_records + BLOCK - 1) // BLOCK * BLOCK)
+        self.max_segments = max(2, segments)
+        self.flush_ms = flush_ms
+        self._buf = bytearray(BLOCK * RECORD_SIZE)  # records not written yet, never more than the rest of a block
+        self._pending = 0
+        self._block = array('I', [NO_TS, 0, 0, 0, 0, 0])  # index entry of the block being written
+        self._file = None
+        self.querying = False
+        self.records = 0    # written since boot
+        self.errors = 0
+        try:
+            os.mkdir(directory)
+        except OSError:
+            pass  # already there
+        self.segments = sorted(int(name[:-4]) for name in os.listdir(directory) if name.endswith('.log'))
+        if not self.segments:
+            self.segments.append(0)
+        self._open(self.segments[-1])
+
+    @classmethod
+    def from_config(cls, config, doors):
+        return cls(doors, config.get('AUDIT_DIR', 'audit'), config.get('AUDIT_SEGMENT_RECORDS', 4096),
+                   config.get('AUDIT_SEGMENTS', 8), config.get('AUDIT_FLUSH_MS', 1000))
+
+    def _path(self, segment, ext):
+        return '%s/%08d.%s' % (self.directory, segment, ext)
+
+    def _open(self, segment):
+        """
+        Continues a segment: the last, partly written block is read back into
+        the block entry, and the index is rebuilt if a reset left it behind the log.
+        """
+        path = self._path(segment, 'log')
+        try:
+            size = os.stat(path)[6]
+        except OSError:
+            size = 0
+        self.count = size // RECORD_SIZE
+        if size % RECORD_SIZE or self.count >= self.segment_records:  # torn last record or full: next segment
+            self.segments.append(segment + 1)
+            return self._open(segment + 1)
+        try:
+            indexed = os.stat(self._path(segment, 'idx'))[6]
+        except OSError:
+            indexed = 0
+        full = self.count // BLOCK
+        if indexed != full * ENTRY_WORDS * 4:
+            log.warning("Rebuilding the index of audit segment %d.", segment)
+            with open(self._path(segment, 'idx'), 'wb') as idx:
+                for b in range(full):
+                    self._read_block(path, b * BLOCK, BLOCK)
+                    idx.write(self._block)
+        self._read_block(path, full * BLOCK, self.count % BLOCK)
+        self._file = open(path, 'ab')
+
+    def _read_block(self, path, first, n):
+        """Sets the block entry to the records first..first+n-1 of a segment file."""
+        self._block[0], self._block[1] = NO_TS, 0
+        for i in range(2, ENTRY_WORDS):
+            self._block[i] = 0
+        if not n:
+            return
+        with open(path, 'rb') as f:
+            f.seek(first * RECORD_SIZE)
+            data = f.read(n * RECORD_SIZE)
+        for i in range(n):
+            ts, length, uid = struct.unpack_from('<IB7s', data, i * RECORD_SIZE)
+            self._summarize(ts, uid, length)
+
+    def _summarize(self, ts, uid, n):
+        block = self._block
+        if ts < block[0]:
+            block[0] = ts
+        if ts > block[1]:
+            block[1] = ts
+        a, b = _uid_bits(uid, n)
+        block[2 + (a >> 5)] |= 1 << (a & 31)
+        block[2 + (b >> 5)] |= 1 << (b & 31)
+
+    def record(self, ts, uid, door, verdict, source, sync):
+        """Logs a decision: Unix time (s), UID bytes, reader name, verdict, who decided and the time sync quality."""
+        n = len(uid)
+        struct.pack_into(RECORD, self._buf, self._pending * RECORD_SIZE, ts, n, uid[:7], self._door_codes.get(door, OTHER),
+                         self._verdict_codes.get(verdict, OTHER), self._source_codes.get(source, OTHER),
+                         self._sync_codes.get(sync, OTHER))
+        self._summarize(ts, uid, n)
+        self._pending += 1
+        if (self.count + self._pending) % BLOCK == 0:
+            self.flush()  # the block is complete, its index entry goes out with it
+
+    def flush(self):
+        """Writes the buffered records, plus the index entry and the next segment once a block is complete."""
+        if not self._pending:
+            return
+        try:
+            if self._file is None:
+                self._reopen()  # after a failed write
+            self._file.write(memoryview(self._buf)[:self._pending * RECORD_SIZE]) # type: ignore
+            self._file.flush() # type: ignore
+            self.count += self._pending
+            self.records += self._pending
+            self._pending = 0
+            if self.count % BLOCK == 0:
+                with open(self._path(self.segments[-1], 'idx'), 'ab') as f:
+                    f.write(self._block)
+                self._read_block(None, 0, 0)  # next block, empty
+                if self.count >= self.segment_records:
+                    self._rotate()
+        except OSError as e:
+            self.errors += 1
+            self._pending = 0  # the flash is full or gone, dropping beats growing the buffer
+            log.error("Could not write the audit log: %s", e)
+            if self._file:
+                try:
+                    self._file.close()
+                except OSError:
+                    pass
+                self._file = None  # part of the records may be on flash, the next flush reopens
+
+    def _reopen(self):
+        """
+        Count, block entry and index follow the segment file again, as after a
+        reset, then the records buffered since are added back to the block entry.
+        """
+        self._open(self.segments[-1])
+        for i in range(self._pending):
+            ts, n, uid = struct.unpack_from('<IB7s', self._buf, i * RECORD_SIZE)
+            self._summarize(ts, uid, n)
+
+    def _rotate(self):
+        self._file.close() # type: ignore
+        self.segments.append(self.segments[-1] + 1)
+        while len(self.segments) > self.max_segments:
+            oldest = self.segments.pop(0)
+            for ext in ('log', 'idx'):
+                try:
+                    os.remove(self._path(oldest, ext))
+                except OSError:
+                    pass
+        self.count = 0
+        self._file = open(self._path(self.segments[-1], 'log'), 'ab')
+
+    async def run(self):
+        while True:
+            await asyncio.sleep_ms(self.flush_ms)
+            self.flush()
+
+    def close(self):
+        self.flush()
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def _decode(self, record):
+        ts, n, uid, door, verdict, source, sync = record
+        return [ts, '-'.join(str(b) for b in uid[:min(n, 7)]),
+                self.doors[door] if door < len(self.doors) else None,
+                VERDICTS[verdict] if verdict < len(VERDICTS) else None,
+                SOURCES[source] if source < len(SOURCES) else None,
+                SYNCS[sync] if sync < len(SYNCS) else None]
+
+    async def query(self, since, until, uid, send, chunk=32, limit=1000):
+        """
+        Streams the decisions of times since..until (Unix s, inclusive) and,
+        if given, of one card (UID bytes), oldest first: send(part, records)
+        is called with up to `chunk` records [ts, uid_dec, door, verdict,
+        source, time_sync] and may return False to stop. Yields to the other
+        tasks after every block read. Returns a summary.
+        """
+        self.flush()
+        self.querying = True
+        start = time.ticks_ms()
+        bits = key = None
+        if uid is not None:
+            bits = _uid_bits(uid, len(uid))
+            key = bytes([len(uid)]) + uid[:7] + bytes(7 - min(len(uid), 7))  # as packed by record()
+        buf = bytearray(BLOCK * RECORD_SIZE)
+        view = memoryview(buf)
+        found = []
+        matched = blocks = skipped = part = 0
+        stopped = False
+        try:
+            for segment in list(self.segments):
+                try:
+                    with open(self._path(segment, 'idx'), 'rb') as f:
+                        index = array('I', bytearray(f.read()))
+                except OSError:
+                    index = array('I')
+                try:
+                    f = open(self._path(segment, 'log'), 'rb')
+                except OSError:
+                    continue  # rotated away during the query
+                with f:
+                    b = 0
+                    while True:
+                        if b * ENTRY_WORDS < len(index):
+                            e = b * ENTRY_WORDS
+                            if index[e] > until or index[e + 1] < since or (bits is not None and not (
+                                    index[e + 2 + (bits[0] >> 5)] >> (bits[0] & 31) & 1 and
+                                    index[e + 2 + (bits[1] >> 5)] >> (bits[1] & 31) & 1)):
+                                skipped += 1
+                                b += 1
+                                continue
+                        f.seek(b * BLOCK * RECORD_SIZE)
+                        size = f.readinto(view)  # past the index: the tail of the segment, read whatever it holds
+                        if not size:
+                            break
+                        blocks += 1
+                        for i in range(0, size - RECORD_SIZE + 1, RECORD_SIZE):
+                            ts = struct.unpack_from('<I', buf, i)[0]
+                            if ts < since or ts > until or (key is not None and buf[i + 4:i + 12] != key):
+                                continue
+                            found.append(self._decode(struct.unpack_from(RECORD, buf, i)))
+                            matched += 1
+                            if len(found) >= chunk or matched >= limit:
+                                part += 1
+                                stopped = send(part, found) is False or matched >= limit
+                                found = []
+                                if stopped:
+                                    break
+                        if stopped:
+                            break
+                        b += 1
+                        await asyncio.sleep_ms(0)
+                if stopped:
+                    break
+            if found:
+                part += 1
+                send(part, found)
+        finally:
+            self.querying = False
+        return {'matched': matched, 'parts': part, 'blocks_read': blocks, 'blocks_skipped': skipped,
+                'truncated': matched >= limit, 'ms': time.ticks_diff(time.ticks_ms(), start)}
+
+    def stats(self):
+        return {'segments': len(self.segments), 'records': (len(self.segments) - 1) * self.segment_records + self.count + self._pending,
+                'written': self.records, 'errors': self.errors}
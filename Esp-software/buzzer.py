@@ -1,19 +1,37 @@
+import time
 from machine import Pin, PWM # type: ignore
 import uasyncio as asyncio # type: ignore
 
+PAUSE_MS = 10  # Silence between two tones
+PREEMPT_CHECK_MS = 10  # A tone is slept in slices of this, a preempting melody starts within one
+
+def compile_melody(melody, volume, pause_ms=PAUSE_MS):
+    """Turns [[frequency, duration_ms], ...] into a (frequency, duty, ms) schedule."""
+    schedule = []
+    for frequency, duration in melody:
+        schedule.append((frequency, volume, duration))
+        schedule.append((frequency, 0, pause_ms)) # Pause between tones
+    return tuple(schedule)
+
 class BuzzerController:
-    """Controls a buzzer connected to a specific pin to make approval/denial sounds (asynchronously)."""
+    """
+    Controls a buzzer connected to a specific pin to make approval/denial sounds (asynchronously).
+    A single long-lived task (run) owns the PWM and plays precompiled melody
+    schedules from a small queue. A melody with a higher priority than the one
+    playing preempts it, others wait in the queue.
+    """
 
     def __init__(self, pin_number,
                  aproval_melody=[
-                    [659, 100],  
-                    [698, 100],  
+                    [659, 100],
+                    [698, 100],
                     [784, 100]
                 ],
                  denial_melody=[
-                    [523, 200],  
+                    [523, 200],
                     [440, 200]
-                ],):
+                ],
+                 queue_size=2):
         self.buzzer_pin = Pin(pin_number, Pin.OUT)  # Set the buzzer pin to output mode.
         self.pwm = PWM(self.buzzer_pin, freq=1000, duty=0)  # Initialize PWM on the buzzer pin (1kHz, initially off).
         self.volume = 512  # Volume of the buzzer (0-1023). Adjust to your needs
@@ -21,28 +39,109 @@ class BuzzerController:
         self.aproval_melody = aproval_melody
         self.denial_melody = denial_melody
 
-    async def play_tone(self, frequency, duration_ms, volume):
-        """Plays a tone at a specified frequency for a given duration and volume (asynchronously)."""
-        self.pwm.freq(frequency)  # Set frequency
-        self.pwm.duty(volume)  # Set duty cycle (volume)
-        await asyncio.sleep_ms(duration_ms)  # Asynchronous sleep
-        self.pwm.duty(0)  # Turn off the buzzer
-
-    async def play_melody(self, melody):
-        """Plays the approval melody (asynchronously)."""
-        for frequency, duration in melody:
-            await self.play_tone(frequency, duration, self.volume)
-            await self.play_tone(211, 10, 0) # Pause between tones
-
-    async def play_approval(self):
-        for frequency, duration in self.aproval_melody:
-            await self.play_tone(frequency, duration, self.volume)
-            await self.play_tone(211, 10, 0) # Pause between tones
-
-    async def play_denial(self):
-        for frequency, duration in self.denial_melody:
-            await self.play_tone(frequency, duration, self.volume)
-            await self.play_tone(211, 10, 0) # Pause between tones
+        # name -> (priority, schedule)
+        self.melodies = {}
+        self.register_melody('approval', aproval_melody, 1)
+        self.register_melody('denial', denial_melody, 2)
+
+        self.queue_size = queue_size
+        self._queue = []  # [name, priority, schedule] waiting to be played
+        self._current = None  # [name, priority, schedule] playing
+        self._step = 0
+        self._wake = asyncio.Event()
+        self.running = False
+
+        # Statistics
+        self.played = 0
+        self.preempted = 0
+        self.coalesced = 0
+        self.dropped = 0
+
+    def register_melody(self, name, melody, priority=1):
+        """Precompiles a melody so play(name) only has to queue it."""
+        self.melodies[name] = (priority, compile_melody(melody, self.volume))
+
+    def play(self, name, priority=None):
+        """
+        Queues a registered melody. It preempts the playing melody if its priority
+        is higher, otherwise it waits. A melody already waiting is not queued twice,
+        and when the queue is full the new request is dropped.
+        """
+        default_priority, schedule = self.melodies[name]
+        self._submit(name, default_priority if priority is None else priority, schedule)
+
+    def play_melody(self, melody, priority=1):
+        """Queues an ad-hoc [[frequency, duration_ms], ...] melody."""
+        self._submit(None, priority, compile_melody(melody, self.volume))
+
+    def play_approval(self):
+        self.play('approval')
+
+    def play_denial(self):
+        self.play('denial')
+
+    def _submit(self, name, priority, schedule):
+        current = self._current
+        if current is None:
+            self._current, self._step = [name, priority, schedule], 0
+            self._wake.set()
+        elif priority > current[1]:
+            self._current, self._step = [name, priority, schedule], 0
+            self.preempted += 1
+            self._wake.set() # The running tone stops at its next PREEMPT_CHECK_MS slice
+        elif name is not None and any(q[0] == name for q in self._queue):
+            self.coalesced += 1 # Same melody is already waiting
+        elif len(self._queue) < self.queue_size:
+            self._queue.append([name, priority, schedule])
+            self._queue.sort(key=lambda q: -q[1])
+        else:
+            self.dropped += 1
+
+    def busy(self):
+        return self._current is not None
+
+    def stats(self):
+        return {'played': self.played, 'preempted': self.preempted, 'coalesced': self.coalesced,
+                'dropped': self.dropped, 'queued': len(self._queue)}
+
+    async def run(self):
+        """The buzzer task, start it once with asyncio.create_task()."""
+        self.running = True
+        while self.running:
+            current = self._current
+            if current is None:
+                self.pwm.duty(0)
+                if self._queue:
+                    self._current, self._step = self._queue.pop(0), 0
+                    continue
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+            frequency, duty, duration = current[2][self._step]
+            if duty:
+                self.pwm.freq(frequency)  # Set frequency
+            self.pwm.duty(duty)  # Set duty cycle (volume)
+            # Plain sleeps: wait_for_ms() would promote a wait to a new task on every step
+            end = time.ticks_add(time.ticks_ms(), duration)
+            while self._current is current:
+                left = time.ticks_diff(end, time.ticks_ms())
+                if left <= 0:
+                    break
+                await asyncio.sleep_ms(min(left, PREEMPT_CHECK_MS))
+            if self._current is not current:
+                continue # Preempted, start the new melody right away
+            self._step += 1
+            if self._step >= len(current[2]):
+                self._current = None
+                self.played += 1
+        self.pwm.duty(0)
+
+    def stop(self):
+        """Silences the buzzer and drops everything queued."""
+        self._queue.clear()
+        self._current = None
+        self._wake.set()
+        self.off()
 
     def off(self):
         self.pwm.duty(0)
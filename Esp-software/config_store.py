@@ -0,0 +1,56 @@
+import sys
+import ujson
+from binascii import crc32
+import logger
+
+log = logger.get('config')
+
+SNAPSHOT_FORMAT = 1
+SNAPSHOT_MODULE = 'config_snapshot'
+
+def checksum(data):
+    return crc32(data) & 0xFFFFFFFF
+
+def load(config_file='config.json', defaults=None):
+    """
+    Loads the config, merged with `defaults`. Returns (config, source), source
+    being 'snapshot', 'json' or 'defaults' (no config file).
+    The snapshot is config_snapshot.mpy, built with the firmware by
+    extras/build_mpy.py: the config already merged with the defaults and
+    checked, so the boot neither parses JSON nor compiles anything for it. It
+    records the CRC of the config.json it was built from; once the file is
+    changed (e.g. by a config update over MQTT) the snapshot is deleted and
+    the config is parsed from JSON again.
+    """
+    try:
+        with open(config_file, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return dict(defaults or {}), 'defaults'
+    config = _from_snapshot(checksum(data))
+    if config is not None:
+        return config, 'snapshot'
+    config = dict(defaults or {})
+    config.update(ujson.loads(data))
+    return config, 'json'
+
+def _from_snapshot(crc):
+    try:
+        snapshot = __import__(SNAPSHOT_MODULE)
+    except ImportError:
+        return None
+    sys.modules.pop(SNAPSHOT_MODULE, None)  # only the dict is kept
+    if getattr(snapshot, 'FORMAT', None) == SNAPSHOT_FORMAT and getattr(snapshot, 'SOURCE_CRC', None) == crc:
+        return snapshot.CONFIG
+    log.warning("Config snapshot is out of date, removing it.")
+    invalidate()
+    return None
+
+def invalidate():
+    """Deletes the snapshot, e.g. once config.json has been rewritten."""
+    import os
+    for name in (SNAPSHOT_MODULE + '.mpy', SNAPSHOT_MODULE + '.py'):
+        try:
+            os.remove(name)
+        except OSError:
+            pass
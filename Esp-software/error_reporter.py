@@ -0,0 +1,145 @@
+import time
+import uasyncio as asyncio # type: ignore
+import logger
+
+log = logger.get('errors')
+
+# Entry fields
+_TOTAL = 0     # occurrences since boot
+_PENDING = 1   # occurrences not published yet
+_FIRST = 2     # time.time() of the first occurrence
+_LAST = 3      # time.time() of the last occurrence
+_ERROR = 4     # last exception (or message), formatted only when published
+_NOTIFIED = 5  # published in the current window, repeats wait for the summary
+
+class ErrorReporter:
+    """
+    Coalesces repeated errors before they reach the broker. Errors are keyed by
+    site (where it happened), source (reader name...) and exception type. The
+    first occurrence of a key is published right away, repeats are only counted
+    and go out in a summary every `interval` seconds with count and first/last
+    time. A token bucket per source caps the immediate messages, whatever does
+    not fit waits for the summary. A key that stays quiet for a whole window is
+    reported immediately again the next time.
+    Reporting a repeat only updates an existing entry, it allocates nothing.
+    """
+    def __init__(self, publish, interval=60, burst=5, rate=6, max_entries=32):
+        """
+        :param publish: Called with a dict for every message to send.
+        :param interval: Seconds between summaries.
+        :param burst: Immediate messages a source may send in a row.
+        :param rate: Immediate messages per minute a source earns back.
+        :param max_entries: Distinct keys tracked, further keys are only counted in `overflow`.
+        """
+        self.publish = publish
+        self.interval = interval
+        self.burst = burst
+        self.rate = rate
+        self.max_entries = max_entries
+        self._sites = {}    # site -> {source -> {type -> entry}}
+        self._buckets = {}  # source -> [milli-tokens, ticks_ms of the last refill]
+        self.entries = 0
+        self.overflow = 0
+        self.reported = 0
+        self.published = 0
+        self.running = False
+
+    @classmethod
+    def from_config(cls, publish, config):
+        return cls(publish, config.get('ERROR_SUMMARY_INTERVAL', 60), config.get('ERROR_BURST', 5),
+                   config.get('ERROR_RATE', 6))
+
+    def report(self, site, error, source=None):
+        """Records an error. `site` should be a constant string, `error` an exception or a message."""
+        self.reported += 1
+        kind = type(error)
+        by_source = self._sites.get(site)
+        entries = by_source.get(source) if by_source is not None else None
+        entry = entries.get(kind) if entries is not None else None
+        if entry is None:
+            entry = self._new_entry(site, source, kind)
+            if entry is None:
+                self.overflow += 1
+                return
+        now = time.time()
+        entry[_TOTAL] += 1
+        entry[_LAST] = now
+        entry[_ERROR] = error
+        if not entry[_NOTIFIED] and not entry[_PENDING] and self._take_token(source):
+            entry[_NOTIFIED] = True
+            log.error("%s (%s): %s", site, source, error)
+            self._send({'kind': 'error', 'site': site, 'source': source, 'error': kind.__name__,
+                        'message': str(error), 'count': 1, 'total': entry[_TOTAL], 'first': now, 'last': now})
+            return
+        if not entry[_PENDING]:
+            entry[_FIRST] = now
+        entry[_PENDING] += 1
+
+    def _new_entry(self, site, source, kind):
+        if self.entries >= self.max_entries:
+            return None
+        self.entries += 1
+        by_source = self._sites.setdefault(site, {})
+        entry = [0, 0, 0, 0, None, False]
+        by_source.setdefault(source, {})[kind] = entry
+        return entry
+
+    def _take_token(self, source):
+        now = time.ticks_ms()
+        bucket = self._buckets.get(source)
+        if bucket is None:
+            bucket = self._buckets[source] = [self.burst * 1000, now]
+        else:
+            # rate tokens per minute = rate milli-tokens per 60 ms
+            earned = time.ticks_diff(now, bucket[1]) * self.rate // 60
+            if earned:
+                bucket[0] = min(self.burst * 1000, bucket[0] + earned)
+                bucket[1] = now
+        if bucket[0] < 1000:
+            return False
+        bucket[0] -= 1000
+        return True
+
+    def _send(self, data):
+        self.published += 1
+        try:
+            self.publish(data)
+        except Exception as e:
+            log.error("Error publish failed: %s", e)
+
+    def summary(self):
+        """Collects the pending repeats of every key and starts a new window. Returns a list of dicts."""
+        items = []
+        for site, by_source in self._sites.items():
+            for source, entries in by_source.items():
+                for kind, entry in entries.items():
+                    if entry[_PENDING]:
+                        items.append({'site': site, 'source': source, 'error': kind.__name__,
+                                      'message': str(entry[_ERROR]), 'count': entry[_PENDING],
+                                      'total': entry[_TOTAL], 'first': entry[_FIRST], 'last': entry[_LAST]})
+                        entry[_PENDING] = 0
+                        entry[_NOTIFIED] = True
+                    else:
+                        entry[_NOTIFIED] = False  # quiet for a whole window
+        return items
+
+    def flush(self):
+        """Publishes the summary of the current window, if anything repeated."""
+        items = self.summary()
+        if items or self.overflow:
+            log.warning("%d repeating errors summarized, %d not tracked", len(items), self.overflow)
+            self._send({'kind': 'summary', 'interval': self.interval, 'errors': items, 'overflow': self.overflow})
+            self.overflow = 0
+
+    def stats(self):
+        return {'reported': self.reported, 'published': self.published, 'entries': self.entries}
+
+    async def run(self):
+        """Publishes a summary every interval, start it with asyncio.create_task()."""
+        self.running = True
+        while self.running:
+            await asyncio.sleep(self.interval)
+            self.flush()
+
+    def stop(self):
+        self.running = False
@@ -0,0 +1,97 @@
+import os
+import logger
+
+log = logger.get('events')
+
+def _extend(ranges, seq):
+    """Adds seq to a list of [from, to] ranges built in increasing order."""
+    if ranges and ranges[-1][1] == seq - 1:
+        ranges[-1][1] = seq
+    else:
+        ranges.append([seq, seq])
+
+class EventHistory:
+    """
+    Numbers the read events and keeps the last `size` of them, so the backend
+    can detect a gap in the sequence and ask for just the missing events. The
+    sequence never goes back, also across resets: blocks of `block` numbers
+    are reserved in `seq_file`, one flash write per block, and a reset skips
+    the rest of the current block (reported as unavailable when asked for).
+    """
+    def __init__(self, size=100, seq_file='event_seq', block=1000):
+        self.size = size
+        self.seq_file = seq_file
+        self.block = block
+        self._events = [None] * size  # payload of seq at seq % size
+        self.seq = self._read_reserved()  # last number used
+        self.first = self.seq + 1         # first number of this boot
+        self.reserved = self.seq
+        self.retransmitted = 0
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config.get('EVENT_HISTORY_SIZE', 100), config.get('EVENT_SEQ_FILE', 'event_seq'),
+                   config.get('EVENT_SEQ_BLOCK', 1000))
+
+    def _read_reserved(self):
+        try:
+            with open(self.seq_file) as f:
+                return int(f.read())
+        except (OSError, ValueError):
+            return 0
+
+    def _reserve(self):
+        """Reserves the next block. Written beside the file and renamed over it: a reset mid-write keeps the old block end."""
+        self.reserved = self.seq + self.block
+        try:
+            with open(self.seq_file + '.tmp', 'w') as f:
+                f.write(str(self.reserved))
+            os.rename(self.seq_file + '.tmp', self.seq_file)
+        except OSError as e:
+            log.error("Could not reserve event numbers: %s", e)
+
+    def next_seq(self):
+        """Number of the next event."""
+        self.seq += 1
+        if self.seq > self.reserved:
+            self._reserve()
+        return self.seq
+
+    def add(self, seq, payload):
+        """Keeps an event (its published form) under its number."""
+        self._events[seq % self.size] = payload
+
+    def oldest(self):
+        """Lowest number still held."""
+        return max(self.first, self.seq - self.size + 1)
+
+    def get(self, seq):
+        """Payload of an event, None if it is no longer (or was never) held."""
+        if seq < self.oldest() or seq > self.seq:
+            return None
+        return self._events[seq % self.size]
+
+    def retransmit(self, first, last, publish):
+        """
+        Calls publish(payload) for the held events first..last. Returns
+        {"sent", "missing", "failed"} where "missing" lists the [from, to]
+        ranges that are not held any more (or were skipped by a reset), and
+        "failed" the held ones whose publish failed. Those can be asked for again.
+        """
+        last = min(last, self.seq)
+        sent = 0
+        missing = []
+        failed = []
+        for seq in range(first, last + 1):
+            payload = self.get(seq)
+            if payload is None:
+                _extend(missing, seq)
+            elif publish(payload):
+                sent += 1
+            else:
+                _extend(failed, seq)
+        self.retransmitted += sent
+        return {'sent': sent, 'missing': missing, 'failed': failed}
+
+    def stats(self):
+        return {'seq': self.seq, 'first': self.first, 'oldest': self.oldest(), 'retransmitted': self.retransmitted}
@@ -3,23 +3,47 @@ import time
 import neopixel
 import math  # We need this for the pulsing (sine wave) effect
 from machine import Pin
+import logger
+
+log = logger.get('LED')
+
+class Animation:
+    """A named sequence of precompiled frames played at a fixed frame interval."""
+    def __init__(self, name, frames, frame_ms=0, overlay=False, offset=0):
+        """
+        :param frames: List of frames (buffers in NeoPixel byte order).
+        :param frame_ms: Time each frame is shown, 0 for a still image.
+        :param overlay: Overlays are transient and drawn over the background animation.
+        :param offset: Frame the animation starts at.
+        """
+        self.name = name
+        self.frames = frames
+        self.frame_ms = frame_ms
+        self.overlay = overlay
+        self.offset = offset
+
+    def frame_at(self, elapsed_ms):
+        if self.frame_ms <= 0 or len(self.frames) == 1:
+            return self.frames[self.offset % len(self.frames)]
+        return self.frames[(elapsed_ms // self.frame_ms + self.offset) % len(self.frames)]
 
 class LedController:
     """
-    An asynchronous controller for a NeoPixel LED ring that plays animations
-    based on a shared state dictionary.
+    An asynchronous controller for a NeoPixel LED ring. A frame scheduler
+    composites two layers, a background status animation (loading, waiting)
+    and a transient overlay (success, failure), and only writes the ring when
+    the shown frame changed.
     """
     def __init__(self, pin_num, num_pixels, config):
         """
         Initializes the controller.
         :param pin_num: The GPIO pin number for the NeoPixel data line.
         :param num_pixels: The number of LEDs in the ring (e.g., 24).
-        :param shared_state: A dictionary shared with the main application
-                             to control which animation is playing.
-                             Expected keys: 'animation' (str), 'duration' (int/float).
+        :param config: The main application's configuration dictionary (colors, animation parameters).
         """
         self.np = neopixel.NeoPixel(Pin(pin_num), num_pixels)
         self.num_pixels = num_pixels
+        self.frame_ms = config.get('LED_FRAME_MS', 20)  # Scheduler tick
 
         # Define standard colors
         self.LIGHT_BLUE = config['LED_COLOR_LOADING']  # Color for loading animation
@@ -29,70 +53,149 @@ class LedController:
         self.BLACK = config['LED_COLOR_OFF']
         
         # State variables for animations
-        self.loading_pos = config['LED_LOADING_POS']  # Current position of the loading "spinner"
-        self.pulse_angle = config['LED_WAITING_PULSE_ANGLE']  # Current angle for pulsing effect
+        self.loading_pos = config['LED_LOADING_POS']  # Start position of the loading "spinner"
+        self.pulse_angle = config['LED_WAITING_PULSE_ANGLE']  # Start angle for pulsing effect
         self.pulse_speed = config['LED_WAITING_PULSE_SPEED']  # Speed of the pulsing effect
 
-        self.shared_state = {
-            'animation': 'loading', 
-            'duration': 0
-        }
+        self.animations = {}
+        self._compile_frames()
+
+        # Layers: background animation and the overlay shown on top of it until overlay_until
+        now = time.ticks_ms()
+        self.background = self.animations['loading']
+        self.background_started = now
+        self.overlay = None
+        self.overlay_started = now
+        self.overlay_until = now
+
+        self._shown = None  # frame currently on the ring, None if unknown
+        self.writes = 0
+        self.skipped_writes = 0
+
+    def _encode(self, color, scale=1.0, out=None, offset=0):
+        """Writes a color in the NeoPixel byte order (e.g. GRB) into out[offset:]."""
+        order = getattr(self.np, 'ORDER', (1, 0, 2, 3))
+        for i in range(3):
+            out[offset + order[i]] = max(0, min(255, int(color[i] * scale)))
+
+    def _compile_frames(self):
+        """
+        Precomputes every animation frame as raw NeoPixel buffer contents, so
+        playing a frame is one copy into np.buf with no math and no allocation.
+        Frames are memoryview slices of one bytearray table per animation,
+        a frame identical to the one before it is the same object, which lets
+        the scheduler skip the write.
+        """
+        bpp = self.np.bpp
+        size = self.num_pixels * bpp
+
+        def table(count):
+            data = bytearray(count * size)
+            mv = memoryview(data)
+            return data, [mv[i*size:(i+1)*size] for i in range(count)]
+
+        def dedupe(data, frames):
+            for i in range(1, len(frames)):
+                if data[i*size:(i+1)*size] == data[(i-1)*size:i*size]:
+                    frames[i] = frames[i-1]
+            return frames
+
+        def solid(color):
+            data, frames = table(1)
+            for p in range(self.num_pixels):
+                self._encode(color, out=data, offset=p * bpp)
+            return frames
+
+        # Breathing: one full frame per step of the sine brightness LUT
+        steps = max(1, int(round(math.pi * 2 / self.pulse_speed))) if self.pulse_speed else 1
+        self._pulse_data, pulse_frames = table(steps)
+        pixel = bytearray(bpp)
+        for step in range(steps):
+            brightness = (math.sin(step * math.pi * 2 / steps) + 1) / 4
+            self._encode(self.PULSE_BLUE, brightness, pixel)
+            for p in range(self.num_pixels):
+                self._pulse_data[step*size + p*bpp:step*size + (p+1)*bpp] = pixel
+        pulse_step = int(round(self.pulse_angle / self.pulse_speed)) % steps if self.pulse_speed else 0
+
+        # Loading: the 4-pixel comet gradient, rotated once per ring position
+        self._loading_data, loading_frames = table(self.num_pixels)
+        for pos in range(self.num_pixels):
+            for i in range(4): # 4-pixel long comet tail
+                pixel_index = (pos - i + self.num_pixels) % self.num_pixels
+                self._encode(self.LIGHT_BLUE, (4 - i) / 4.0, self._loading_data, pos*size + pixel_index*bpp)
+
+        self.register_animation('waiting', dedupe(self._pulse_data, pulse_frames), 20, offset=pulse_step)
+        self.register_animation('loading', loading_frames, 40, offset=self.loading_pos)
+        self.register_animation('off', solid(self.BLACK))
+        self.register_animation('success', solid(self.GREEN), overlay=True)
+        self.register_animation('failure', solid(self.RED), overlay=True)
+
+    def register_animation(self, name, frames, frame_ms=0, overlay=False, offset=0):
+        """
+        Adds (or replaces) an animation that set_annimation() can select by name.
+        Frames must be buffers of len(np.buf) bytes in the NeoPixel byte order.
+        """
+        self.animations[name] = Animation(name, frames, frame_ms, overlay, offset)
 
     def set_annimation(self, animation_name, duration=0):
-        self.shared_state['animation'] = animation_name
-        self.shared_state['duration'] = duration
+        """
+        Selects an animation. Overlays (success, failure) are shown for `duration`
+        seconds (1.5 if not given) on top of the background, which keeps running
+        underneath. Background animations play until another one is selected.
+        Unknown names turn the ring off.
+        """
+        animation = self.animations.get(animation_name) or self.animations['off']
+        now = time.ticks_ms()
+        if animation.overlay:
+            self.overlay = animation
+            self.overlay_started = now
+            self.overlay_until = time.ticks_add(now, int((duration or 1.5) * 1000))
+        elif animation is not self.background:
+            self.background = animation
+            self.background_started = now
+
+    def render(self, now=None):
+        """
+        Composites the layers for time `now` and writes the ring if the frame changed.
+        Returns True if np.write() was called.
+        """
+        if now is None:
+            now = time.ticks_ms()
+        layer, started = self.background, self.background_started
+        if self.overlay is not None:
+            if time.ticks_diff(self.overlay_until, now) > 0:
+                layer, started = self.overlay, self.overlay_started
+            else:
+                self.overlay = None
+        frame = layer.frame_at(time.ticks_diff(now, started))
+        if frame is self._shown:
+            self.skipped_writes += 1
+            return False
+        self.show_frame(frame)
+        return True
+
+    def show_frame(self, frame):
+        """Copies a precompiled frame into the NeoPixel buffer and writes it out."""
+        self.np.buf[:] = frame
+        self.np.write()
+        self._shown = frame
+        self.writes += 1
         
     def fill(self, color):
         """Helper to fill the entire ring with a single color."""
         self.np.fill(color)
         self.np.write()
+        self._shown = None
 
     def clear(self):
         """Helper to turn all LEDs off."""
-        self.fill(self.BLACK)
-
-    async def _play_solid_color(self, color, duration_s):
-        """
-        NEW: Lights up the entire ring with a solid color for a set duration.
-        """
-        self.fill(color)
-        await uasyncio.sleep(duration_s)
-        self.clear() # Turn off after the duration
-            
-    def _play_loading_step(self):
-        """Advances the loading 'spinner' by one step."""
-        self.np.fill(self.BLACK)
-        for i in range(4): # 4-pixel long comet tail
-            pixel_index = (self.loading_pos - i + self.num_pixels) % self.num_pixels
-            intensity_factor = (4 - i) / 4.0
-            r, g, b = [int(c * intensity_factor) for c in self.LIGHT_BLUE]
-            self.np[pixel_index] = (r, g, b)
-        self.np.write()
-        self.loading_pos = (self.loading_pos + 1) % self.num_pixels
-        
-    def _play_pulsing_step(self):
-        """
-        NEW: Calculates one frame of the slow, pulsing blue animation.
-        Uses a sine wave for a smooth breathing effect.
-        """
-        # Calculate brightness using a sine wave (values from 0.0 to 1.0)
-        brightness = (math.sin(self.pulse_angle) + 1) / 4
-        
-        # Apply brightness to the base pulse color
-        r, g, b = [int(c * brightness) for c in self.PULSE_BLUE]
-        
-        self.fill((r, g, b))
-        
-        # Increment the angle for the next step. Controls pulse speed.
-        self.pulse_angle += self.pulse_speed
-        if self.pulse_angle > math.pi * 2:
-            self.pulse_angle -= math.pi * 2
+        self.show_frame(self.animations['off'].frames[0])
 
     def release(self):
         """
         NEW: Stops the animation task and turns off all LEDs.
         """
-        log("Releasing LED controller resources.")
+        log.info("Releasing LED controller resources.")
         self.running = False
         self.clear()
 
@@ -101,39 +204,12 @@ class LedController:
         The main asynchronous task for the controller.
         This should be started with asyncio.create_task().
         """
-        log("LED Controller task started.")
+        log.info("LED Controller task started.")
         self.clear()
         self.running = True
         
         while self.running:
-            current_animation = self.shared_state.get('animation', 'waiting')
-
-            if current_animation == 'success':
-                duration = self.shared_state.get('duration', 1.5)
-                await self._play_solid_color(self.GREEN, duration)
-                # IMPORTANT: Reset the state back to the default idle animation
-                self.shared_state['animation'] = 'waiting'
-                
-            elif current_animation == 'failure':
-                duration = self.shared_state.get('duration', 1.5)
-                await self._play_solid_color(self.RED, duration)
-                # IMPORTANT: Reset state
-                self.shared_state['animation'] = 'waiting'
-                
-            elif current_animation == 'loading':
-                self._play_loading_step()
-                await uasyncio.sleep_ms(40) # Controls the speed of the loader
-                
-            elif current_animation == 'waiting':
-                self._play_pulsing_step()
-                await uasyncio.sleep_ms(20) # Controls the speed of the pulse
-                
-            else:
-                self.clear()
-                await uasyncio.sleep_ms(100)
-        log("LED Controller task has stopped.")
+            self.render()
+            await uasyncio.sleep_ms(self.frame_ms)
+        log.info("LED Controller task has stopped.")
         self.clear() # Final cleanup
-
-# A simple logger function
-def log(message):
-    print(f"[{time.time()}] {message}")
\ No newline at end of file
@@ -0,0 +1,118 @@
+import time
+from array import array
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+LEVEL_NAMES = {DEBUG: 'DEBUG', INFO: 'INFO', WARNING: 'WARNING', ERROR: 'ERROR'}
+
+# Shared state of every logger: level, UART echo and the ring of recent records
+_level = INFO
+_uart = False
+_size = 64
+_times = array('i', [0] * _size)    # time.time() of each record
+_levels = bytearray(_size)
+_names = [None] * _size
+_texts = [None] * _size
+_next = 0    # slot the next record goes to
+_count = 0   # records in the ring
+dropped = 0  # records overwritten since boot
+
+def configure(level=None, ring_size=None, uart=None):
+    """Sets the level, the ring size (clears the ring) and whether records are printed."""
+    global _level, _uart, _size, _times, _levels, _names, _texts, _next, _count
+    if level is not None:
+        _level = level_from_name(level) if isinstance(level, str) else level
+    if uart is not None:
+        _uart = bool(uart)
+    if ring_size is not None and ring_size != _size:
+        _size = max(1, ring_size)
+        _times = array('i', [0] * _size)
+        _levels = bytearray(_size)
+        _names = [None] * _size
+        _texts = [None] * _size
+        _next = _count = 0
+
+def configure_from(config):
+    configure(config.get('LOG_LEVEL', 'INFO'), config.get('LOG_RING_SIZE', 64), config.get('LOG_UART', 0))
+
+def level_from_name(name):
+    for level, level_name in LEVEL_NAMES.items():
+        if level_name == name.upper():
+            return level
+    raise ValueError('Unknown log level: ' + name)
+
+def enabled_for(level):
+    return level >= _level
+
+def _record(level, name, msg, args):
+    global _next, _count, dropped
+    text = msg % args if args else msg
+    i = _next
+    _times[i] = int(time.time())
+    _levels[i] = level
+    _names[i] = name
+    _texts[i] = text
+    _next = (i + 1) % _size
+    if _count < _size:
+        _count += 1
+    else:
+        dropped += 1
+    if _uart:
+        print(_format(i))
+
+def _format(i):
+    name = _names[i]
+    if name:
+        return "[%d] %s %s: %s" % (_times[i], LEVEL_NAMES.get(_levels[i], '?'), name, _texts[i])
+    return "[%d] %s %s" % (_times[i], LEVEL_NAMES.get(_levels[i], '?'), _texts[i])
+
+def records(n=None, level=DEBUG):
+    """The last n records (all by default) of at least `level`, oldest first, as text lines."""
+    lines = []
+    start = (_next - _count) % _size
+    for k in range(_count):
+        i = (start + k) % _size
+        if _levels[i] >= level:
+            lines.append(_format(i))
+    return lines[-n:] if n else lines
+
+def clear():
+    global _next, _count
+    for i in range(_size):
+        _names[i] = _texts[i] = None
+    _next = _count = 0
+
+class Logger:
+    """
+    Named front end of the shared log. Messages use %-style placeholders and
+    are only formatted when their level is enabled:
+        log.info("Card found on %s: %s", reader.name, uid)
+    """
+    def __init__(self, name=None):
+        self.name = name
+
+    def debug(self, msg, *args):
+        if DEBUG >= _level:
+            _record(DEBUG, self.name, msg, args)
+
+    def info(self, msg, *args):
+        if INFO >= _level:
+            _record(INFO, self.name, msg, args)
+
+    def warning(self, msg, *args):
+        if WARNING >= _level:
+            _record(WARNING, self.name, msg, args)
+
+    def error(self, msg, *args):
+        if ERROR >= _level:
+            _record(ERROR, self.name, msg, args)
+
+    def log(self, level, msg, *args):
+        if level >= _level:
+            _record(level, self.name, msg, args)
+
+def get(name=None):
+    return Logger(name)
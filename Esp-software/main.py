@@ -1,14 +1,28 @@
-import NFC_PN532 as nfc # type: ignore
-from machine import Pin, SPI, reset, RTC, freq # type: ignore
 import time
+BOOT_TICKS = time.ticks_ms() # before any import, so the boot report covers them
+from machine import Pin, SPI, reset, RTC, freq # type: ignore
 import uasyncio as asyncio # pyright: ignore[reportMissingImports]
-from utils import connect, load_credentials, DEFAULT_CONFIG
-from buzzer import BuzzerController
 import ujson
-from led import LedController
-from mqtt_manager import MqttManager # <-- NEW IMPORT
-import ntptime
-import json
+import logger
+from startup import BootSequence, timed_import
+# Only what the first tap needs is imported here, MQTT and the network manager are imported by their boot phase
+with timed_import('NFC_PN532'): import NFC_PN532 as nfc # type: ignore
+with timed_import('utils'): from utils import load_credentials, DEFAULT_CONFIG
+with timed_import('config_store'): import config_store
+with timed_import('buzzer'): from buzzer import BuzzerController
+with timed_import('led'): from led import LedController
+with timed_import('mifare_keys'): from mifare_keys import MifareKeyRing
+with timed_import('reader_pool'): from reader_pool import ReaderPool
+with timed_import('spi_arbiter'): from spi_arbiter import BusArbiter, heartbeat_age, PRIORITY_READ, PRIORITY_CONTROL, PRIORITY_HEALTH
+with timed_import('telemetry'): from telemetry import Telemetry
+with timed_import('profiler'): from profiler import Profiler
+with timed_import('error_reporter'): from error_reporter import ErrorReporter
+with timed_import('time_service'): from time_service import TimeService
+with timed_import('supervisor'): from supervisor import Supervisor
+with timed_import('access_rules'): from access_rules import AccessRules, GRANTED, parse_uid
+with timed_import('passback'): from passback import PassbackTable
+with timed_import('event_history'): from event_history import EventHistory
+with timed_import('audit_log'): from audit_log import AuditLog
 
 SOFTWARE = 'v2.15.2-whitelist-operations'
 
@@ -16,36 +30,54 @@ SOFTWARE = 'v2.15.2-whitelist-operations'
 CONFIG_FILE = "config.json"
 
 # --- Global State & Hardware Objects (Simplified) ---
-pn532 = None; connected_nfc = False; last_uid = None
+reader_pool = None; arbiter = None; connected_nfc = False
 data_queue = []; queue_lock = asyncio.Lock()
-config = DEFAULT_CONFIG.copy(); whitelist = set(); rtc = RTC()
-spi_dev = None; cs = None; buzzer = None; led_controller = None; mqtt_manager = None
+config = DEFAULT_CONFIG.copy(); config_source = None; whitelist = set(); keyring = None; rtc = RTC()
+spi_dev = None; buzzer = None; led_controller = None; mqtt_manager = None; telemetry = None; profiler = None; errors = None; network = None; clock = None; supervisor = None; rules = None; passback = None; auth = None; history = None; audit = None; bench = None
 
 # --- Helper Functions ---
-def log(message): print(f"[{time.time()}] {message}")
+log = logger.get()
+
+# ERROR_EVENT carries the plain text it always had, the repeats go out summarized as JSON on ERROR_SUMMARY_EVENT
+ERROR_TEXTS = {"read_nfc": "Error reading NFC on {source}: {message}",
+               "pn532_connection": "PN532 {source} connection lost: {message}",
+               "config_update": "Error processing config update for '{source}': {message}"}
+
+def publish_error(data):
+    if not mqtt_manager: return
+    if data['kind'] == 'summary': mqtt_manager.register_error_summary(data)
+    else: mqtt_manager.register_error(ERROR_TEXTS.get(data['site'], "{site} on {source}: {message}").format(**data))
+
+def start_task(name, coro):
+    """Starts a background task with its loop time accounted by the profiler."""
+    return asyncio.create_task(profiler.wrap(name, coro) if profiler else coro)
 
 def release():
-    if pn532: log("Releasing NFC resources.")
+    if reader_pool: log.info("Releasing NFC resources.")
     if mqtt_manager: mqtt_manager.disconnect()
+    if audit: audit.close()
     if led_controller: led_controller.release()
-    log("Done.")
+    log.info("Done.")
 
 def load_config():
     # ... (Unchanged)
-    global config;import ujson;from utils import generate_default_reader_id;
+    global config, config_source;from utils import generate_default_reader_id;
     try:
-        with open(CONFIG_FILE,'r')as f:config=DEFAULT_CONFIG.copy();config.update(ujson.load(f))
-        log("Config loaded.")
-        if config["READER_ID_AFFIX"]=="unidentified_reader":config["READER_ID_AFFIX"]=generate_default_reader_id();save_config();log(f"Generated UID:{config['READER_ID_AFFIX']}")
-    except Exception as e:log(f"Config load error:{e}.Using defaults.");config=DEFAULT_CONFIG.copy();save_config()
+        config, config_source = config_store.load(CONFIG_FILE, DEFAULT_CONFIG) # prebuilt snapshot when up to date, else JSON
+        log.info("Config loaded from %s.", config_source)
+        if config["READER_ID_AFFIX"]=="unidentified_reader":config["READER_ID_AFFIX"]=generate_default_reader_id();save_config();log.info("Generated UID:%s", config['READER_ID_AFFIX'])
+    except Exception as e:log.error("Config load error:%s.Using defaults.", e);config=DEFAULT_CONFIG.copy();save_config()
 
 def save_config():
     try:
-        with open(CONFIG_FILE,'w')as f:ujson.dump(config,f);log("Config saved.")
-    except Exception as e:log(f"Config save error:{e}")
+        with open(CONFIG_FILE,'w')as f:ujson.dump(config,f);log.info("Config saved.")
+        config_store.invalidate()
+    except Exception as e:log.error("Config save error:%s", e)
 
 def apply_config():
-  global whitelist; whitelist = set(config.get("WHITELIST", []))
+  global whitelist, keyring; whitelist = set(config.get("WHITELIST", []))
+  try: keyring = MifareKeyRing.from_config(config)
+  except Exception as e: log.warning("Invalid MIFARE_KEYS: %s. Using factory key.", e); keyring = MifareKeyRing()
 
 # --- NEW: MQTT Callback Handlers ---
 def handle_whitelist_update(action, data):
@@ -54,193 +86,450 @@ def handle_whitelist_update(action, data):
         for entry in data:
             if entry not in whitelist:
                 whitelist.add(entry)
-                log(f"Whitelist entry added: {entry}")
+                log.info("Whitelist entry added: %s", entry)
             else:
-                log(f"Whitelist entry already exists: {entry}")
+                log.warning("Whitelist entry already exists: %s", entry)
     elif action == "remove":
         for entry in data:  
             if entry in whitelist:
                 whitelist.remove(entry)
-                log(f"Whitelist entry removed: {entry}")
+                log.info("Whitelist entry removed: %s", entry)
             else:
-                log(f"Whitelist entry not found: {entry}")  
+                log.warning("Whitelist entry not found: %s", entry)  
     elif action == "update":                            
         if isinstance(data, list):
             whitelist.clear()
             whitelist.update(data)
-            log("Whitelist updated.")
+            log.info("Whitelist updated.")
         else:
-            log("Invalid data for whitelist update. Expected a list.")
+            log.warning("Invalid data for whitelist update. Expected a list.")
     global config; config["WHITELIST"] = whitelist
     apply_config(); save_config()
-    log("Whitelist update applied.")
+    log.info("Whitelist update applied.")
 
 def handle_config_update(config_var, msg):
     """Callback function for the MqttManager to handle config messages."""
     global config, mqtt_manager
     try:
-        if config_var not in config: return log(f"Unknown config var: {config_var}")
+        if config_var not in config: return log.warning("Unknown config var: %s", config_var)
         # Your type conversion logic
         if isinstance(config[config_var], float): value = float(msg)
         elif isinstance(config[config_var], int): value = int(msg)
         elif isinstance(config[config_var], list): value = ujson.loads(msg)
         else: value = str(msg)
         config[config_var] = value
-        log(f"Config '{config_var}' updated to '{value}'")
+        log.info("Config '%s' updated to '%s'", config_var, value)
         save_config()
+        if config_var.startswith("LOG_"): logger.configure_from(config)
         # Reset if the changed variable requires it
-        if config_var not in ["CONNECTION_CHECK_INTERVAL", "CONNECTION_RETRIES", "MAX_QUEUE_SIZE", "READ_EVENT_PREFFIX"]:
-            log(f"Resetting to apply changes for '{config_var}'..."); reset()
+        if config_var not in ["CONNECTION_CHECK_INTERVAL", "CONNECTION_RETRIES", "MAX_QUEUE_SIZE", "READ_EVENT_PREFFIX", "LOG_LEVEL", "LOG_RING_SIZE", "LOG_UART",
+                              "MQTT_DELAY", "MQTT_RECONNECT_DELAY", "NFC_AUTOPOLL_CHECK_MS"]:
+            log.warning("Resetting to apply changes for '%s'...", config_var); reset()
     except Exception as e:
-        log(f"Error processing config update for '{config_var}': {e}")
-        mqtt_manager.register_error(f"Error processing config update for '{config_var}': {e}") # type: ignore
+        errors.report("config_update", e, config_var) # type: ignore
+
+def handle_trace_command(msg):
+    """MQTT trace command: 'on' / 'off' switch PN532 command tracing, anything else returns the traces."""
+    msg = msg.strip().lower()
+    if msg in ("on", "off"):
+        reader_pool.set_trace(msg == "on") # type: ignore
+        log.info("PN532 command tracing %s.", msg)
+        return {"trace": msg}
+    return reader_pool.trace_stats() # type: ignore
+
+def handle_access_command(msg):
+    """
+    MQTT access command (JSON): "policy" compiles a new policy, "cards" ({group: [uids]}) adds cards,
+    after dropping the others with "replace": true, "remove" ([uids]) removes cards. Returns the stats.
+    """
+    request = ujson.loads(msg) if msg.strip() else {}
+    reply = {}
+    if 'policy' in request: rules.set_policy(request['policy']) # type: ignore
+    if request.get('replace'): rules.clear_cards() # type: ignore
+    if 'cards' in request: reply['skipped'] = rules.add_cards(request['cards']) # type: ignore # UIDs that are not 4 or 7 bytes long
+    if 'remove' in request: reply['removed'] = rules.remove_cards(request['remove']) # type: ignore
+    if request and rules.active: # type: ignore
+        rules.save(config["ACCESS_POLICY_FILE"], config["ACCESS_CARDS_FILE"]) # type: ignore
+        log.info("Access rules updated: %s", rules.stats()) # type: ignore
+    reply.update(rules.stats()) # type: ignore
+    return reply
+
+def handle_retransmit_command(msg):
+    """MQTT retransmit command: 'first-last' or 'first' republishes the read events still held in the history."""
+    first, _, last = msg.strip().partition('-')
+    first = int(first); last = int(last) if last else first
+    end = min(last, first + history.size - 1) # type: ignore
+    if end < last: log.warning("Retransmit %d-%d capped to %d events: %d-%d", first, last, history.size, first, end) # type: ignore
+    report = history.retransmit(first, end, mqtt_manager.register_read) # type: ignore
+    report.update({'first': first, 'last': end, 'truncated': end < last})
+    log.info("Retransmitted events %d-%d: %s", first, end, report)
+    return report
+
+def handle_audit_command(msg):
+    """
+    MQTT audit command (JSON): {"from": s, "to": s, "uid": "86-225-141-90", "limit": n, "id": any}, every key optional.
+    The matching decisions are streamed back by a background task, one reply per AUDIT_QUERY_CHUNK records, then a summary.
+    """
+    request = ujson.loads(msg) if msg.strip() else {}
+    if audit.querying: return {"id": request.get("id"), "error": "busy"} # type: ignore
+    uid = parse_uid(request["uid"]) if request.get("uid") else None
+    start_task('audit_query', run_audit_query(request.get("id"), request.get("from", 0), request.get("to", 0xFFFFFFFF), uid,
+                                              request.get("limit", config["AUDIT_QUERY_LIMIT"])))
+    return None
+
+async def run_audit_query(query_id, since, until, uid, limit):
+    send = lambda part, records: mqtt_manager.reply(config["MANAGE_AUDIT"], {"id": query_id, "part": part, "records": records}) # type: ignore
+    summary = await audit.query(since, until, uid, send, config["AUDIT_QUERY_CHUNK"], limit) # type: ignore
+    summary["id"] = query_id; summary["done"] = True
+    log.info("Audit query done: %s", summary)
+    mqtt_manager.reply(config["MANAGE_AUDIT"], summary) # type: ignore
+
+def handle_benchmark_command(msg):
+    """MQTT benchmark command: runs the self-benchmark (self_bench.py) in the background, the report is its reply."""
+    global bench
+    if bench is None:
+        from self_bench import SelfBenchmark
+        bench = SelfBenchmark.from_config(config, arbiter, reader_pool, led_controller.np) # type: ignore
+    if bench.running: return {"error": "busy"}
+    start_task('benchmark', run_benchmark())
+    return None
+
+async def run_benchmark():
+    report = await bench.run(whitelist) # type: ignore
+    log.info("Self-benchmark: %s", report)
+    mqtt_manager.reply(config["MANAGE_BENCHMARK"], report) # type: ignore
+
+def handle_profile_command(msg):
+    """MQTT profile command: 'reset' starts a new window, anything else returns the busiest tasks."""
+    if msg.strip().lower() == "reset":
+        profiler.reset() # type: ignore
+        return {"profile": "reset"}
+    return profiler.report(10) # type: ignore
+
+def handle_log_command(msg):
+    """MQTT log command: 'level <name>', 'uart on|off' or 'clear', otherwise returns the last N (default all) log records."""
+    words = msg.strip().split()
+    if len(words) == 2 and words[0] == "level":
+        logger.configure(level=words[1])
+        return {"level": words[1].upper()}
+    if len(words) == 2 and words[0] == "uart":
+        logger.configure(uart=words[1] == "on")
+        return {"uart": words[1]}
+    if words == ["clear"]:
+        logger.clear()
+        return {"log": "cleared"}
+    return {"dropped": logger.dropped, "records": logger.records(int(words[0]) if words else None)}
 
 # --- Hardware and NFC (Slightly simplified) ---
 def initialize_hardware():
-    global spi_dev, cs, buzzer, led_controller
-    log("Initializing hardware...")
+    global spi_dev, reader_pool, arbiter, buzzer, led_controller
+    log.info("Initializing hardware...")
     try:
         led_controller = LedController(config['LED_GPIO'], config['LED_DIODS_AM'], config)
-        asyncio.create_task(led_controller.run())
+        start_task('led', led_controller.run())
         spi_dev = SPI(1, baudrate=1000000, sck=Pin(config['SPI_SCK_GPIO']), mosi=Pin(config['SPI_MOSI_GPIO']), miso=Pin(config['SPI_MISO_GPIO']))
-        cs = Pin(config['NFC_CS_GPIO'], Pin.OUT, value=1)
+        reader_pool = ReaderPool.from_config(spi_dev, config)
+        arbiter = BusArbiter.from_config(config)
+        start_task('spi_arbiter', arbiter.run())
         buzzer = BuzzerController(config['BUZZER_GPIO'], aproval_melody=config['APROVAL_MELODY'], denial_melody=config['DENIAL_MELODY'])
-        log("Hardware initialized."); return True
+        start_task('buzzer', buzzer.run())
+        log.info("Hardware initialized."); return True
     except Exception as e:
-        log(f"FATAL: Hardware init error: {e}"); return False
+        log.error("FATAL: Hardware init error: %s", e); return False
+
+# --- NFC readers ---
+def connect_reader(reader):
+    try:
+        ic, ver, rev, support = reader.pn532.get_firmware_version()
+        log.info('PN532 %s found, firmware version: %s.%s', reader.name, ver, rev)
+        reader.pn532.SAM_configuration()
+        reader.connected = True; reader.armed = False
+    except (RuntimeError, OSError) as e: # one bad chip (no answer, SPI error) must not stop the others
+        log.error("Error connecting to PN532 %s: %s.", reader.name, e)
+    return reader.connected
+
+async def access_decision(reader, uid, uid_str_dec):
+    """
+    (verdict, source): GRANTED or the reason of the denial, and who decided ('local' or, with AUTH_MODE
+    online, OnlineAuth's source). Until a policy is pushed (MANAGE_ACCESS) every card passes the rules, as before.
+    """
+    verdict, source = GRANTED, 'local'
+    if rules.active and uid_str_dec not in whitelist: # type: ignore
+        # Before the first NTP sync the RTC may be off by days: only the groups allowed all week pass
+        verdict = rules.decide(uid, reader.name, rules.slot() if clock.quality() != 'none' else None) # type: ignore
+    if auth: verdict, source = await auth.authorize(uid_str_dec, reader.name, verdict) # bounded by AUTH_DEADLINE_MS
+    if verdict is not GRANTED: return verdict, source
+    return passback.admit(uid, reader.direction), source # type: ignore # records the card once it passes
+
+def poll_readers():
+    """Bus job: polls the next reader and reads the code of the first card found."""
+    if config["NFC_POLL_MODE"] == "autopoll": reader, uids = reader_pool.autopoll() # type: ignore
+    else: reader, uids = reader_pool.poll() # type: ignore
+    # MIFARE commands address target 1, so only the first card has its code read
+    code = nfc.read_card_code_from_block4(reader.pn532, uids[0], keyring=keyring) if uids else None
+    return reader, uids, code
 
-# ... (connect_to_pn532, check_pn532_connection, indicate, read_nfc are unchanged) ...
 async def connect_to_pn532():
-    global pn532, connected_nfc, led_controller
-    if pn532 is None:
-        pn532 = nfc.PN532(spi_dev, cs)
+    global connected_nfc, led_controller
+    await arbiter.submit(PRIORITY_CONTROL, reader_pool.init_drivers) # type: ignore
     retries = 0
     while retries < config["CONNECTION_RETRIES"]:
         led_controller.set_annimation('loading')  # type: ignore # Set loading animation
-        try:
-            ic, ver, rev, support = pn532.get_firmware_version()
-            log('PN532 found, firmware version: {0}.{1}'.format(ver, rev))
-            pn532.SAM_configuration()
-            connected_nfc = True
+        for reader in reader_pool.readers: # type: ignore
+            if not reader.connected: await arbiter.submit(PRIORITY_CONTROL, connect_reader, reader) # type: ignore
+        connected_nfc = any(r.connected for r in reader_pool.readers) # type: ignore
+        if all(r.connected for r in reader_pool.readers): # type: ignore
             return True
-        except RuntimeError as e:
-            log(f"Error connecting to PN532: {e}. Retrying...")
-            retries += 1
-            await asyncio.sleep(1)
-            log("Failed to connect to PN532 after multiple retries.")
-            return False
-            
+        log.warning("Retrying PN532 connection...")
+        retries += 1
+        await asyncio.sleep(1)
+    log.error("Failed to connect to every PN532 after multiple retries.")
+    return connected_nfc
+
+
+async def restart_pn532(reader, attempt):
+    """Supervisor restart of one reader: reconnect, from the second attempt on with a fresh driver."""
+    global connected_nfc
+    if attempt > 1:
+        log.warning("Recreating the PN532 driver of %s", reader.name)
+        reader.pn532 = None; reader.armed = False
+        await arbiter.submit(PRIORITY_CONTROL, reader_pool.init_drivers, False) # type: ignore
+        await arbiter.submit(PRIORITY_CONTROL, reader_pool.wake, reader) # type: ignore
+        await asyncio.sleep_ms(1000) # the chip settles, the other readers keep polling
+    ok = await arbiter.submit(PRIORITY_CONTROL, connect_reader, reader) # type: ignore
+    connected_nfc = any(r.connected for r in reader_pool.readers) # type: ignore
+    return ok
 
 async def check_pn532_connection():
+    """Probes the silent readers, the supervisor reconnects the ones that fail."""
     global connected_nfc, led_controller
     while True:
         await asyncio.sleep(config["CONNECTION_CHECK_INTERVAL"])
-        if not connected_nfc:
-            log("PN532 connection is down. Attempting to reconnect.")
-            await connect_to_pn532()
-        else:
+        for reader in reader_pool.readers: # type: ignore
+            if not reader.connected:
+                continue
+            # Any acknowledged command (e.g. a card poll) counts as a heartbeat, probe only silent readers
+            age = heartbeat_age(reader.pn532)
+            if age is not None and age < config["CONNECTION_CHECK_INTERVAL"] * 1000:
+                continue
             try:
-                ic, ver, rev, support = pn532.get_firmware_version() # type: ignore
+                ic, ver, rev, support = await arbiter.submit(PRIORITY_HEALTH, reader_pool.probe, reader) # type: ignore
             except Exception as e:
                 led_controller.set_annimation("loading") # type: ignore # Short duration for failure indication
-                log(f"PN532 connection lost: {e}")
-                mqtt_manager.register_error(f"PN532 connection lost: {e}") # type: ignore
-                connected_nfc = False
+                errors.report("pn532_connection", e, reader.name) # type: ignore
+                telemetry.pn532_error() # type: ignore
+                reader.connected = False
+        connected_nfc = any(r.connected for r in reader_pool.readers) # type: ignore
+
 
-                
 
 async def read_nfc():
-    global last_uid, connected_nfc, data_queue, queue_lock, whitelist
+    global connected_nfc, data_queue, queue_lock, whitelist
     while True:
         if connected_nfc:
             led_controller.set_annimation('waiting')  # type: ignore # Set loading animation
             try:
-                uid = pn532.read_passive_target(timeout=config["NFC_READ_TIMEOUT"]) # type: ignore
-                if uid is not None:
-                    code = nfc.read_card_code_from_block4(pn532, uid)
+                detected = time.ticks_ms()
+                reader, uids, code = await arbiter.submit(PRIORITY_READ, poll_readers) # type: ignore
+                previous = reader.last_uids if uids else None
+                if uids: reader.last_uids = uids
+                for n, uid in enumerate(uids):
+                    if n: code = None
                     uid_str_hex = '-'.join(['{:02X}'.format(i) for i in uid])
                     uid_str_dec = '-'.join([str(i) for i in uid])
-                    if uid != last_uid:
-                        last_uid = uid
-                        log(f"Card Found! UID (hexadecimal): {uid_str_hex}, UID (decimal): {uid_str_dec}")
-                        if uid_str_dec or code:
-                            log("Card is whitelisted. Access granted.")
+                    if uid not in previous:
+                        log.info("Card Found on %s! UID (hexadecimal): %s, UID (decimal): %s", reader.name, uid_str_hex, uid_str_dec)
+                        verdict, decided_by = await access_decision(reader, uid, uid_str_dec)
+                        audit.record(clock.at(detected) // 1000, uid, reader.name, verdict, decided_by, clock.quality()) # type: ignore # denials too
+                        if verdict is GRANTED:
+                            log.info("Access granted.")
                             led_controller.set_annimation('success', 0.7) # type: ignore
-                            asyncio.create_task(buzzer.play_approval())  # type: ignore # Play approval melody
+                            buzzer.play_approval()  # type: ignore # Queue approval melody
+                            telemetry.tap(detected) # type: ignore
+                            seq = history.next_seq() # type: ignore
+                            data = ujson.dumps({
+                                "seq": seq, # gap detection, MANAGE_RETRANSMIT resends from the history
+                                "uid_dec": uid_str_dec,
+                                "code": code,
+                                "antenna": reader.name,
+                                "timestamp": time.time(),
+                                "ts_ms": clock.at(detected), # type: ignore # Unix ms when the card was seen
+                                "time_sync": clock.quality(), # type: ignore
+                                "decided_by": decided_by
+                            })
+                            history.add(seq, data) # type: ignore # kept even if the queue is full
                             async with queue_lock:
                                 if len(data_queue) < config["MAX_QUEUE_SIZE"]:
-                                    data = {
-                                        "uid_dec": uid_str_dec,
-                                        "code": code,
-                                        "timestamp": time.time()
-                                    }
-                                    data_queue.append(json.dumps(data))
+                                    data_queue.append(data)
+                                    telemetry.read_queued(detected) # type: ignore
                                 else:
-                                    log("Data queue is full. Discarding data.")
+                                    log.warning("Data queue is full. Discarding event %d.", seq)
+                                    telemetry.read_dropped() # type: ignore
                         else:
-                            log("Card is NOT whitelisted. Access denied.")
+                            log.warning("Access denied: %s.", verdict)
                             led_controller.set_annimation('failure', 0.7) # type: ignore
-                            asyncio.create_task(buzzer.play_denial())  # type: ignore # Play denial melody
+                            buzzer.play_denial()  # type: ignore # Queue denial melody
+                            telemetry.tap(detected) # type: ignore
             except Exception as e:
-                log(f"Error reading NFC: {e}")
-                mqtt_manager.register_error(f"Error reading NFC: {e}") # type: ignore
-                connected_nfc = False
-        await asyncio.sleep(0.01)
+                reader = reader_pool.current # type: ignore
+                errors.report("read_nfc", e, reader.name) # type: ignore
+                telemetry.pn532_error() # type: ignore
+                reader.connected = False; reader.armed = False
+                connected_nfc = any(r.connected for r in reader_pool.readers) # type: ignore
+        if config["NFC_POLL_MODE"] == "autopoll" and connected_nfc:
+            await reader_pool.wait_autopoll(config["NFC_AUTOPOLL_CHECK_MS"]) # type: ignore # Chips scan on their own, host sleeps
+        else:
+            await asyncio.sleep(0.01)
 
 # --- NEW: Task to publish queued data ---
 async def publish_queued_data():
     global data_queue, queue_lock, mqtt_manager
     while True:
         async with queue_lock:
-            if data_queue:
-                data = data_queue.pop(0)
-                # Use the MqttManager to publish
-                mqtt_manager.register_read(data) # type: ignore
+            # Reads taken while offline (e.g. during boot) stay queued until the broker is reachable
+            if data_queue and mqtt_manager and mqtt_manager.is_connected:
+                # Dequeued once published: a failed publish drops the connection and the event waits for the next one
+                if mqtt_manager.register_read(data_queue[0]): # type: ignore
+                    data_queue.pop(0)
+                    telemetry.published_read() # type: ignore
         await asyncio.sleep(0.1)
 
 # --- Main (Heavily updated) ---
-async def main():
-    global SOFTWARE, mqtt_manager
-    log("Loading software version: " + SOFTWARE)
-    load_config(); apply_config()
-    if not initialize_hardware(): return log("Hardware init failed. Halting.")
-    credits = load_credentials()
-    
-    l = connect(config.get("PREFERED_NETWORK", "ethernet"), {}, credits)
-    log(f"Network connected. IP info: {l}")
-    buzzer.off() # type: ignore
+def handle_network_change(name, ifconfig):
+    """NetworkManager callback: the MQTT socket belongs to the old interface, reconnect over the new one."""
+    if mqtt_manager: mqtt_manager.reattach()
 
-    try:
-        ntptime.settime()
-        log("RTC synchronized with NTP. Current time: " + str(rtc.datetime()))
-    except Exception as e:
-        log(f"Error synchronizing with NTP: {e}") 
+async def bring_up_network(credits):
+    global network
+    with timed_import('network_manager'): from network_manager import NetworkManager
+    network = NetworkManager.from_config(config, credits)
+    l = await network.connect()
+    if l: log.info("Network connected. IP info: %s", l)
+    else: log.error("No network link, the supervisor keeps trying.")
+    network.on_change(handle_network_change)
+    start_task('network', network.run())
+    telemetry.add_source('network', network.stats) # type: ignore
+    # Failover gets its chance first, the interface is restarted only if neither link comes back
+    supervisor.add('network', lambda: network.is_up(network.active), lambda attempt: network.restart(), # type: ignore
+                   grace_ms=2 * network.timeout_ms + network.check_ms)
+    if l: await clock.sync() # type: ignore # reads taken before this carry time_sync 'none'
+    start_task('clock', clock.run()) # type: ignore # retries every retry_s until the first sync
+    return l is not None
+
+async def bring_up_nfc(boot):
+    # Drivers are created without the blocking wakeup, the chips are woken up together meanwhile
+    reader_pool.init_drivers(wakeup=False) # type: ignore
+    await reader_pool.wakeup() # type: ignore
+    connected = await connect_to_pn532()
+    # Each reader is restarted on its own, a dead one does not hold up or reset the others
+    for reader in reader_pool.readers: # type: ignore
+        supervisor.add('pn532.' + reader.name, lambda r=reader: r.connected, # type: ignore
+                       lambda attempt, r=reader: restart_pn532(r, attempt))
+    # Critical, watched only: local access decisions need a reader, the watchdog resets the board if none is left
+    supervisor.add('pn532', lambda: any(r.connected for r in reader_pool.readers), None, critical=True) # type: ignore
+    start_task('check_pn532_connection', check_pn532_connection())
+    start_task('read_nfc', read_nfc())
+    boot.mark('first_poll')
+    return connected
 
-    # Initialize and connect the MQTT Manager
-    mqtt_manager = MqttManager(
+async def bring_up_mqtt():
+    global mqtt_manager, auth
+    with timed_import('mqtt_manager'): from mqtt_manager import MqttManager
+    manager = MqttManager(
         config=config, led_cb=led_controller.set_annimation, # Assumes LedController has such a method # type: ignore
         whitelist_cb=handle_whitelist_update, config_cb=handle_config_update, reset_cb=release
     )
-    if not await mqtt_manager.connect():
-        log("Could not connect to MQTT broker. Resetting."); reset()
-        
-    # Start all background tasks
-    await connect_to_pn532()
-    asyncio.create_task(check_pn532_connection())
-    asyncio.create_task(read_nfc())
-    asyncio.create_task(publish_queued_data())
-    asyncio.create_task(mqtt_manager.message_loop()) # This replaces the old check_msg in the main loop
-
-    log("All systems running.")
+    manager.register_command(config["MANAGE_TRACE"], handle_trace_command)
+    manager.register_command(config["MANAGE_PROFILE"], handle_profile_command)
+    manager.register_command(config["MANAGE_LOG"], handle_log_command)
+    manager.register_command(config["MANAGE_ACCESS"], handle_access_command)
+    manager.register_command(config["MANAGE_RETRANSMIT"], handle_retransmit_command)
+    manager.register_command(config["MANAGE_AUDIT"], handle_audit_command)
+    manager.register_command(config["MANAGE_BENCHMARK"], handle_benchmark_command)
+    if config["AUTH_MODE"] == "online":
+        with timed_import('online_auth'): from online_auth import OnlineAuth
+        online = OnlineAuth.from_config(config, manager)
+        manager.register_command(config["MANAGE_AUTH_REPLY"], online.handle_reply)
+        telemetry.add_source('auth', online.stats) # type: ignore
+        auth = online
+    manager.auto_reconnect = False # the supervisor reconnects, with backoff
+    mqtt_manager = manager
+    # Without a link the supervisor connects once the network is up
+    connected = network.is_up(network.active) and await manager.connect() # type: ignore
+    supervisor.add('mqtt', lambda: manager.is_connected or not network.is_up(network.active), restart_mqtt) # type: ignore
+    start_task('publish_queued_data', publish_queued_data())
+    start_task('message_loop', mqtt_manager.message_loop()) # This replaces the old check_msg in the main loop
+    start_task('telemetry', telemetry.run(mqtt_manager.register_telemetry)) # type: ignore
+    return connected
+
+async def restart_mqtt(attempt):
+    """Supervisor restart of the MQTT client: drops the socket and connects once, the supervisor spaces the attempts."""
+    mqtt_manager.reattach() # type: ignore
+    return await mqtt_manager.connect(retries=1) # type: ignore
+
+async def main():
+    global SOFTWARE, mqtt_manager, telemetry, profiler, errors, clock, supervisor, rules, passback, history, audit
+    boot = BootSequence(BOOT_TICKS)
+    log.info("Loading software version: %s", SOFTWARE)
+    with boot.timed('config'):
+        load_config(); apply_config(); logger.configure_from(config)
+        credits = load_credentials() # parsed once, MqttManager gets the same dict
+    boot.profile = config.get("BOOT_PROFILE", 0)
+    boot.info['config'] = config_source
+    profiler = Profiler.from_config(config)
+    asyncio.create_task(profiler.run())
+    telemetry = Telemetry.from_config(config, profiler)
+    errors = ErrorReporter.from_config(publish_error, config)
+    start_task('errors', errors.run())
+    clock = TimeService.from_config(config)
+    telemetry.add_source('clock', clock.stats)
+    # Restarts failed subsystems instead of the board, each boot phase adds its own
+    supervisor = Supervisor.from_config(config)
+    start_task('supervisor', supervisor.run())
+    telemetry.add_source('supervisor', supervisor.stats)
+    with boot.timed('hardware'):
+        if not initialize_hardware(): return log.error("Hardware init failed. Halting.")
+    supervisor.start_watchdog(config["SUPERVISOR_WDT_MS"]) # not before: a halted board would be reset in a loop
+    buzzer.off() # type: ignore
+    with boot.timed('access'):
+        rules = AccessRules.from_config(config, [r.name for r in reader_pool.readers]) # type: ignore # doors are the reader names
+    telemetry.add_source('access', rules.stats)
+    passback = PassbackTable.from_config(config)
+    history = EventHistory.from_config(config)
+    telemetry.add_source('events', history.stats)
+    with boot.timed('audit'):
+        audit = AuditLog.from_config(config, [r.name for r in reader_pool.readers]) # type: ignore
+    start_task('audit', audit.run())
+    telemetry.add_source('audit', audit.stats)
+    telemetry.add_source('passback', passback.stats)
+    telemetry.add_source('queue_depth', lambda: len(data_queue))
+    telemetry.add_source('bus_pending', arbiter.pending) # type: ignore
+    telemetry.add_source('mqtt_reconnects', lambda: mqtt_manager.reconnects if mqtt_manager else 0)
+
+    # The network and the readers come up side by side, cards are read (and queued) as soon as a PN532 answers
+    nfc_phase = boot.start('nfc', bring_up_nfc(boot))
+    # False without a link: MQTT is still set up and connected by the supervisor later. None if the phase raised.
+    if await boot.phase('network', bring_up_network(credits)) is not None:
+        if not await boot.phase('mqtt', bring_up_mqtt()):
+            log.error("Could not connect to MQTT broker, the supervisor keeps trying. Reads stay queued.")
+    await nfc_phase
+
+    report = boot.report()
+    log.info("Boot finished in %d ms: %s", report['total_ms'], report)
+    if mqtt_manager: mqtt_manager.register_telemetry({'boot': report})
+    log.info("All systems running.")
     # The main loop is now only for keeping the script alive.
     while True:
         await asyncio.sleep(60)
 
 # --- Entry Point ---
-if __name__ == "__main__":
+def run():
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
-        log("Exiting...")
+        log.info("Exiting...")
     finally:
-        release()
\ No newline at end of file
+        release()
+
+if __name__ == "__main__":
+    run() # the .mpy build ships this module as app.mpy, its main.py calls app.run()
\ No newline at end of file
@@ -0,0 +1,81 @@
+import binascii
+
+FACTORY_KEY = b'\xFF\xFF\xFF\xFF\xFF\xFF'
+
+class MifareKeyRing:
+    """
+    An ordered list of MIFARE Classic keys plus a small cache that remembers
+    which key opened a card last time, so the next tap tries that key first.
+    Hints are kept per UID and per card class (ATQA/SAK), the class hint is
+    used for cards the reader has not seen yet.
+    """
+    def __init__(self, keys=None, cache_size=64):
+        """
+        :param keys: List of 6-byte keys (bytes) or 12-char hex strings, in the order they should be tried.
+        :param cache_size: Maximum number of UIDs remembered. 0 disables the per-UID cache.
+        """
+        self.keys = [self._parse_key(k) for k in (keys or [FACTORY_KEY])]
+        self.cache_size = cache_size
+
+        self._uid_hints = {}  # uid bytes -> key index
+        self._uid_order = []  # insertion order of cached UIDs, oldest first
+        self._class_hints = {}  # (ATQA << 8) | SAK -> key index
+
+        # Statistics, used by the benchmark and telemetry
+        self.taps = 0
+        self.attempts = 0
+        self.failures = 0
+
+    @staticmethod
+    def _parse_key(key):
+        if isinstance(key, str):
+            key = binascii.unhexlify(key)
+        if len(key) != 6:
+            raise ValueError('MIFARE key must be 6 bytes long')
+        return bytes(key)
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config.get('MIFARE_KEYS', [FACTORY_KEY]), config.get('MIFARE_KEY_CACHE_SIZE', 64))
+
+    def order(self, uid, card_class=None):
+        """Returns key indexes in the order they should be tried for this card."""
+        first = self._uid_hints.get(bytes(uid))
+        if first is None and card_class is not None:
+            first = self._class_hints.get(card_class)
+        if first is None or first >= len(self.keys):
+            return range(len(self.keys))
+        return [first] + [i for i in range(len(self.keys)) if i != first]
+
+    def remember(self, uid, card_class, index):
+        """Stores the key index that authenticated this card."""
+        if card_class is not None:
+            self._class_hints[card_class] = index
+        if self.cache_size <= 0:
+            return
+        uid = bytes(uid)
+        if uid not in self._uid_hints:
+            if len(self._uid_order) >= self.cache_size:
+                del self._uid_hints[self._uid_order.pop(0)]
+            self._uid_order.append(uid)
+        self._uid_hints[uid] = index
+
+    def forget(self, uid):
+        """Drops the hint for a UID, e.g. after its key stopped working."""
+        uid = bytes(uid)
+        if uid in self._uid_hints:
+            del self._uid_hints[uid]
+            self._uid_order.remove(uid)
+
+    def clear(self):
+        self._uid_hints.clear()
+        self._uid_order.clear()
+        self._class_hints.clear()
+
+    def stats(self):
+        return {
+            'taps': self.taps,
+            'attempts': self.attempts,
+            'failures': self.failures,
+            'avg_attempts': self.attempts / self.taps if self.taps else 0
+        }
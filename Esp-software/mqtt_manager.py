@@ -6,6 +6,9 @@ import ujson
 import time
 import re 
 from utils import load_credentials
+import logger
+
+log = logger.get('MQTT')
 
 class MqttManager:
     def __init__(self, config, led_cb, whitelist_cb, config_cb, reset_cb):
@@ -46,16 +49,26 @@ class MqttManager:
         self.topic_offline = self.form_topic_pub(config["OFFLINE_EVENT"])
         self.topic_read = self.form_topic_pub(config['READ_EVENT'])
         self.topic_error = self.form_topic_pub(config["ERROR_EVENT"])
+        self.topic_error_summary = self.form_topic_pub(config["ERROR_SUMMARY_EVENT"])
+        self.topic_telemetry = self.form_topic_pub(config["TELEMETRY_EVENT"])
+        self.topic_auth = self.form_topic_pub(config["AUTH_REQUEST_EVENT"])
 
         self.whitelist_add = config["MANAGE_WHITELIST_ADD"]
         self.whitelist_remove = config["MANAGE_WHITELIST_REMOVE"]
         self.whitelist_Update = config["MANAGE_WHITELIST_UPDATE"]
 
         self.last_mqtt_connection = float('inf')
+        self.reconnects = 0
+        self.connected_once = False
+        # message_loop reconnects by itself unless a supervisor does it (see supervisor.py)
+        self.auto_reconnect = True
 
+        # topic -> (name, handler) of the commands added with register_command()
+        self.commands = {}
+        # While poll(only) runs, messages on other topics wait here for message_loop
+        self._only = None
+        self._deferred = []
 
-    def log(self, message):
-        print(f"[{time.time()}] MQTT: {message}")
 
     def form_topic_sub(self, subtopic):
         r = re.sub(r'\$([A-Z0-9_]+)', lambda m: self.config[m.group(1)], self.config["MQTT_NAMING_TEMPLATE_SUBSCRIBE"])
@@ -65,13 +78,24 @@ class MqttManager:
         r = re.sub(r'\$([A-Z0-9_]+)', lambda m: self.config[m.group(1)], self.config["MQTT_NAMING_TEMPLATE_PUBLISH"])
         return re.sub(r'#', subtopic, r)
 
+    def register_command(self, name, handler):
+        """
+        Adds a management command on the subscribe topic `name`. handler(msg) is
+        called with the message text, a result other than None is published as
+        JSON on the publish topic `name`. Register commands before connect().
+        """
+        self.commands[self.form_topic_sub(name)] = (name, handler)
+
     def _callback(self, topic_bytes, msg_bytes):
         topic = topic_bytes.decode('utf-8')
+        if self._only is not None and topic != self._only:
+            self._deferred.append((topic_bytes, msg_bytes))
+            return
         msg = msg_bytes.decode('utf-8')
-        self.log(f"Received message on topic: {topic}")
+        log.debug("Received message on topic: %s", topic)
         if topic.startswith(self.topic_whitelist):
             action = topic.split('/')[-1]
-            self.log(f"Whitelist action: {action} with message: {msg}")
+            log.debug("Whitelist action: %s with message: %s", action, msg)
             if action == self.whitelist_add:
                 try:
                     new_entry = ujson.loads(msg)
@@ -80,9 +104,9 @@ class MqttManager:
                     elif isinstance(new_entry, str):
                         self.whitelist_callback("add", [new_entry]) # Support adding a single UID string
                     else:
-                        self.log("Invalid whitelist entry format. Expected a list of UIDs or a single UID string.")
+                        log.warning("Invalid whitelist entry format. Expected a list of UIDs or a single UID string.")
                 except Exception as e:
-                    self.log(f"Error processing whitelist addition: {e}")
+                    log.error("Error processing whitelist addition: %s", e)
             elif action == self.whitelist_remove:
                 try:
                     entry_to_remove = ujson.loads(msg)
@@ -91,72 +115,90 @@ class MqttManager:
                     elif isinstance(entry_to_remove, str):
                         self.whitelist_callback("remove", [entry_to_remove]) # Support removing a single UID
                     else:
-                        self.log("Invalid whitelist entry format. Expected a list of UIDs or a single UID string.")
+                        log.warning("Invalid whitelist entry format. Expected a list of UIDs or a single UID string.")
                 except Exception as e:
-                    self.log(f"Error processing whitelist removal: {e}")
+                    log.error("Error processing whitelist removal: %s", e)
             elif action == self.whitelist_Update:
                 try:
                     new_whitelist = ujson.loads(msg)
                     if isinstance(new_whitelist, list):
                         self.whitelist_callback("update", new_whitelist)
                     else:
-                        self.log("Invalid whitelist format. Expected a list.")
+                        log.warning("Invalid whitelist format. Expected a list.")
                 except Exception as e:
-                    self.log(f"Error processing whitelist update: {e}")
+                    log.error("Error processing whitelist update: %s", e)
         
         elif topic.startswith(self.topic_config_base):
             config_var = topic.split('/')[-1]
             self.config_callback(config_var, msg)
             
         elif topic == self.topic_reset:
-            self.log("Reset command received. Triggering reset.")
+            log.info("Reset command received. Triggering reset.")
             self.reset_callback()
 
-    async def connect(self):
+        elif topic in self.commands:
+            name, handler = self.commands[topic]
+            try:
+                reply = handler(msg)
+                if reply is not None:
+                    self.reply(name, reply)
+            except Exception as e:
+                log.error("Error processing command '%s': %s", name, e)
+                self.register_error(f"Error processing command '{name}': {e}")
+
+    async def connect(self, retries=None):
+        """Connects and subscribes, trying up to `retries` times (CONNECTION_RETRIES by default). Returns True once connected."""
+        attempts = retries or self.config["CONNECTION_RETRIES"]
         retries = 0
-        while retries < self.config["CONNECTION_RETRIES"]:
+        while retries < attempts:
             self.led_callback('waiting', 0)  # Indicate connection attempt
             try:
-                self.log(f"Attempting to connect to broker at {self.broker}...")
+                log.info("Attempting to connect to broker at %s...", self.broker)
                 self.mqttc.connect(clean_session=True)
 
                 #  ---------------- INDEV SOLUTION, NEEDS TO BE CHANGED WHEN PRODUCTION BROCKER WILL BE AWAIBLE ----------------
                 
                 self.mqttc.subscribe(self.topic_whitelist + "#", qos=0)
-                self.log(f"Subscribed to whitelist topic: {self.topic_whitelist}")
+                log.debug("Subscribed to whitelist topic: %s", self.topic_whitelist)
                 self.mqttc.subscribe(f"{self.topic_config_base}/#", qos=0)
-                self.log(f"Subscribed to config topic: {self.topic_config_base}/#")
+                log.debug("Subscribed to config topic: %s/#", self.topic_config_base)
                 self.mqttc.subscribe(self.topic_reset, qos=0)
-                self.log(f"Subscribed to reset topic: {self.topic_reset}")
+                log.debug("Subscribed to reset topic: %s", self.topic_reset)
+                for topic in self.commands:
+                    self.mqttc.subscribe(topic, qos=0)
+                    log.debug("Subscribed to command topic: %s", topic)
                 
                 self.mqttc.set_last_will(topic=self.topic_offline, msg=self.client_id, retain=True, qos=0)
                 self.mqttc.publish(self.topic_online, self.client_id, retain=True, qos=0)
                 
-                self.log("Successfully connected to MQTT Broker.")
-                self.is_connected = True
+                log.info("Successfully connected to MQTT Broker.")
+                if self.connected_once: self.reconnects += 1
+                self.is_connected = self.connected_once = True
                 return True
             except Exception as e:
-                self.log(f"Connection failed: {e}. Retrying...")
+                log.error("Connection failed: %s.", e)
                 retries += 1
-                await uasyncio.sleep(self.config["MQTT_RECONNECT_DELAY"])
+                if retries < attempts:
+                    await uasyncio.sleep(self.config["MQTT_RECONNECT_DELAY"])
         
-        self.log("Failed to connect after multiple retries.")
-        self.reset_callback()
+        log.error("Failed to connect after %d attempts.", attempts)
         return False
 
     async def message_loop(self):
         """Asynchronous task to check for messages and handle reconnection."""
         while True:
             try:
+                while self._deferred:
+                    self._callback(*self._deferred.pop(0))
                 if self.is_connected:
                     self.mqttc.check_msg()
                     self.last_mqtt_connection = time.time
-                else:
-                    self.log("Connection lost. Attempting to reconnect...")
+                elif self.auto_reconnect:
+                    log.warning("Connection lost. Attempting to reconnect...")
                     await self.connect()
                 await uasyncio.sleep_ms(self.config["MQTT_DELAY"])
             except Exception as e:
-                self.log(f"Error in message_loop: {e}")
+                log.error("Error in message_loop: %s", e)
                 self.is_connected = False # Trigger reconnect on next iteration
 
     def publish(self, topic, message):
@@ -164,25 +206,68 @@ class MqttManager:
             return False
         try:
             self.mqttc.publish(topic, str(message))
-            self.log(f"Published to {topic}: {message}")
+            log.debug("Published to %s: %s", topic, message)
             return True
         except Exception as e:
-            self.log(f"Failed to publish: {e}")
+            log.error("Failed to publish: %s", e)
             self.is_connected = False
             return False
         
+    def reply(self, name, data):
+        """Publishes data as JSON on the publish topic of the command `name`, e.g. the parts of a streamed answer."""
+        return self.publish(self.form_topic_pub(name), ujson.dumps(data))
+
     def register_read(self, data):
-        self.publish(self.topic_read, data)
+        """Publishes a read event, returns whether it went out."""
+        return self.publish(self.topic_read, data)
 
     def register_error(self, error_message):
         self.publish(self.topic_error, error_message)
 
+    def register_error_summary(self, data):
+        """Publishes a summary of repeated errors (ErrorReporter) as JSON."""
+        self.publish(self.topic_error_summary, ujson.dumps(data))
+
+    def register_telemetry(self, data):
+        self.publish(self.topic_telemetry, ujson.dumps(data))
+
+    def request_auth(self, data):
+        return self.publish(self.topic_auth, data)
+
+    def poll(self, only):
+        """
+        Handles a message already received on the command topic `only` without
+        waiting for message_loop (e.g. an awaited reply). Messages on other
+        topics are kept for message_loop, so a config change or a reset is
+        never applied in the middle of an access decision.
+        """
+        if not self.is_connected:
+            return
+        self._only = self.form_topic_sub(only)
+        try:
+            self.mqttc.check_msg()
+        except Exception as e:
+            log.error("Error while polling: %s", e)
+            self.is_connected = False
+        finally:
+            self._only = None
+
+    def reattach(self):
+        """Drops the broker connection after the network interface changed, message_loop reconnects over the new one."""
+        if self.is_connected:
+            log.warning("Network changed, reconnecting to the broker.")
+        try:
+            self.mqttc.sock.close()
+        except Exception:
+            pass  # never connected or already closed
+        self.is_connected = False
+
     def disconnect(self):
         if self.is_connected:
-            self.log("Disconnecting from MQTT.")
+            log.info("Disconnecting from MQTT.")
             try:
                 self.mqttc.publish(self.topic_offline, self.client_id, retain=True, qos=0)
                 self.mqttc.disconnect()
             except Exception as e:
-                self.log(f"Error during disconnect: {e}")
+                log.error("Error during disconnect: %s", e)
         self.is_connected = False
\ No newline at end of file
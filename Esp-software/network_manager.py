@@ -0,0 +1,212 @@
+import time
+import uasyncio as asyncio # type: ignore
+import logger
+from utils import wait_connected
+
+log = logger.get('network')
+
+ETHERNET = 'ethernet'
+WIFI = 'wifi'
+
+class NetworkManager:
+    """
+    Keeps the reader online over Ethernet or WiFi. `connect()` brings up the
+    preferred interface (the other one if it does not come up) and `run()`
+    then watches the link of the active interface every `check_ms`. When it
+    drops, the other interface is brought up and the change callbacks run, so
+    MQTT can reconnect over the new interface without a reset. The preferred
+    interface is taken back once its link has been up for `failback_s`.
+    Ethernet stays active all the time so that its link state is known, WiFi
+    is only connected while it is the active interface.
+    """
+    def __init__(self, config, credits, net=None, check_ms=500, timeout_ms=10000, failback_s=30):
+        """
+        :param net: The `network` module, tests pass a fake one.
+        :param check_ms: Link check period, bounds the time to notice a lost link.
+        :param timeout_ms: Time an interface gets to come up before the other one is tried.
+        :param failback_s: Seconds the preferred link must stay up before it is used again.
+        """
+        if net is None:
+            import network as net # type: ignore
+        self.net = net
+        self.config = config
+        self.credits = credits
+        self.check_ms = check_ms
+        self.timeout_ms = timeout_ms
+        self.failback_s = failback_s
+        self.preferred = WIFI if config.get('PREFERED_NETWORK', ETHERNET) == WIFI else ETHERNET
+        self.ifaces = {}  # name -> interface object, created on first use
+        self.active = None
+        self.callbacks = []
+        self.failovers = 0
+        self.last_failover_ms = None
+        self.max_failover_ms = 0
+        self.down_since = None  # ticks_ms the active link was last seen up, while it is down
+        self.running = False
+
+    @classmethod
+    def from_config(cls, config, credits, net=None):
+        return cls(config, credits, net, config.get('NETWORK_CHECK_MS', 500),
+                   config.get('NETWORK_TIMEOUT_MS', 10000), config.get('NETWORK_FAILBACK_S', 30))
+
+    def on_change(self, callback):
+        """Registers callback(name, ifconfig), called whenever the active interface changes."""
+        self.callbacks.append(callback)
+
+    def _other(self, name):
+        return WIFI if name == ETHERNET else ETHERNET
+
+    def _ethernet(self):
+        lan = self.ifaces.get(ETHERNET)
+        if lan is None:
+            from machine import Pin # type: ignore
+            power = self.config.get('ETH_POWER', 12)
+            if power >= 0:
+                Pin(power, Pin.OUT).value(1)
+                time.sleep_ms(100)
+            phy_type = getattr(self.net, 'PHY_' + self.config.get('ETH_TYPE', 'LAN8720'))
+            lan = self.net.LAN(mdc=Pin(self.config.get('ETH_MDC', 23)), mdio=Pin(self.config.get('ETH_MDIO', 18)),
+                               phy_type=phy_type, phy_addr=self.config.get('ETH_PHY_ADDR', 1))
+            self.ifaces[ETHERNET] = lan
+        if not lan.active():
+            log.info("Starting Ethernet")
+            lan.active(True)
+        return lan
+
+    def _wifi(self):
+        sta = self.ifaces.get(WIFI)
+        if sta is None:
+            sta = self.ifaces[WIFI] = self.net.WLAN(self.net.STA_IF)
+        if not sta.isconnected():
+            log.info("Connecting to WiFi SSID: %s", self.credits.get('WIFI_SSID', 'prohidna'))
+            sta.active(True)
+            sta.connect(self.credits.get('WIFI_SSID', 'prohidna'), self.credits.get('WIFI_PASSWORD', '12345678'))
+        return sta
+
+    def start(self, name):
+        """Starts bringing up an interface without waiting, returns it or None on error."""
+        try:
+            return self._ethernet() if name == ETHERNET else self._wifi()
+        except Exception as e:
+            log.error("Could not start %s: %s", name, e)
+            return None
+
+    def is_up(self, name):
+        iface = self.ifaces.get(name)
+        try:
+            return iface is not None and iface.isconnected()
+        except Exception:
+            return False
+
+    def ifconfig(self):
+        return self.ifaces[self.active].ifconfig() if self.active else None
+
+    async def bring_up(self, name):
+        """Starts `name` and waits up to timeout_ms for its link. Returns True once it is up."""
+        iface = self.start(name)
+        return iface is not None and await wait_connected(iface, self.timeout_ms, min(self.check_ms, 100))
+
+    def _switch(self, name):
+        previous, self.active = self.active, name
+        if previous == WIFI and name != WIFI and self.is_up(WIFI):
+            self.ifaces[WIFI].disconnect()  # only one interface may carry the default route
+        log.info("Network on %s, config: %s", name, self.ifconfig())
+        for callback in self.callbacks:
+            try:
+                callback(name, self.ifconfig())
+            except Exception as e:
+                log.error("Network change callback failed: %s", e)
+
+    async def connect(self):
+        """
+        Tries the preferred interface, then the other one, once each. Returns the
+        ifconfig() of the one that came up, or None: the supervisor then retries
+        with restart(), run() does nothing until an interface is active.
+        """
+        for name in (self.preferred, self._other(self.preferred)):
+            if await self.bring_up(name):
+                self._switch(name)
+                return self.ifconfig()
+            log.warning("%s did not come up in %d ms", name, self.timeout_ms)
+        return None
+
+    def _failed_over(self, name):
+        elapsed = time.ticks_diff(time.ticks_ms(), self.down_since)
+        self.down_since = None
+        self.failovers += 1
+        self.last_failover_ms = elapsed
+        self.max_failover_ms = max(self.max_failover_ms, elapsed)
+        log.warning("Failed over to %s in %d ms", name, elapsed)
+        self._switch(name)
+
+    async def check(self, preferred_up_since):
+        """One link check. Returns the ticks_ms since when the preferred standby link is up, or None."""
+        if self.active is None:
+            return None  # nothing came up at boot yet, restart() brings the first link up
+        now = time.ticks_ms()
+        if self.is_up(self.active):
+            if self.active == self.preferred:
+                return None
+            # On the backup interface: take the preferred one back once it is stable
+            if not self.is_up(self.preferred):
+                return None
+            if preferred_up_since is None:
+                return now
+            if time.ticks_diff(now, preferred_up_since) >= self.failback_s * 1000:
+                log.info("%s is back, failing back", self.preferred)
+                self._switch(self.preferred)
+                return None
+            return preferred_up_since
+        if self.down_since is None:
+            self.down_since = time.ticks_add(now, -self.check_ms)  # last time it was seen up
+            log.warning("%s link lost", self.active)
+        other = self._other(self.active)
+        if self.is_up(other) or await self.bring_up(other):
+            if self.down_since is not None:  # restart() may have brought a link back meanwhile
+                self._failed_over(other)
+        elif await self.bring_up(self.active) and self.down_since is not None:
+            log.info("%s link back after %d ms", self.active, time.ticks_diff(time.ticks_ms(), self.down_since))
+            self.down_since = None
+            self._switch(self.active)  # the address may have changed, reattach anyway
+        return None
+
+    async def restart(self):
+        """Restarts the active interface (the other one if it does not come back). Returns True once one is up."""
+        name = self.active or self.preferred
+        iface = self.ifaces.get(name)
+        if iface is not None:
+            try:
+                if name == WIFI:
+                    iface.disconnect()
+                iface.active(False)
+            except Exception as e:
+                log.error("Could not stop %s: %s", name, e)
+            await asyncio.sleep_ms(100)
+        for candidate in (name, self._other(name)):
+            if await self.bring_up(candidate):
+                self.down_since = None
+                self._switch(candidate)
+                return True
+        return False
+
+    async def run(self):
+        """Link monitor, start it with asyncio.create_task() after connect()."""
+        self.running = True
+        preferred_up_since = None
+        last_wifi_try = time.ticks_ms()
+        while self.running:
+            await asyncio.sleep_ms(self.check_ms)
+            if self.active != self.preferred and self.preferred == WIFI and not self.is_up(WIFI):
+                # WiFi is not kept connected on standby, try it again every failback_s
+                if time.ticks_diff(time.ticks_ms(), last_wifi_try) >= self.failback_s * 1000:
+                    last_wifi_try = time.ticks_ms()
+                    self.start(WIFI)
+            preferred_up_since = await self.check(preferred_up_since)
+
+    def stop(self):
+        self.running = False
+
+    def stats(self):
+        """Telemetry source: active interface and failover latency (ms from the last time the lost link was seen up)."""
+        return {'active': self.active, 'failovers': self.failovers,
+                'last_failover_ms': self.last_failover_ms, 'max_failover_ms': self.max_failover_ms}
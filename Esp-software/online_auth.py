@@ -0,0 +1,155 @@
+import time
+import ujson
+import uasyncio as asyncio # type: ignore
+from array import array
+import logger
+from access_rules import GRANTED
+
+log = logger.get('auth')
+
+DENIED = 'denied_online'
+MAX_TTL_S = 86400  # ticks_add() only reaches a few days ahead
+
+# Where a verdict came from, in stats()
+ONLINE = 'online'
+CACHE = 'cache'
+FALLBACK = 'fallback'
+
+LATENCY_SAMPLES = 128
+POLL_MS = 5
+
+class OnlineAuth:
+    """
+    Lets the backend make the final call on a tap. The reader publishes
+    {"id", "uid", "door", "local"} and waits for {"id", "verdict", "ttl"} on
+    the reply command topic, polling the MQTT socket every POLL_MS instead of
+    waiting for the message loop (only the reply topic, other messages wait
+    for the loop). Without an answer within `deadline_ms` (or without a
+    broker) the local decision stands. Verdicts are cached per card and door
+    for their "ttl" (default `cache_s`) so repeated taps do not wait, a ttl
+    of 0 disables it, e.g. for cards that were just revoked.
+    """
+    def __init__(self, mqtt, deadline_ms=150, cache_s=30, cache_size=256, reply_topic='auth'):
+        """
+        :param mqtt: The MqttManager, for request_auth(), poll() and is_connected.
+        :param reply_topic: The command name handle_reply() is registered on (MANAGE_AUTH_REPLY).
+        """
+        self.mqtt = mqtt
+        self.reply_topic = reply_topic
+        self.deadline_ms = deadline_ms
+        self.cache_s = cache_s
+        self.cache_size = cache_size
+        self._cache = {}      # (uid string, door) -> (verdict, expiry ticks_ms)
+        self._cache_order = []
+        self._next_id = 1
+        self._waiting = None  # correlation id of the request in flight
+        self._verdict = None
+        self._ttl = None
+        self._latencies = array('H', bytearray(2 * LATENCY_SAMPLES))  # ms of the last answered requests
+        self._samples = 0
+        self.requests = 0
+        self.answered = 0
+        self.late = 0         # answers after the deadline, ignored
+        self.counts = {ONLINE: 0, CACHE: 0, FALLBACK: 0}
+
+    @classmethod
+    def from_config(cls, config, mqtt):
+        return cls(mqtt, config.get('AUTH_DEADLINE_MS', 150), config.get('AUTH_CACHE_S', 30),
+                   config.get('AUTH_CACHE_SIZE', 256), config.get('MANAGE_AUTH_REPLY', 'auth'))
+
+    def _cached(self, key):
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        if time.ticks_diff(entry[1], time.ticks_ms()) <= 0:
+            del self._cache[key]
+            self._cache_order.remove(key)
+            return None
+        return entry[0]
+
+    def _remember(self, key, verdict, ttl_s):
+        if ttl_s <= 0 or self.cache_size <= 0:
+            if key in self._cache:
+                del self._cache[key]
+                self._cache_order.remove(key)
+            return
+        if key not in self._cache:
+            if len(self._cache_order) >= self.cache_size:
+                del self._cache[self._cache_order.pop(0)]
+            self._cache_order.append(key)
+        self._cache[key] = (verdict, time.ticks_add(time.ticks_ms(), ttl_s * 1000))
+
+    async def authorize(self, uid, door, local):
+        """
+        Final decision for a card (uid string) at a door, given the local
+        decision. Returns (verdict, source), source being ONLINE, CACHE or FALLBACK.
+        """
+        key = (uid, door)  # a verdict holds for the door it was asked for
+        verdict = self._cached(key)
+        if verdict is not None:
+            self.counts[CACHE] += 1
+            return verdict, CACHE
+        if self.mqtt is None or not self.mqtt.is_connected:
+            self.counts[FALLBACK] += 1
+            return local, FALLBACK
+        request_id = self._next_id
+        self._next_id = request_id % 0xFFFF + 1
+        self._waiting, self._verdict, self._ttl = request_id, None, None
+        start = time.ticks_ms()
+        self.requests += 1
+        if self.mqtt.request_auth(ujson.dumps({'id': request_id, 'uid': uid, 'door': door, 'local': local})):
+            while self._verdict is None and time.ticks_diff(time.ticks_ms(), start) < self.deadline_ms:
+                self.mqtt.poll(self.reply_topic)  # the reply is handled by handle_reply() from inside
+                if self._verdict is None:
+                    await asyncio.sleep_ms(POLL_MS)
+        self._waiting = None
+        if self._verdict is None:
+            self.counts[FALLBACK] += 1
+            log.warning("No authorization answer within %d ms, local decision: %s", self.deadline_ms, local)
+            return local, FALLBACK
+        elapsed = time.ticks_diff(time.ticks_ms(), start)
+        self._latencies[self._samples % LATENCY_SAMPLES] = min(elapsed, 0xFFFF)
+        self._samples += 1
+        self.answered += 1
+        self.counts[ONLINE] += 1
+        self._remember(key, self._verdict, self.cache_s if self._ttl is None else self._ttl)
+        return self._verdict, ONLINE
+
+    def handle_reply(self, msg):
+        """MQTT command handler of the reply topic: {"id": n, "verdict": "granted" | reason, "ttl": s}."""
+        reply = ujson.loads(msg)
+        if reply.get('id') != self._waiting:
+            self.late += 1
+            return None
+        self._verdict = GRANTED if reply.get('verdict') == GRANTED else DENIED
+        self._ttl = self._valid_ttl(reply.get('ttl'))
+        return None
+
+    def _valid_ttl(self, ttl):
+        """The reply's ttl in whole seconds (at most MAX_TTL_S), None (cache_s) if missing or not a number."""
+        if ttl is None:
+            return None
+        try:
+            if isinstance(ttl, bool):
+                raise TypeError
+            return min(int(ttl), MAX_TTL_S)
+        except (TypeError, ValueError, OverflowError):
+            log.warning("Invalid ttl %r in the authorization reply, caching for %d s", ttl, self.cache_s)
+            return None
+
+    def forget(self):
+        """Drops the cached verdicts, e.g. after a revocation."""
+        self._cache.clear()
+        self._cache_order.clear()
+
+    def percentiles(self):
+        """p50/p90/p99 of the request to answer time (ms) over the last answered requests."""
+        n = min(self._samples, LATENCY_SAMPLES)
+        if not n:
+            return {}
+        ordered = sorted(self._latencies[:n])
+        return {'p50': ordered[n // 2], 'p90': ordered[n * 9 // 10], 'p99': ordered[n * 99 // 100], 'max': ordered[-1]}
+
+    def stats(self):
+        return {'requests': self.requests, 'answered': self.answered, 'late': self.late,
+                'sources': dict(self.counts), 'latency_ms': self.percentiles(), 'cached': len(self._cache)}
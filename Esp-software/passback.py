@@ -0,0 +1,143 @@
+import time
+from array import array
+from access_rules import GRANTED
+
+# Denials, next to the ones of access_rules
+PASSBACK = 'passback'
+RATE = 'rate_limited'
+
+IN = 1
+OUT = 2
+DIRECTIONS = {'in': IN, 'out': OUT}
+MAX_PROBE = 8   # slots looked at per lookup, bounds the time whatever the fill
+TICK_MS = 100   # resolution of the stored times
+MAX_SLOTS = 1 << 20
+HASH_MASK = 0x1FFFFF  # 21 bits: the products below stay MicroPython small ints, no allocation
+
+class PassbackTable:
+    """
+    Per-card anti-passback and rate limiting in a fixed-size open-addressing
+    table: a 16-bit UID hash tag, the time of the last granted entry (100 ms
+    units of uptime) and its direction per slot, 7 bytes per slot whatever
+    the number of cards. A lookup probes at most MAX_PROBE slots. Entries
+    older than the longest rule are free again (time-based eviction). If
+    the probed slots are all in use, the oldest one is evicted.
+    A card that went in through an 'in' reader cannot go in again before
+    going out (or before `passback_s`), and a card granted less than
+    `min_interval_ms` ago is refused at any reader.
+    """
+    def __init__(self, size=4096, passback_s=0, min_interval_ms=0):
+        """
+        :param size: Number of slots, rounded up to a power of two. Keep it above the cards active within passback_s.
+        :param passback_s: How long a direction is remembered, 0 disables anti-passback.
+        :param min_interval_ms: Minimum time between two grants of one card, 0 disables rate limiting.
+        """
+        bits = 1
+        while 1 << bits < min(size, MAX_SLOTS):
+            bits += 1
+        self.mask = (1 << bits) - 1
+        self.tags = array('H', bytearray(2 << bits))   # 0 = never used
+        self.times = array('I', bytearray(4 << bits))  # uptime in TICK_MS units
+        self.dirs = bytearray(1 << bits)
+        self.passback = passback_s * 1000 // TICK_MS
+        self.min_interval = (min_interval_ms + TICK_MS - 1) // TICK_MS
+        self.horizon = max(self.passback, self.min_interval)
+        self._uptime = 1  # 0 is never a valid time
+        self._last_ticks = time.ticks_ms()
+        self._carry_ms = 0
+        self.passbacks = 0
+        self.rate_limited = 0
+        self.evicted = 0  # entries dropped while still within the horizon
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config.get('PASSBACK_TABLE_SIZE', 4096), config.get('PASSBACK_S', 0),
+                   config.get('RATE_MIN_INTERVAL_MS', 0))
+
+    def now(self):
+        """Uptime in TICK_MS units. Called on every decision and from stats(), which keeps ticks_ms wraps out."""
+        ticks = time.ticks_ms()
+        elapsed = time.ticks_diff(ticks, self._last_ticks) + self._carry_ms
+        self._last_ticks = ticks
+        self._uptime += elapsed // TICK_MS
+        self._carry_ms = elapsed % TICK_MS
+        return self._uptime
+
+    @staticmethod
+    def _hash(uid):
+        """Two independent 21-bit FNV-style hashes: (slot hash, tag hash)."""
+        a = 0x1505
+        c = 0x3A5C7
+        for b in uid:
+            a = ((a ^ b) * 403) & HASH_MASK
+            c = ((c ^ b) * 311) & HASH_MASK
+        a ^= a >> 10
+        a = (a * 403) & HASH_MASK
+        c ^= c >> 10
+        c = (c * 311) & HASH_MASK
+        return a ^ a >> 9, (c ^ c >> 9) & 0xFFFF or 1
+
+    def _slot(self, h, tag, now):
+        """Slot of the card (hash h, tag), or the slot to put it in. Returns (slot, found)."""
+        tags, times = self.tags, self.times
+        free = -1
+        oldest = -1
+        for i in range(MAX_PROBE):
+            slot = (h + i) & self.mask
+            t = tags[slot]
+            if t == tag:
+                return slot, True
+            if t == 0:
+                return (free if free >= 0 else slot), False  # never used: the card is not further on
+            if free < 0:
+                if now - times[slot] >= self.horizon:
+                    free = slot
+                elif oldest < 0 or times[slot] < times[oldest]:
+                    oldest = slot
+        if free >= 0:
+            return free, False
+        self.evicted += 1
+        return oldest, False
+
+    def admit(self, uid, direction=None):
+        """
+        Checks a card that the access rules let through and records it when
+        it passes. `direction` is the reader direction, 'in', 'out' or None.
+        Returns GRANTED, PASSBACK or RATE.
+        """
+        if not self.horizon:
+            return GRANTED
+        now = self.now()
+        code = DIRECTIONS.get(direction, 0)
+        h, tag = self._hash(uid)
+        slot, found = self._slot(h, tag, now)
+        if found:
+            age = now - self.times[slot]
+            if age < self.min_interval:
+                self.rate_limited += 1
+                return RATE
+            if code and code == self.dirs[slot] and age < self.passback:
+                self.passbacks += 1
+                return PASSBACK
+        self.tags[slot] = tag
+        self.times[slot] = now
+        if code or not found:
+            self.dirs[slot] = code  # a reader without direction keeps the last known one
+        return GRANTED
+
+    def forget(self, uid):
+        """Clears the state of a card, e.g. after a manual override at the door."""
+        h, tag = self._hash(uid)
+        slot, found = self._slot(h, tag, self.now())
+        if found:
+            self.times[slot] = 0
+            self.dirs[slot] = 0
+
+    def clear(self):
+        for i in range(self.mask + 1):
+            self.tags[i] = 0
+
+    def stats(self):
+        self.now()
+        return {'slots': self.mask + 1, 'passbacks': self.passbacks,
+                'rate_limited': self.rate_limited, 'evicted': self.evicted}
@@ -0,0 +1,198 @@
+import time
+import uasyncio as asyncio # type: ignore
+from array import array
+
+# Per-task counters, kept in one array('I') each. All but _MAX_US count
+# from boot (modulo 2**32); a window is the difference with its start.
+_RESUMES = 0  # times the task was resumed by the event loop
+_BUSY_US = 1  # wall time spent inside the task
+_MAX_US = 2   # longest single resume in the window
+_SLOW = 3     # resumes longer than slow_us
+_BLAMED = 4   # loop lag spikes that happened while this was the longest resume
+_FIELDS = 5
+_COUNTERS = (_RESUMES, _BUSY_US, _SLOW, _BLAMED)
+_MASK = 0xFFFFFFFF
+
+_active = None  # Profiler of the running application, used by top()
+
+class _Profiled:
+    """
+    Coroutine wrapper that times every resume of the wrapped coroutine. It
+    forwards send/throw/close, so the event loop schedules it like the
+    coroutine itself.
+    """
+    def __init__(self, profiler, stats, coro):
+        self.profiler = profiler
+        self.stats = stats
+        self.coro = coro
+
+    def send(self, value):
+        start = time.ticks_us()
+        try:
+            return self.coro.send(value)
+        finally:
+            self.profiler._record(self.stats, time.ticks_diff(time.ticks_us(), start))
+
+    def throw(self, *args):
+        start = time.ticks_us()
+        try:
+            return self.coro.throw(*args)
+        finally:
+            self.profiler._record(self.stats, time.ticks_diff(time.ticks_us(), start))
+
+    def close(self):
+        return self.coro.close()
+
+    def __await__(self):
+        return self
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self.send(None)
+
+class Profiler:
+    """
+    Finds the tasks that starve the shared uasyncio loop. A lag probe measures
+    how much later than scheduled it wakes up, and tasks wrapped with wrap()
+    have the wall time of each resume accounted. A lag spike is blamed on the
+    task with the longest resume since the probe went to sleep.
+    Counters cover the window since the last reset(). Other readers (the
+    telemetry) take their own differences of totals() and leave the window alone.
+    """
+    def __init__(self, lag_probe_ms=100, slow_us=20000, enabled=True):
+        self.lag_probe_ms = lag_probe_ms
+        self.slow_us = slow_us
+        self.enabled = enabled
+        self.tasks = {}  # name -> array('I') of per-task counters
+        self._start = {}  # name -> array('I') of the counters when the window started
+
+        self.lag_max = 0      # in the window
+        self.lag_peak = 0     # since the last peak() call
+        self.lag_total = 0    # the lag sums count from boot
+        self.lag_samples = 0
+        self.lag_spikes = 0
+        self._lag_start = (0, 0, 0)
+
+        self._worst_us = 0  # longest resume since the lag probe went to sleep
+        self._worst = None
+        self.started = time.ticks_ms()
+        self.running = False
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config.get('TELEMETRY_LAG_PROBE_MS', 100), config.get('PROFILE_SLOW_MS', 20) * 1000,
+                   bool(config.get('PROFILE_TASKS', 1)))
+
+    def wrap(self, name, coro):
+        """Returns coro with its resumes accounted under `name`, or coro itself when disabled."""
+        if not self.enabled:
+            return coro
+        stats = self.tasks.get(name)
+        if stats is None:
+            stats = self.tasks[name] = array('I', [0] * _FIELDS)
+            self._start[name] = array('I', [0] * _FIELDS)
+        return _Profiled(self, stats, coro)
+
+    def _record(self, stats, elapsed):
+        stats[_RESUMES] += 1
+        stats[_BUSY_US] += elapsed
+        if elapsed > stats[_MAX_US]:
+            stats[_MAX_US] = elapsed
+        if elapsed > self.slow_us:
+            stats[_SLOW] += 1
+        if elapsed > self._worst_us:
+            self._worst_us = elapsed
+            self._worst = stats
+
+    async def run(self):
+        """The lag probe task, start it with asyncio.create_task()."""
+        global _active
+        _active = self
+        self.running = True
+        while self.running:
+            self._worst_us = 0
+            self._worst = None
+            start = time.ticks_ms()
+            await asyncio.sleep_ms(self.lag_probe_ms)
+            lag = time.ticks_diff(time.ticks_ms(), start) - self.lag_probe_ms
+            if lag < 0:
+                lag = 0
+            self.lag_total += lag
+            self.lag_samples += 1
+            if lag > self.lag_max:
+                self.lag_max = lag
+            if lag > self.lag_peak:
+                self.lag_peak = lag
+            if lag * 1000 > self.slow_us:
+                self.lag_spikes += 1
+                if self._worst is not None:
+                    self._worst[_BLAMED] += 1
+
+    def stop(self):
+        self.running = False
+
+    def lag(self):
+        """Average and worst loop lag (ms) and spikes over slow_us in the window."""
+        total, samples, spikes = self._lag_start
+        samples = self.lag_samples - samples
+        return {'avg': (self.lag_total - total) // samples if samples else 0,
+                'max': self.lag_max, 'spikes': self.lag_spikes - spikes}
+
+    def peak(self):
+        """Worst loop lag (ms) since the last call, for a reader with its own interval."""
+        peak, self.lag_peak = self.lag_peak, 0
+        return peak
+
+    def totals(self):
+        """
+        Counters since boot: {"lag": (total ms, samples, spikes), "tasks": {name:
+        (resumes, busy_us, slow, blamed)}}, task counters modulo 2**32.
+        """
+        return {'lag': (self.lag_total, self.lag_samples, self.lag_spikes),
+                'tasks': {name: tuple(stats[i] for i in _COUNTERS) for name, stats in self.tasks.items()}}
+
+    def top(self, n=5):
+        """The n tasks with the most busy time in the window, busiest first."""
+        elapsed = time.ticks_diff(time.ticks_ms(), self.started)
+        rows = []
+        for name, stats in self.tasks.items():
+            start = self._start[name]
+            busy = (stats[_BUSY_US] - start[_BUSY_US]) & _MASK
+            rows.append({'task': name, 'resumes': (stats[_RESUMES] - start[_RESUMES]) & _MASK, 'busy_ms': busy // 1000,
+                         'share': busy // 10 // elapsed if elapsed > 0 else 0,  # percent
+                         'max_ms': stats[_MAX_US] // 1000, 'slow': (stats[_SLOW] - start[_SLOW]) & _MASK,
+                         'blamed': (stats[_BLAMED] - start[_BLAMED]) & _MASK})
+        rows.sort(key=lambda row: -row['busy_ms'])
+        return rows[:n]
+
+    def report(self, n=5):
+        return {'window_ms': time.ticks_diff(time.ticks_ms(), self.started), 'lag_ms': self.lag(), 'top': self.top(n)}
+
+    def reset(self):
+        """Starts a new window."""
+        for name, stats in self.tasks.items():
+            start = self._start[name]
+            for i in _COUNTERS:
+                start[i] = stats[i]
+            stats[_MAX_US] = 0
+        self.lag_max = 0
+        self._lag_start = (self.lag_total, self.lag_samples, self.lag_spikes)
+        self.started = time.ticks_ms()
+
+    def print_top(self, n=5):
+        lag = self.lag()
+        print("window {} ms, loop lag avg {} ms, max {} ms, {} spikes".format(
+            time.ticks_diff(time.ticks_ms(), self.started), lag['avg'], lag['max'], lag['spikes']))
+        print("{:<24}{:>9}{:>10}{:>7}{:>8}{:>6}{:>8}".format('task', 'resumes', 'busy_ms', '%', 'max_ms', 'slow', 'blamed'))
+        for row in self.top(n):
+            print("{:<24}{:>9}{:>10}{:>7}{:>8}{:>6}{:>8}".format(
+                row['task'], row['resumes'], row['busy_ms'], row['share'], row['max_ms'], row['slow'], row['blamed']))
+
+def top(n=5):
+    """REPL helper: prints the busiest tasks of the running application."""
+    if _active is None:
+        print("Profiler is not running.")
+        return
+    _active.print_top(n)
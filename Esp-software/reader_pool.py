@@ -0,0 +1,238 @@
+import time
+import uasyncio as asyncio # type: ignore
+import NFC_PN532 as nfc # type: ignore
+from machine import Pin # type: ignore
+import logger
+
+log = logger.get('readers')
+
+class Reader:
+    """One PN532 (antenna) of a ReaderPool."""
+    def __init__(self, name, cs, priority=1, max_targets=1, irq=None, direction=None):
+        self.name = name
+        self.direction = direction  # 'in', 'out' or None, for anti-passback
+        self.cs = cs
+        self.irq = irq
+        self.priority = max(1, priority)
+        self.max_targets = max_targets
+        self.pn532 = None
+        self.connected = False
+        self.last_uids = []  # UIDs of the last poll that found cards
+        self.armed = False  # InAutoPoll running on the chip
+
+        self._credit = 0  # weighted round-robin state
+
+        # Throughput statistics
+        self.polls = 0
+        self.reads = 0
+        self.busy_ms = 0
+
+    def stats(self, elapsed_ms):
+        return {
+            'polls': self.polls,
+            'reads': self.reads,
+            'polls_per_s': self.polls * 1000 / elapsed_ms if elapsed_ms else 0,
+            'reads_per_min': self.reads * 60000 / elapsed_ms if elapsed_ms else 0,
+            'avg_poll_ms': self.busy_ms / self.polls if self.polls else 0,
+            'bus_share': self.busy_ms / elapsed_ms if elapsed_ms else 0
+        }
+
+class ReaderPool:
+    """
+    Drives several PN532 chips sharing one SPI bus, each with its own CS pin.
+    Readers are polled one at a time (never two CS lines low at once) using a
+    smooth weighted round-robin: a reader with priority 3 is polled three times
+    for every poll of a priority 1 reader, equal priorities give plain round-robin.
+    In autopoll mode the chips scan on their own (InAutoPoll) and the host only
+    collects results, woken by the IRQ line where one is wired.
+    """
+    def __init__(self, spi, readers, poll_timeout=50, autopoll_period=2, autopoll_types=(nfc.AUTOPOLL_MIFARE,), trace=False):
+        """
+        :param spi: The shared SPI bus.
+        :param readers: List of dicts with 'name', 'cs' (GPIO number or pin object),
+                        optional 'priority', 'max_targets' (1 or 2), 'irq' (GPIO number or pin object)
+                        and 'direction' ('in' or 'out').
+        :param poll_timeout: InListPassiveTarget timeout per poll, in ms.
+        :param autopoll_period: InAutoPoll scan period, in units of 150 ms.
+        :param autopoll_types: InAutoPoll target types.
+        :param trace: Enable PN532 command tracing on every driver.
+        """
+        self.spi = spi
+        self.poll_timeout = poll_timeout
+        self.autopoll_period = autopoll_period
+        self.autopoll_types = tuple(autopoll_types)
+        self.trace = trace
+        self.readers = []
+        self._irq_flag = None
+        # Deselect every chip before talking to any of them.
+        for r in readers:
+            cs = r['cs']
+            if isinstance(cs, int):
+                cs = Pin(cs, Pin.OUT, value=1)
+            else:
+                cs.on()
+            irq = r.get('irq')
+            if isinstance(irq, int):
+                irq = Pin(irq, Pin.IN) if irq >= 0 else None
+            self.readers.append(Reader(r.get('name', str(len(self.readers))), cs,
+                                       r.get('priority', 1), r.get('max_targets', 1), irq, r.get('direction')))
+        self.current = None  # reader of the last poll
+        self.started = time.ticks_ms()
+
+    @classmethod
+    def from_config(cls, spi, config):
+        readers = config.get('NFC_READERS') or [{'name': 'main', 'cs': config['NFC_CS_GPIO'], 'irq': config.get('NFC_IRQ_GPIO', -1)}]
+        return cls(spi, readers, config.get('NFC_READ_TIMEOUT', 50),
+                   config.get('NFC_AUTOPOLL_PERIOD', 2), config.get('NFC_AUTOPOLL_TYPES', [nfc.AUTOPOLL_MIFARE]),
+                   bool(config.get('NFC_TRACE', 0)))
+
+    def get(self, name):
+        for reader in self.readers:
+            if reader.name == name:
+                return reader
+        return None
+
+    def init_drivers(self, wakeup=True):
+        """
+        Creates the PN532 driver of every reader that does not have one yet.
+        With wakeup=False the chips are not woken up, await wakeup() instead.
+        """
+        for reader in self.readers:
+            if reader.pn532 is None:
+                reader.pn532 = nfc.PN532(self.spi, reader.cs, irq=reader.irq, wakeup=wakeup)
+                if self.trace:
+                    reader.pn532.enable_trace()
+
+    async def wakeup(self, settle_ms=1000):
+        """
+        Wakes every chip the way PN532._wakeup() does (a dummy byte with CS
+        low), but sleeps without blocking the loop and waits for all readers
+        at once. Run it before the bus arbiter gets any job for these readers.
+        """
+        await asyncio.sleep_ms(settle_ms)
+        for reader in self.readers:
+            reader.cs.off()
+            await asyncio.sleep_ms(2)
+            try:
+                self.spi.write(bytearray([0x00]))
+            except OSError as e:  # connecting fails too, the supervisor restarts that reader
+                log.error("Wakeup of PN532 %s failed: %s", reader.name, e)
+            await asyncio.sleep_ms(2)
+            reader.cs.on()
+        await asyncio.sleep_ms(settle_ms)
+
+    def wake(self, reader):
+        """Bus job: wakes one chip after its driver was recreated, let it settle ~1 s before using it."""
+        reader.cs.off()
+        time.sleep_ms(2)
+        self.spi.write(bytearray([0x00]))
+        time.sleep_ms(2)
+        reader.cs.on()
+
+    def next_reader(self):
+        """Picks the connected reader to poll next, or None if none is connected."""
+        total = 0
+        best = None
+        for reader in self.readers:
+            if not reader.connected:
+                continue
+            reader._credit += reader.priority
+            total += reader.priority
+            if best is None or reader._credit > best._credit:
+                best = reader
+        if best is not None:
+            best._credit -= total
+        return best
+
+    def poll(self):
+        """
+        Polls the next reader once.
+        Returns (reader, uids), uids is a list (empty if no card was found).
+        Driver exceptions propagate, `current` tells which reader raised them.
+        """
+        reader = self.next_reader()
+        self.current = reader
+        if reader is None:
+            return None, []
+        start = time.ticks_ms()
+        try:
+            if reader.max_targets > 1:
+                uids = reader.pn532.read_passive_targets(reader.max_targets, timeout=self.poll_timeout)
+            else:
+                uid = reader.pn532.read_passive_target(timeout=self.poll_timeout)
+                uids = [uid] if uid is not None else []
+        finally:
+            reader.polls += 1
+            reader.busy_ms += time.ticks_diff(time.ticks_ms(), start)
+        reader.reads += len(uids)
+        return reader, uids
+
+    def autopoll(self):
+        """
+        Autopoll counterpart of poll(): arms InAutoPoll on connected readers that
+        are not scanning yet and collects the result of the first one that found
+        a card. Returns (reader, uids) like poll(), (None, []) if nothing was found.
+        """
+        for reader in self.readers:
+            if not reader.connected:
+                continue
+            self.current = reader
+            start = time.ticks_ms()
+            try:
+                if not reader.armed:
+                    reader.armed = reader.pn532.start_autopoll(self.autopoll_period, self.autopoll_types)
+                elif reader.pn532.is_ready():
+                    reader.armed = False
+                    uids = reader.pn532.read_autopoll()
+                    reader.polls += 1
+                    reader.reads += len(uids)
+                    return reader, uids
+            finally:
+                reader.busy_ms += time.ticks_diff(time.ticks_ms(), start)
+        return None, []
+
+    async def wait_autopoll(self, timeout_ms):
+        """
+        Sleeps until a reader raises its IRQ line or timeout_ms passed. Without
+        IRQ lines this is a plain sleep and autopoll() checks the status over SPI.
+        """
+        if self._irq_flag is None and hasattr(asyncio, 'ThreadSafeFlag') \
+                and self.readers and all(r.irq is not None for r in self.readers):
+            self._irq_flag = asyncio.ThreadSafeFlag()
+            for reader in self.readers:
+                reader.irq.irq(trigger=Pin.IRQ_FALLING, handler=lambda pin: self._irq_flag.set())
+        if self._irq_flag is None:
+            await asyncio.sleep_ms(timeout_ms)
+            return
+        try:
+            await asyncio.wait_for_ms(self._irq_flag.wait(), timeout_ms)
+        except asyncio.TimeoutError:
+            pass
+
+    def probe(self, reader):
+        """Firmware probe of one reader. Stops its InAutoPoll first, the next autopoll() re-arms it."""
+        if reader.armed:
+            reader.armed = False
+            reader.pn532.abort()
+        return reader.pn532.get_firmware_version()
+
+    def set_trace(self, enabled):
+        """Turns PN532 command tracing on (with fresh counters) or off for every reader."""
+        self.trace = enabled
+        for reader in self.readers:
+            if reader.pn532 is not None:
+                reader.pn532.enable_trace(enabled)
+
+    def trace_stats(self):
+        """Per-antenna PN532 command traces, None for readers not being traced."""
+        return {reader.name: reader.pn532.trace_stats() if reader.pn532 else None for reader in self.readers}
+
+    def stats(self):
+        """Per-antenna throughput since the pool was created or reset."""
+        elapsed = time.ticks_diff(time.ticks_ms(), self.started)
+        return {reader.name: reader.stats(elapsed) for reader in self.readers}
+
+    def reset_stats(self):
+        self.started = time.ticks_ms()
+        for reader in self.readers:
+            reader.polls = reader.reads = reader.busy_ms = 0
@@ -0,0 +1,171 @@
+import os
+import struct
+import time
+import ujson
+import uasyncio as asyncio # type: ignore
+import logger
+from spi_arbiter import PRIORITY_HEALTH
+
+log = logger.get('bench')
+
+EVENT = {"seq": 123456, "uid_dec": "86-225-141-90", "code": "0042", "antenna": "main",
+         "timestamp": 1760000000, "ts_ms": 1760000000123, "time_sync": "ok", "decided_by": "local"}
+EVENT_BINARY = '<IQB7sBBB'  # seq, ts_ms, uid length, uid, antenna, time sync, decided by
+BATCH = 50  # CPU-only iterations between two yields
+
+def _spread(samples):
+    """[p50, max] of the samples (us)."""
+    samples = sorted(samples)
+    return [samples[len(samples) // 2], samples[-1]] if samples else None
+
+def _kbps(size, us):
+    return size * 1000 // max(us, 1)  # KB/s with KB = 1000 B
+
+class SelfBenchmark:
+    """
+    Measures the reader in the field: PN532 round trip (get_firmware_version),
+    SPI throughput, flash write and read speed, JSON vs binary event
+    encoding, NeoPixel np.write() and whitelist lookup time.
+    Runs at low priority: bus jobs are PRIORITY_HEALTH jobs of the arbiter,
+    which wait for the bus to be idle, and the task yields after every
+    sample, so card reads go first. Results are in us unless named otherwise.
+    """
+    def __init__(self, arbiter, pool, np, samples=20, flash_kb=16, flash_file='bench.tmp'):
+        """
+        :param arbiter: The BusArbiter, the SPI bus is only used through it.
+        :param pool: The ReaderPool.
+        :param np: The NeoPixel object of the LedController.
+        """
+        self.arbiter = arbiter
+        self.pool = pool
+        self.np = np
+        self.samples = samples
+        self.flash_kb = flash_kb
+        self.flash_file = flash_file
+        self.running = False
+        self.runs = 0
+
+    @classmethod
+    def from_config(cls, config, arbiter, pool, np):
+        return cls(arbiter, pool, np, config.get('BENCH_SAMPLES', 20), config.get('BENCH_FLASH_KB', 16))
+
+    async def _bus(self, fn, *args):
+        """Time (us) of fn(*args) on the bus, queueing for it not included."""
+        def job():
+            start = time.ticks_us()
+            fn(*args)
+            return time.ticks_diff(time.ticks_us(), start)
+        return await self.arbiter.submit(PRIORITY_HEALTH, job)
+
+    async def pn532_rtt(self):
+        result = {}
+        for reader in self.pool.readers:
+            if not reader.connected:
+                result[reader.name] = None
+                continue
+            samples = []
+            for _ in range(self.samples):
+                try:
+                    samples.append(await self._bus(self.pool.probe, reader))
+                except (OSError, RuntimeError):
+                    pass  # counted as lost
+            result[reader.name] = _spread(samples) + [self.samples - len(samples)] if samples else None  # p50, max, lost
+        return result
+
+    async def spi(self):
+        """Raw write throughput with every CS high, no chip listens."""
+        buf = bytearray(4096)
+        best = None
+        for _ in range(max(1, self.samples // 4)):
+            us = await self._bus(self.pool.spi.write, buf)
+            best = us if best is None else min(best, us)
+        return _kbps(len(buf), best)
+
+    async def flash(self):
+        chunk = bytearray(1024)
+        write_us = read_us = 0
+        try:
+            with open(self.flash_file, 'wb') as f:
+                for _ in range(self.flash_kb):
+                    start = time.ticks_us()
+                    f.write(chunk)
+                    write_us += time.ticks_diff(time.ticks_us(), start)
+                    await asyncio.sleep_ms(0)
+                start = time.ticks_us()
+                f.flush()
+                write_us += time.ticks_diff(time.ticks_us(), start)
+            with open(self.flash_file, 'rb') as f:
+                for _ in range(self.flash_kb):
+                    start = time.ticks_us()
+                    f.readinto(chunk)
+                    read_us += time.ticks_diff(time.ticks_us(), start)
+                    await asyncio.sleep_ms(0)
+        finally:
+            try:
+                os.remove(self.flash_file)
+            except OSError:
+                pass
+        return {'write_kbps': _kbps(self.flash_kb * 1024, write_us), 'read_kbps': _kbps(self.flash_kb * 1024, read_us)}
+
+    async def encoding(self):
+        uid = bytes(int(b) for b in EVENT['uid_dec'].split('-'))
+        buf = bytearray(struct.calcsize(EVENT_BINARY))
+        json_us = binary_us = 0
+        for _ in range(self.samples):
+            start = time.ticks_us()
+            for _ in range(BATCH):
+                text = ujson.dumps(EVENT)
+            json_us += time.ticks_diff(time.ticks_us(), start)
+            start = time.ticks_us()
+            for _ in range(BATCH):
+                struct.pack_into(EVENT_BINARY, buf, 0, EVENT['seq'], EVENT['ts_ms'], len(uid), uid, 0, 1, 0)
+            binary_us += time.ticks_diff(time.ticks_us(), start)
+            await asyncio.sleep_ms(0)
+        n = self.samples * BATCH
+        return {'json_ns': json_us * 1000 // n, 'json_bytes': len(text), 'binary_ns': binary_us * 1000 // n, 'binary_bytes': len(buf)}
+
+    async def np_write(self):
+        """np.write() of the current pixels, nothing changes on the ring."""
+        samples = []
+        for _ in range(self.samples):
+            start = time.ticks_us()
+            self.np.write()
+            samples.append(time.ticks_diff(time.ticks_us(), start))
+            await asyncio.sleep_ms(0)
+        return _spread(samples)
+
+    async def whitelist(self, whitelist):
+        """Lookup time of a listed and of an unknown card."""
+        listed = next(iter(whitelist)) if whitelist else EVENT['uid_dec']
+        unknown = '0-0-0-0'
+        result = []
+        for uid in (listed, unknown):
+            total = 0
+            for _ in range(self.samples):
+                start = time.ticks_us()
+                for _ in range(BATCH):
+                    uid in whitelist
+                total += time.ticks_diff(time.ticks_us(), start)
+                await asyncio.sleep_ms(0)
+            result.append(total * 1000 // (self.samples * BATCH))  # ns, a lookup is well below 1 us
+        return {'size': len(whitelist), 'hit_ns': result[0], 'miss_ns': result[1]}
+
+    async def run(self, whitelist):
+        """Runs the whole suite and returns the report."""
+        self.running = True
+        start = time.ticks_ms()
+        report = {}
+        try:
+            for name, step, args in (('pn532_rtt_us', self.pn532_rtt, ()), ('spi_kbps', self.spi, ()),
+                                     ('flash', self.flash, ()), ('encode', self.encoding, ()),
+                                     ('np_write_us', self.np_write, ()), ('whitelist', self.whitelist, (whitelist,))):
+                try:
+                    report[name] = await step(*args)
+                except Exception as e:
+                    report[name] = {'error': str(e)}
+                    log.error("Benchmark %s failed: %s", name, e)
+        finally:
+            self.running = False
+        self.runs += 1
+        report['ms'] = time.ticks_diff(time.ticks_ms(), start)
+        return report
@@ -0,0 +1,95 @@
+import time
+import heapq # type: ignore
+import uasyncio as asyncio # type: ignore
+from micropython import const # type: ignore
+
+# Job priorities, lower runs first
+PRIORITY_READ = const(0)     # card polling and card reads
+PRIORITY_CONTROL = const(1)  # (re)connecting and configuring a reader
+PRIORITY_HEALTH = const(2)   # explicit firmware probes
+
+class BusArbiter:
+    """
+    Owns every PN532 transaction on the SPI bus. Tasks submit jobs (plain
+    functions doing driver calls) with a priority and await their result, a
+    single long-lived task runs them one after another, so a health probe
+    can never land between the frames of a card read.
+    Health probes only run once the bus has been idle for `idle_ms`, or after
+    they have been deferred for `max_defer_ms`.
+    """
+    def __init__(self, idle_ms=20, max_defer_ms=5000):
+        self.idle_ms = idle_ms
+        self.max_defer_ms = max_defer_ms
+        self._queue = []  # heap of [priority, seq, fn, args, queued_at, result, error, done]
+        self._seq = 0
+        self._wake = asyncio.Event()
+        self.last_busy = time.ticks_ms()
+        self.running = False
+
+        # Statistics
+        self.jobs = 0
+        self.probes = 0
+        self.busy_ms = 0
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config.get('SPI_IDLE_MS', 20), config['CONNECTION_CHECK_INTERVAL'] * 1000)
+
+    async def submit(self, priority, fn, *args):
+        """Queues fn(*args) and returns its result, or raises what it raised."""
+        job = [priority, self._seq, fn, args, time.ticks_ms(), None, None, asyncio.Event()]
+        self._seq += 1
+        heapq.heappush(self._queue, job)
+        self._wake.set()
+        await job[7].wait()
+        if job[6] is not None:
+            raise job[6]
+        return job[5]
+
+    def pending(self):
+        return len(self._queue)
+
+    def idle_for(self):
+        """Milliseconds since the last transaction finished."""
+        return time.ticks_diff(time.ticks_ms(), self.last_busy)
+
+    async def run(self):
+        """The bus owner task, start it with asyncio.create_task()."""
+        self.running = True
+        while self.running:
+            if not self._queue:
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+            job = self._queue[0]
+            if job[0] >= PRIORITY_HEALTH and self.idle_for() < self.idle_ms \
+                    and time.ticks_diff(time.ticks_ms(), job[4]) < self.max_defer_ms:
+                # Give pending reads the bus first.
+                await asyncio.sleep_ms(self.idle_ms - self.idle_for())
+                continue
+            heapq.heappop(self._queue)
+            start = time.ticks_ms()
+            try:
+                job[5] = job[2](*job[3])
+            except Exception as e:
+                job[6] = e
+            self.last_busy = time.ticks_ms()
+            self.busy_ms += time.ticks_diff(self.last_busy, start)
+            self.jobs += 1
+            if job[0] >= PRIORITY_HEALTH:
+                self.probes += 1
+            job[7].set()
+            await asyncio.sleep_ms(0)
+
+    def stop(self):
+        self.running = False
+        self._wake.set()
+
+    def stats(self):
+        return {'jobs': self.jobs, 'probes': self.probes, 'busy_ms': self.busy_ms, 'pending': len(self._queue)}
+
+def heartbeat_age(pn532):
+    """Milliseconds since the PN532 last acknowledged a command, None if it never did."""
+    if pn532 is None or pn532.last_ack_ms is None:
+        return None
+    return time.ticks_diff(time.ticks_ms(), pn532.last_ack_ms)
@@ -0,0 +1,113 @@
+import gc
+import time
+import uasyncio as asyncio # type: ignore
+import logger
+
+log = logger.get('boot')
+
+IMPORTS = {}  # module -> ms spent importing it (and what it imports first), see timed_import()
+
+class _TimedImport:
+    """Context manager recording how long the import inside it takes."""
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.ticks_ms()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        IMPORTS[self.name] = time.ticks_diff(time.ticks_ms(), self.start)
+        return False
+
+def timed_import(name):
+    """with timed_import('buzzer'): from buzzer import BuzzerController  records the import time of a module."""
+    return _TimedImport(name)
+
+class _Timed:
+    """Context manager recording a synchronous boot phase."""
+    def __init__(self, boot, name):
+        self.boot = boot
+        self.name = name
+
+    def __enter__(self):
+        self.boot._begin(self.name)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.boot._end(self.name, exc_type is None)
+        return False
+
+class BootSequence:
+    """
+    Runs the boot phases (network, NFC, MQTT...) side by side and records when
+    each one started and how long it took, relative to the start of boot.
+    A failing async phase is logged and reported, it does not stop the others.
+    With `profile` set the report also lists the import time of every module.
+    """
+    def __init__(self, started=None, profile=False):
+        """:param started: ticks_ms boot is counted from, now by default."""
+        self.started = time.ticks_ms() if started is None else started
+        self.profile = profile
+        self.phases = {}  # name -> [start_ms, duration_ms or None while running, ok]
+        self.milestones = {}  # name -> ms since boot
+        self.info = {}  # extra report fields, e.g. where the config came from
+        self.heap_peak = 0  # most heap in use seen at a phase end or milestone
+
+    def _begin(self, name):
+        self.phases[name] = [time.ticks_diff(time.ticks_ms(), self.started), None, False]
+
+    def _sample_heap(self):
+        used = gc.mem_alloc()
+        if used > self.heap_peak:
+            self.heap_peak = used
+
+    def _end(self, name, ok):
+        self._sample_heap()
+        phase = self.phases[name]
+        phase[1] = time.ticks_diff(time.ticks_ms(), self.started) - phase[0]
+        phase[2] = ok
+        log.info("Boot phase %s %s after %d ms", name, "done" if ok else "FAILED", phase[1])
+
+    def timed(self, name):
+        """with boot.timed('config'): ... records a synchronous phase."""
+        return _Timed(self, name)
+
+    async def phase(self, name, coro):
+        """Awaits coro as the phase `name`. Returns its result, or None if it raised."""
+        self._begin(name)
+        try:
+            result = await coro
+        except Exception as e:
+            log.error("Boot phase %s raised: %s", name, e)
+            self._end(name, False)
+            return None
+        self._end(name, result is not False)
+        return result
+
+    def start(self, name, coro):
+        """Runs the phase in its own task so it overlaps with the others. Await the task for the result."""
+        return asyncio.create_task(self.phase(name, coro))
+
+    def mark(self, name):
+        """Records a milestone, e.g. the moment the first card could be read."""
+        self._sample_heap()
+        self.milestones[name] = time.ticks_diff(time.ticks_ms(), self.started)
+        log.info("Boot milestone %s at %d ms", name, self.milestones[name])
+
+    def report(self):
+        """{'phases': {name: {'start', 'ms', 'ok'}}, 'milestones': {...}, 'imports_ms', 'heap_peak', 'total_ms'}, plus 'imports' when profiling."""
+        self._sample_heap()
+        report = {
+            'phases': {name: {'start': p[0], 'ms': p[1], 'ok': p[2]} for name, p in self.phases.items()},
+            'milestones': self.milestones,
+            'imports_ms': sum(IMPORTS.values()),
+            'heap_peak': self.heap_peak,
+            'total_ms': time.ticks_diff(time.ticks_ms(), self.started),
+        }
+        report.update(self.info)
+        if self.profile:
+            report['imports'] = IMPORTS
+            for name, ms in sorted(IMPORTS.items(), key=lambda item: -item[1]):
+                log.info("import %s: %d ms", name, ms)
+        return report
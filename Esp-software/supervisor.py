@@ -0,0 +1,175 @@
+import time
+import uasyncio as asyncio # type: ignore
+import logger
+
+log = logger.get('supervisor')
+
+# Subsystem states
+OK = 'ok'
+DOWN = 'down'      # failed, restarted with exponential backoff
+OPEN = 'open'      # circuit open after too many failed restarts, one trial every breaker_open_s
+
+class Subsystem:
+    """A supervised part of the reader: how to tell it works and how to restart it."""
+    def __init__(self, name, check, restart, grace_ms=0, critical=False):
+        self.name = name
+        self.check = check          # () -> bool, True while it works
+        self.restart = restart      # async (attempt) -> bool, True if it works again; None: watched only
+        self.grace_ms = grace_ms    # down this long before the first restart, lets it heal on its own
+        self.critical = critical    # down longer than max_down_s stops feeding the watchdog
+        self.state = OK
+        self.down_since = None
+        self.next_try = None
+        self.failures = 0           # failed restarts in a row
+        self.restarts = 0
+        self.recoveries = 0
+        self.last_recovery_ms = None
+        self.max_recovery_ms = 0
+        self.task = None            # restart in progress
+
+class Supervisor:
+    """
+    Restarts a failed subsystem (MQTT client, network interface, PN532
+    driver...) instead of the whole reader. Each subsystem is checked every
+    `interval_ms`; once it has been down for its grace period it is restarted,
+    then again after an exponential backoff (backoff_ms doubling up to
+    backoff_max_ms). After `breaker_failures` failed restarts in a row the
+    circuit opens: one trial every `breaker_open_s` only. The restarts run in
+    their own tasks, so a slow one does not hold up the checks or the others.
+    The hardware watchdog is fed from the check loop. It resets the board only
+    if the event loop stops, or if a critical subsystem (the readers: local
+    access decisions depend on them) stays down longer than `max_down_s`.
+    """
+    def __init__(self, interval_ms=1000, backoff_ms=1000, backoff_max_ms=60000, breaker_failures=5,
+                 breaker_open_s=300, restart_timeout_s=30, max_down_s=600, wdt=None):
+        """
+        :param wdt: A started machine.WDT (or anything with feed()), None for no watchdog.
+        """
+        self.interval_ms = interval_ms
+        self.backoff_ms = backoff_ms
+        self.backoff_max_ms = backoff_max_ms
+        self.breaker_failures = breaker_failures
+        self.breaker_open_ms = breaker_open_s * 1000
+        self.restart_timeout_ms = restart_timeout_s * 1000
+        self.max_down_ms = max_down_s * 1000
+        self.wdt = wdt
+        self.subsystems = {}
+        self.running = False
+
+    @classmethod
+    def from_config(cls, config):
+        """The watchdog is not armed here, see start_watchdog()."""
+        return cls(config.get('SUPERVISOR_INTERVAL_MS', 1000), config.get('SUPERVISOR_BACKOFF_MS', 1000),
+                   config.get('SUPERVISOR_BACKOFF_MAX_S', 60) * 1000, config.get('SUPERVISOR_BREAKER_FAILURES', 5),
+                   config.get('SUPERVISOR_BREAKER_OPEN_S', 300), config.get('SUPERVISOR_RESTART_TIMEOUT_S', 30),
+                   config.get('SUPERVISOR_MAX_DOWN_S', 600))
+
+    def start_watchdog(self, timeout_ms):
+        """
+        Arms machine.WDT (nothing if timeout_ms is 0), fed from then on by run().
+        A started WDT cannot be stopped, so call it once the hardware is up:
+        a board that halts on a failed init must stay at the REPL, not reset in a loop.
+        """
+        if timeout_ms > 0 and self.wdt is None:
+            from machine import WDT # type: ignore
+            self.wdt = WDT(timeout=timeout_ms)
+
+    def add(self, name, check, restart, grace_ms=0, critical=False):
+        """Supervises a subsystem, see Subsystem. Returns it."""
+        sub = self.subsystems[name] = Subsystem(name, check, restart, grace_ms, critical)
+        return sub
+
+    def restart_now(self, name):
+        """Restarts a subsystem at the next check even if it looks fine, e.g. after its config changed."""
+        sub = self.subsystems[name]
+        if sub.task is None and sub.restart is not None:
+            sub.task = asyncio.create_task(self._restart(sub))
+
+    def _healthy(self, sub):
+        try:
+            return sub.check()
+        except Exception as e:
+            log.error("Check of %s failed: %s", sub.name, e)
+            return False
+
+    async def _restart(self, sub):
+        sub.restarts += 1
+        attempt = sub.failures + 1
+        log.warning("Restarting %s (attempt %d)", sub.name, attempt)
+        try:
+            ok = await asyncio.wait_for_ms(sub.restart(attempt), self.restart_timeout_ms)
+        except Exception as e:  # including the timeout
+            log.error("Restart of %s failed: %s", sub.name, e)
+            ok = False
+        now = time.ticks_ms()
+        if ok and self._healthy(sub):
+            self._recovered(sub, now)
+        else:
+            sub.failures += 1
+            if sub.failures >= self.breaker_failures:
+                if sub.state != OPEN:
+                    log.error("%s failed %d restarts, circuit open for %d s", sub.name, sub.failures, self.breaker_open_ms // 1000)
+                sub.state = OPEN
+                delay = self.breaker_open_ms
+            else:
+                sub.state = DOWN
+                delay = min(self.backoff_ms << (sub.failures - 1), self.backoff_max_ms)
+            sub.next_try = time.ticks_add(now, delay)
+        sub.task = None
+
+    def _recovered(self, sub, now):
+        if sub.down_since is not None:
+            elapsed = time.ticks_diff(now, sub.down_since)
+            sub.recoveries += 1
+            sub.last_recovery_ms = elapsed
+            sub.max_recovery_ms = max(sub.max_recovery_ms, elapsed)
+            log.info("%s recovered after %d ms", sub.name, elapsed)
+        sub.state = OK
+        sub.down_since = None
+        sub.next_try = None
+        sub.failures = 0
+
+    def step(self):
+        """One round of checks. Returns False when the watchdog must not be fed."""
+        now = time.ticks_ms()
+        feed = True
+        for sub in self.subsystems.values():
+            if sub.task is not None:
+                continue  # restart in progress
+            if self._healthy(sub):
+                if sub.down_since is not None:
+                    self._recovered(sub, now)
+                continue
+            if sub.down_since is None:
+                sub.down_since = now
+                sub.state = DOWN
+                sub.next_try = time.ticks_add(now, sub.grace_ms)
+                log.warning("%s is down", sub.name)
+            if sub.critical and time.ticks_diff(now, sub.down_since) > self.max_down_ms:
+                feed = False
+            if sub.restart is not None and time.ticks_diff(now, sub.next_try) >= 0:
+                sub.task = asyncio.create_task(self._restart(sub))
+        return feed
+
+    async def run(self):
+        """The check loop, start it with asyncio.create_task() once the subsystems are up."""
+        self.running = True
+        starved = False
+        while self.running:
+            if self.step():
+                if self.wdt:
+                    self.wdt.feed()
+            elif not starved:
+                starved = True
+                log.error("A critical subsystem is down for too long, leaving it to the watchdog.")
+            await asyncio.sleep_ms(self.interval_ms)
+
+    def stop(self):
+        self.running = False
+
+    def stats(self):
+        """Telemetry source: state, failed restarts in a row, restarts, recoveries and recovery times per subsystem."""
+        return {name: {'state': sub.state, 'failures': sub.failures, 'restarts': sub.restarts,
+                       'recoveries': sub.recoveries, 'last_recovery_ms': sub.last_recovery_ms,
+                       'max_recovery_ms': sub.max_recovery_ms}
+                for name, sub in self.subsystems.items()}
@@ -0,0 +1,202 @@
+import gc
+import time
+import uasyncio as asyncio # type: ignore
+from array import array
+import logger
+
+log = logger.get('telemetry')
+
+# Upper bounds (ms) of the latency histogram buckets, the last bucket takes everything above
+LATENCY_BUCKETS = (5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+class Histogram:
+    """Counts values into fixed buckets. Recording a value allocates nothing."""
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = array('I', [0] * (len(bounds) + 1))
+        self.total = 0
+        self.max = 0
+
+    def record(self, value):
+        i = 0
+        for bound in self.bounds:
+            if value <= bound:
+                break
+            i += 1
+        self.counts[i] += 1
+        self.total += 1
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, p):
+        """Upper bound of the bucket holding the p-th percentile (capped at max), None if empty."""
+        if not self.total:
+            return None
+        rank = self.total * p // 100
+        seen = 0
+        for i in range(len(self.counts)):
+            seen += self.counts[i]
+            if seen > rank:
+                return min(self.bounds[i], self.max) if i < len(self.bounds) else self.max
+        return self.max
+
+    def reset(self):
+        for i in range(len(self.counts)):
+            self.counts[i] = 0
+        self.total = 0
+        self.max = 0
+
+    def snapshot(self):
+        return {'n': self.total, 'p50': self.percentile(50), 'p95': self.percentile(95),
+                'max': self.max, 'buckets': list(self.counts)}
+
+def heap_info():
+    """
+    (free bytes of the MicroPython GC heap, largest free block of the ESP-IDF
+    data heap). MicroPython cannot tell the largest free block of its own
+    heap; the IDF one bounds sockets and buffers allocated outside of it.
+    The block size is None where the port has no esp32 module.
+    """
+    largest = None
+    try:
+        import esp32 # type: ignore
+        largest = max(h[2] for h in esp32.idf_heap_info(esp32.HEAP_DATA))
+    except Exception:
+        pass
+    return gc.mem_free(), largest
+
+class Telemetry:
+    """
+    Cheap always-on counters for the reader, published as one compact JSON
+    snapshot every `interval` seconds on TELEMETRY_EVENT.
+    Recording is integer math on preallocated storage, the snapshot dict is
+    only built when publishing. Histograms, the loop lag and the busiest tasks
+    (differences of the profiler.Profiler totals, its window is left to the
+    profile command) cover the last interval, counters are totals since boot.
+    """
+    def __init__(self, interval=60, queue_size=50, profiler=None):
+        self.interval = interval
+        self.profiler = profiler
+
+        # Counters
+        self.taps = 0
+        self.published = 0
+        self.drops = 0
+        self.pn532_errors = 0
+
+        self.feedback_latency = Histogram()  # card detected -> LED/buzzer triggered
+        self.publish_latency = Histogram()   # card detected -> read event published
+
+        # Detection times of the reads waiting in the data queue, oldest first
+        self._pending = array('i', [0] * max(1, queue_size))
+        self._head = 0
+        self._count = 0
+
+        self._last_taps = 0
+        self._last_snapshot = time.ticks_ms()
+        self._uptime_ms = self._last_snapshot  # ticks_ms starts at boot, summed from here on as it wraps after ~12 days
+        self._profile = None  # profiler totals at the last snapshot
+        self.sources = {}  # name -> function returning a value for the snapshot
+        self.running = False
+
+    @classmethod
+    def from_config(cls, config, profiler=None):
+        return cls(config.get('TELEMETRY_INTERVAL', 60), config['MAX_QUEUE_SIZE'], profiler)
+
+    def add_source(self, name, fn):
+        """Registers a value read at snapshot time (queue depth, MQTT reconnects...)."""
+        self.sources[name] = fn
+
+    def tap(self, detected):
+        """Records a card tap detected at ticks_ms `detected`, called once feedback has been triggered."""
+        self.taps += 1
+        self.feedback_latency.record(time.ticks_diff(time.ticks_ms(), detected))
+
+    def read_dropped(self):
+        """The read event of a tap did not fit in the data queue."""
+        self.drops += 1
+
+    def read_queued(self, detected):
+        """The read event of the tap detected at `detected` was queued for publishing."""
+        size = len(self._pending)
+        if self._count == size: # Oldest entry is lost, keep the newest
+            self._head = (self._head + 1) % size
+            self._count -= 1
+        self._pending[(self._head + self._count) % size] = detected
+        self._count += 1
+
+    def published_read(self):
+        """Called when the oldest queued read event has been published."""
+        self.published += 1
+        if not self._count:
+            return
+        detected = self._pending[self._head]
+        self._head = (self._head + 1) % len(self._pending)
+        self._count -= 1
+        self.publish_latency.record(time.ticks_diff(time.ticks_ms(), detected))
+
+    def pn532_error(self):
+        self.pn532_errors += 1
+
+    def snapshot(self, reset=True):
+        """Builds the telemetry dict, by default starting a new interval."""
+        now = time.ticks_ms()
+        elapsed = time.ticks_diff(now, self._last_snapshot)
+        mem_free, largest = heap_info()
+        data = {
+            'uptime': (self._uptime_ms + elapsed) // 1000,
+            'taps': self.taps,
+            'taps_min': (self.taps - self._last_taps) * 60000 // elapsed if elapsed > 0 else 0,
+            'published': self.published,
+            'drops': self.drops,
+            'pn532_errors': self.pn532_errors,
+            'feedback_ms': self.feedback_latency.snapshot(),
+            'publish_ms': self.publish_latency.snapshot(),
+            'mem_free': mem_free,
+            'idf_largest': largest,
+        }
+        totals = None
+        if self.profiler is not None:
+            totals = self.profiler.totals()
+            data['loop_lag_ms'], data['top_tasks'] = self._profile_delta(totals, elapsed, reset)
+        for name, fn in self.sources.items():
+            try:
+                data[name] = fn()
+            except Exception:
+                data[name] = None
+        if reset:
+            self._last_taps = self.taps
+            self._uptime_ms += elapsed
+            self._last_snapshot = now
+            self.feedback_latency.reset()
+            self.publish_latency.reset()
+            self._profile = totals
+        return data
+
+    def _profile_delta(self, totals, elapsed, reset):
+        """Loop lag and the three busiest tasks since the last snapshot, from two profiler totals."""
+        last = self._profile or {'lag': (0, 0, 0), 'tasks': {}}
+        total, samples, spikes = (now - before for now, before in zip(totals['lag'], last['lag']))
+        lag = {'avg': total // samples if samples else 0,
+               'max': self.profiler.peak() if reset else self.profiler.lag_peak, 'spikes': spikes} # type: ignore
+        rows = []
+        for name, counters in totals['tasks'].items():
+            before = last['tasks'].get(name, (0, 0, 0, 0))
+            resumes, busy, slow, blamed = ((now - b) & 0xFFFFFFFF for now, b in zip(counters, before))
+            rows.append({'task': name, 'resumes': resumes, 'busy_ms': busy // 1000,
+                         'share': busy // 10 // elapsed if elapsed > 0 else 0, 'slow': slow, 'blamed': blamed})
+        rows.sort(key=lambda row: -row['busy_ms'])
+        return lag, rows[:3]
+
+    async def run(self, publish):
+        """Publishes a snapshot through publish(data) every interval, start it with asyncio.create_task()."""
+        self.running = True
+        while self.running:
+            await asyncio.sleep(self.interval)
+            try:
+                publish(self.snapshot())
+            except Exception as e:
+                log.error("Telemetry publish failed: %s", e)
+
+    def stop(self):
+        self.running = False
@@ -0,0 +1,161 @@
+import time
+import struct
+import uasyncio as asyncio # type: ignore
+import logger
+
+log = logger.get('time')
+
+# Sync quality carried by events
+SYNC_NONE = 'none'    # never synced since boot, the time comes from the RTC
+SYNC_OK = 'ok'        # synced within TIME_STALE_S
+SYNC_STALE = 'stale'  # the last successful sync is older than TIME_STALE_S
+
+NTP_UNIX_DELTA = 2208988800  # seconds from 1900 (NTP) to 1970 (Unix)
+EPOCH_OFFSET = 946684800 if time.gmtime(0)[0] == 2000 else 0  # Unix seconds at the port's epoch
+MAX_PPM = 1000
+MAX_REBASE_S = 86400  # ticks_diff() only covers ~6 days, rebase well before that
+
+class TimeService:
+    """
+    Millisecond Unix time for events. The time is kept as a base (epoch ms
+    at a ticks_ms value) plus the ticks elapsed since, corrected by the drift
+    of the crystal measured between two NTP syncs. Stamping an event is a
+    ticks_diff and a few integer operations, no syscall and no I/O.
+    NTP runs in the background over a non-blocking UDP socket; a sync sets
+    the base and the RTC (so time.time() stays right for the log).
+    """
+    def __init__(self, host='pool.ntp.org', interval=3600, timeout_ms=1000, retry_s=60, stale_s=10800):
+        """
+        :param interval: Seconds between two syncs.
+        :param timeout_ms: Wait for an NTP answer.
+        :param retry_s: Seconds before retrying a failed sync.
+        :param stale_s: Age of the last sync after which events are flagged stale.
+        """
+        self.host = host
+        self.interval = min(interval, MAX_REBASE_S)
+        self.timeout_ms = timeout_ms
+        self.retry_s = retry_s
+        self.stale_ms = stale_s * 1000
+        self._addr = None
+        self._ticks = time.ticks_ms()
+        self._base = (int(time.time()) + EPOCH_OFFSET) * 1000  # the RTC until the first sync
+        self._ppm = 0         # drift correction, parts per million
+        self._raw = 0         # uncorrected ticks from the last sync to _ticks
+        self._sync_epoch = None
+        self.synced = False
+        self.syncs = 0
+        self.failures = 0
+        self.last_step_ms = 0     # correction applied by the last sync
+        self.last_delay_ms = 0    # round trip of the last sync, minus the server time
+        self.running = False
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config.get('TIME_NTP_HOST', 'pool.ntp.org'), config.get('TIME_SYNC_INTERVAL', 3600),
+                   config.get('TIME_SYNC_TIMEOUT_MS', 1000), config.get('TIME_RETRY_S', 60),
+                   config.get('TIME_STALE_S', 10800))
+
+    def at(self, ticks):
+        """Unix time in ms at a ticks_ms() value, e.g. the moment a card was detected."""
+        d = time.ticks_diff(ticks, self._ticks)
+        return self._base + d + d * self._ppm // 1000000
+
+    def now_ms(self):
+        return self.at(time.ticks_ms())
+
+    def quality(self):
+        if not self.synced:
+            return SYNC_NONE
+        age = self._raw + time.ticks_diff(time.ticks_ms(), self._ticks)
+        return SYNC_OK if age <= self.stale_ms else SYNC_STALE
+
+    def _rebase(self, ticks):
+        d = time.ticks_diff(ticks, self._ticks)
+        self._base += d + d * self._ppm // 1000000
+        self._raw += d
+        self._ticks = ticks
+
+    async def _query(self):
+        """One SNTP exchange. Returns (server receive ms, server transmit ms, ticks sent, ticks received)."""
+        import socket
+        if self._addr is None:
+            self._addr = socket.getaddrinfo(self.host, 123)[0][-1]  # DNS blocks, only once
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.setblocking(False)
+        try:
+            packet = bytearray(48)
+            packet[0] = 0x1B  # LI 0, version 3, client
+            sent = time.ticks_ms()
+            s.sendto(packet, self._addr)
+            while True:
+                try:
+                    msg = s.recv(48)
+                    break
+                except OSError:
+                    if time.ticks_diff(time.ticks_ms(), sent) >= self.timeout_ms:
+                        raise OSError('NTP timeout')
+                    await asyncio.sleep_ms(5)
+            received = time.ticks_ms()
+        finally:
+            s.close()
+        rx_s, rx_f, tx_s, tx_f = struct.unpack('!IIII', msg[32:48])
+        if not tx_s:
+            raise OSError('NTP: empty answer')
+        return ((rx_s - NTP_UNIX_DELTA) * 1000 + (rx_f * 1000 >> 32),
+                (tx_s - NTP_UNIX_DELTA) * 1000 + (tx_f * 1000 >> 32), sent, received)
+
+    async def sync(self):
+        """Queries NTP and sets the clock. Returns True on success."""
+        try:
+            server_rx, server_tx, sent, received = await self._query()
+        except Exception as e:
+            self.failures += 1
+            log.warning("NTP sync with %s failed: %s", self.host, e)
+            return False
+        self._apply(server_rx, server_tx, sent, received)
+        return True
+
+    def _apply(self, server_rx, server_tx, sent, received):
+        """Sets the clock from one NTP exchange and updates the drift estimate."""
+        self.last_delay_ms = max(0, time.ticks_diff(received, sent) - (server_tx - server_rx))
+        measured = server_tx + self.last_delay_ms // 2  # Unix ms at `received`
+        self.last_step_ms = measured - self.at(received)
+        self._rebase(received)
+        if self._sync_epoch is not None and self._raw >= 60000:
+            # Drift of the crystal: what the raw ticks missed since the last sync
+            error = measured - (self._sync_epoch + self._raw)
+            ppm = max(-MAX_PPM, min(MAX_PPM, error * 1000000 // self._raw))
+            self._ppm = ppm if self.syncs < 2 else (self._ppm + ppm) // 2  # the first estimate is taken as is
+        self._base = measured
+        self._raw = 0
+        self._sync_epoch = measured
+        self.synced = True
+        self.syncs += 1
+        self._set_rtc(measured // 1000)
+        log.info("Clock synced, step %d ms, delay %d ms, drift %d ppm", self.last_step_ms, self.last_delay_ms, self._ppm)
+
+    def _set_rtc(self, unix_s):
+        try:
+            from machine import RTC # type: ignore
+            tm = time.gmtime(unix_s - EPOCH_OFFSET)
+            RTC().datetime((tm[0], tm[1], tm[2], tm[6] + 1, tm[3], tm[4], tm[5], 0))
+        except Exception as e:
+            log.error("RTC update failed: %s", e)
+
+    async def run(self):
+        """Resyncs every interval (retry_s after a failure), start it with asyncio.create_task() after the first sync()."""
+        self.running = True
+        ok = self.synced
+        while self.running:
+            await asyncio.sleep(self.interval if ok else min(self.retry_s, self.interval))
+            ok = await self.sync()
+            if not ok:
+                self._rebase(time.ticks_ms())  # keep the ticks difference in range while offline
+
+    def stop(self):
+        self.running = False
+
+    def stats(self):
+        """Telemetry source."""
+        return {'sync': self.quality(), 'syncs': self.syncs, 'failures': self.failures, 'drift_ppm': self._ppm,
+                'step_ms': self.last_step_ms, 'delay_ms': self.last_delay_ms}
@@ -16,8 +16,12 @@ DEFAULT_CONFIG = {
   "MANAGE_WHITELIST_ADD": "add",
   "MANAGE_WHITELIST_REMOVE": "remove",
   "MANAGE_RESET": "reset",
+  "MANAGE_TRACE": "trace",
+  "MANAGE_PROFILE": "profile",
+  "MANAGE_LOG": "log",
   "MAX_QUEUE_SIZE": 50,
   "ERROR_EVENT": "error",
+  "ERROR_SUMMARY_EVENT": "error_summary",
   "LED_COLOR_SUCCESS": [0, 255, 0],
   "MQTT_DELAY": 50,
   "READ_EVENT": "read",
@@ -29,15 +33,22 @@ DEFAULT_CONFIG = {
   ],
   "MANAGE_CONFIG": "configure",
   "LED_WAITING_PULSE_SPEED": 0.1,
+  "LED_FRAME_MS": 20,
   "CLIENT_NAME": "blue",
   "BROKER_ADDR": "192.168.31.70",
   "LED_WAITING_PULSE_ANGLE": 0,
   "CONNECTION_CHECK_INTERVAL": 5,
+  "SPI_IDLE_MS": 20,
   "WIFI_PASSWORD": "opelvectra",
   "CONNECTION_RETRIES": 15,
   "OFFLINE_EVENT": "offline",
   "MQTT_RECONNECT_DELAY": 10,
   "NFC_READ_TIMEOUT": 9,
+  "NFC_POLL_MODE": "loop",
+  "NFC_AUTOPOLL_PERIOD": 2,
+  "NFC_AUTOPOLL_TYPES": [16],
+  "NFC_AUTOPOLL_CHECK_MS": 100,
+  "NFC_TRACE": 0,
   "LED_DIODS_AM": 24,
   "APROVAL_MELODY": [
     [700, 100],
@@ -46,14 +57,28 @@ DEFAULT_CONFIG = {
   "READER_ID_AFFIX": "reader_real",
   "LED_COLOR_WAITING": [0, 50, 100],
   "TELEMETRY_EVENT": "telemetry",
+  "TELEMETRY_INTERVAL": 60,
+  "TELEMETRY_LAG_PROBE_MS": 100,
+  "PROFILE_TASKS": 1,
+  "PROFILE_SLOW_MS": 20,
+  "LOG_LEVEL": "INFO",
+  "LOG_RING_SIZE": 64,
+  "LOG_UART": 0,
+  "ERROR_SUMMARY_INTERVAL": 60,
+  "ERROR_BURST": 5,
+  "ERROR_RATE": 6,
   "LED_COLOR_FAILURE": [255, 0, 0],
   "WHITELIST": ["86-225-141-90"],
+  "MIFARE_KEYS": ["FFFFFFFFFFFF"],
+  "MIFARE_KEY_CACHE_SIZE": 64,
 
   "BUZZER_GPIO": 32,
     "SPI_SCK_GPIO": 14,
     "SPI_MOSI_GPIO": 16,
     "SPI_MISO_GPIO": 15,
     "NFC_CS_GPIO": 13,
+    "NFC_READERS": [],
+    "NFC_IRQ_GPIO": -1,
     "LED_GPIO": 3,  
     "MANAGE_WHITELIST_UPDATE": "update",
 
@@ -64,12 +89,62 @@ DEFAULT_CONFIG = {
     "ETH_POWER": 12,
     "ETH_PHY_ADDR": 1,
 
+    "NETWORK_CHECK_MS": 500,
+    "NETWORK_TIMEOUT_MS": 10000,
+    "NETWORK_FAILBACK_S": 30,
+
+    "TIME_NTP_HOST": "pool.ntp.org",
+    "TIME_SYNC_INTERVAL": 3600,
+    "TIME_SYNC_TIMEOUT_MS": 1000,
+    "TIME_RETRY_S": 60,
+    "TIME_STALE_S": 10800,
+
+    "BOOT_PROFILE": 0,
+
+    "MANAGE_ACCESS": "access",
+    "ACCESS_POLICY_FILE": "access.json",
+    "ACCESS_CARDS_FILE": "access_cards.bin",
+    "ACCESS_TZ_OFFSET_MIN": 0,
+    "PASSBACK_S": 0,
+    "PASSBACK_TABLE_SIZE": 4096,
+    "RATE_MIN_INTERVAL_MS": 0,
+    "AUTH_MODE": "local",
+    "AUTH_DEADLINE_MS": 150,
+    "AUTH_CACHE_S": 30,
+    "AUTH_CACHE_SIZE": 256,
+    "AUTH_REQUEST_EVENT": "auth",
+    "MANAGE_AUTH_REPLY": "auth",
+    "EVENT_HISTORY_SIZE": 100,
+    "EVENT_SEQ_FILE": "event_seq",
+    "EVENT_SEQ_BLOCK": 1000,
+    "MANAGE_RETRANSMIT": "retransmit",
+    "AUDIT_DIR": "audit",
+    "AUDIT_SEGMENT_RECORDS": 4096,
+    "AUDIT_SEGMENTS": 8,
+    "AUDIT_FLUSH_MS": 1000,
+    "AUDIT_QUERY_CHUNK": 32,
+    "AUDIT_QUERY_LIMIT": 2000,
+    "MANAGE_AUDIT": "audit",
+    "MANAGE_BENCHMARK": "benchmark",
+    "BENCH_SAMPLES": 20,
+    "BENCH_FLASH_KB": 16,
+
+    "SUPERVISOR_INTERVAL_MS": 1000,
+    "SUPERVISOR_BACKOFF_MS": 1000,
+    "SUPERVISOR_BACKOFF_MAX_S": 60,
+    "SUPERVISOR_BREAKER_FAILURES": 5,
+    "SUPERVISOR_BREAKER_OPEN_S": 300,
+    "SUPERVISOR_RESTART_TIMEOUT_S": 30,
+    "SUPERVISOR_MAX_DOWN_S": 600,
+    "SUPERVISOR_WDT_MS": 60000,
+
     "PREFERED_NETWORK": "ethernet"  
 }
 
 
 
-def connect_wifi(SSID='prohidna', password='12345678', log=print):
+def start_wifi(SSID='prohidna', password='12345678', log=print):
+    """Starts connecting the WiFi station without waiting, returns the interface or None."""
     import network # type: ignore
     log(f"WIFI: Connecting to WiFi SSID: {SSID}")
 
@@ -78,25 +153,33 @@ def connect_wifi(SSID='prohidna', password='12345678', log=print):
         if not sta_if.isconnected():
             sta_if.active(True)
             sta_if.connect(SSID, password)
-            while not sta_if.isconnected():
-                pass # wait till connection
+        return sta_if
     except Exception as e:
         log(f"WIFI: Connection error: {e}")
         return None
-    log(f"WIFI: Connected, network config: {sta_if.ifconfig()}")
-    return sta_if.ifconfig()
+
+_credentials = None
 
 def load_credentials(log=print):
+    """Parses secrets.json once, later calls return the same dict."""
+    global _credentials
+    if _credentials is not None:
+        return _credentials
     import ujson
     try:
         with open('secrets.json', 'r') as f:
+            _credentials = ujson.load(f)
             log("Credentials loaded from secrets.json")
-            return ujson.load(f)
+            return _credentials
     except Exception as e:
         log(f"Error loading credentials: {e}. Maybe the file is missing or corrupted.")
         return {}
 
-def connect_ethernet(mdc = 23, mdio = 18, phy_type = None, phy_addr = 0, log=print):
+def start_ethernet(mdc = 23, mdio = 18, phy_type = None, phy_addr = 0, log=print, power = 12):
+    """
+    Powers and activates the Ethernet PHY without waiting for a link, returns the interface or None.
+    phy_type is a network.PHY_* constant or its name ('LAN8720'), power the PHY power pin (-1 for none).
+    """
     import network # type: ignore
     from machine import Pin
     import time
@@ -104,63 +187,33 @@ def connect_ethernet(mdc = 23, mdio = 18, phy_type = None, phy_addr = 0, log=pri
     log("ETHERNET: Setting up Ethernet connection")
 
     try:
-        phy_power = Pin(12, Pin.OUT)
-        phy_power.value(1)
-        time.sleep_ms(100)
+        if power >= 0:
+            phy_power = Pin(power, Pin.OUT)
+            phy_power.value(1)
+            time.sleep_ms(100)
 
-        phy_type = network.PHY_LAN8720
+        if phy_type is None:
+            phy_type = network.PHY_LAN8720
+        elif isinstance(phy_type, str):
+            phy_type = getattr(network, 'PHY_' + phy_type)
 
         lan = network.LAN(mdc=Pin(mdc), mdio=Pin(mdio), phy_type=phy_type, phy_addr=phy_addr)
         lan.active(True)
-
-        max_wait = 20
-
-        while not lan.isconnected() and max_wait > 0:
-            import time
-            time.sleep(0.5)
-            max_wait -= 1
-
-        if lan.isconnected():
-            log(f"ETHERNET: Connected, network config: {lan.ifconfig()}")
-            return lan.ifconfig()
-        else:
-            log("ETHERNET: Connection timed out")
-            return None
+        return lan
     except Exception as e:  
         log(f"ETHERNET: Connection error: {e}")
         return None
 
-def connect(mode, config, credits, log=print):
-    try:
-        if mode == 'wifi':
-            r = connect_wifi(credits.get('WIFI_SSID', 'prohidna'), credits.get('WIFI_PASSWORD', '12345678'))
-            if r:
-                return r
-            else:
-                log("Falling back to Ethernet...")
-                return connect_ethernet(
-                    mdc = config.get('ETH_MDC', 23),
-                    mdio = config.get('ETH_MDIO', 18),
-                    phy_type = config.get('ETH_PHY_TYPE', None),
-                    phy_addr = config.get('ETH_PHY_ADDR', 0),
-                    log=log
-                )
-        elif mode == 'ethernet': 
-            r = connect_ethernet(
-                mdc = config.get('ETH_MDC', 23),
-                mdio = config.get('ETH_MDIO', 18),
-                phy_type = config.get('ETH_PHY_TYPE', None),
-                phy_addr = config.get('ETH_PHY_ADDR', 0),
-                log=log
-            )   
-            if r:
-               return r
-            else:
-                log("Falling back to WiFi...")
-                return connect_wifi(credits.get('WIFI_SSID', 'prohidna'), credits.get('WIFI_PASSWORD', '12345678'), log=log)
-    except Exception as e:
-        log(f"Connection error: {e}")
-        return None
+async def wait_connected(iface, timeout_ms=10000, poll_ms=100):
+    """Waits without blocking the event loop until iface is connected, returns False on timeout."""
+    import uasyncio as asyncio # type: ignore
+    import time
+    start = time.ticks_ms()
+    while not iface.isconnected():
+        if time.ticks_diff(time.ticks_ms(), start) >= timeout_ms:
+            return False
+        await asyncio.sleep_ms(poll_ms)
+    return True
 
 def save_config(config, config_file='config.json', log=print):
     import ujson
@@ -0,0 +1,165 @@
+import gc
+import os
+import random
+import time
+from access_rules import AccessRules, GRANTED, SCHEDULE, DOOR, UNKNOWN, DAYS, parse_uid
+
+# Decision latency of the compiled access tables at 10k cards and 100 groups.
+# Every decision is checked against a plain evaluation of the policy (windows
+# walked on every tap), which is also timed for comparison. On the board run
+# it as is; on the host the absolute figures are only indicative.
+
+CARDS = 10000
+GROUPS = 100
+DOORS = ['main', 'back', 'garage', 'lab']
+BATCH = 500          # cards per MQTT message
+DECISIONS = 5000
+SLOT_MIN = 30
+
+random.seed(7)
+
+def random_policy():
+    schedules = {}
+    for s in range(20):
+        windows = []
+        for _ in range(random.randint(1, 3)):
+            first, last = random.randint(0, 6), random.randint(0, 6)
+            start, end = random.randint(0, 47) * 30, random.randint(0, 47) * 30
+            windows.append(["%s-%s" % (DAYS[first], DAYS[last]), "%02d:%02d" % divmod(start, 60), "%02d:%02d" % divmod(end, 60)])
+        schedules['s%d' % s] = windows
+    groups = {}
+    for g in range(GROUPS):
+        group = {}
+        if g % 10:
+            group['schedule'] = 's%d' % random.randint(0, 19)
+        if g % 3:
+            group['doors'] = random.sample(DOORS, random.randint(1, len(DOORS)))
+        groups['g%03d' % g] = group
+    return {'slot_min': SLOT_MIN, 'schedules': schedules, 'groups': groups}
+
+def random_uid():
+    return '-'.join(str(random.getrandbits(8)) for _ in range(random.choice((4, 7))))
+
+def in_windows(windows, slot):
+    """Reference: the slot start (minutes of the week) lies in a window."""
+    minute = slot * SLOT_MIN
+    for days, start, end in windows:
+        h, m = start.split(':'); start = int(h) * 60 + int(m)
+        h, m = end.split(':'); end = int(h) * 60 + int(m)
+        if end <= start:
+            end += 1440
+        first, last = [DAYS.index(d) for d in days.split('-')]
+        for day in range(7):
+            if (day - first) % 7 > (last - first) % 7:
+                continue
+            offset = (minute - day * 1440 - start) % (7 * 1440)
+            if offset < end - start:
+                return True
+    return False
+
+def reference(policy, cards, uid, door, slot):
+    group = cards.get(uid)
+    if group is None:
+        return UNKNOWN
+    group = policy['groups'][group]
+    if door not in (group.get('doors') or DOORS):
+        return DOOR
+    if group.get('schedule') and not in_windows(policy['schedules'][group['schedule']], slot):
+        return SCHEDULE
+    return GRANTED
+
+def heap():
+    gc.collect()
+    return gc.mem_alloc() if hasattr(gc, 'mem_alloc') else 0
+
+policy = random_policy()
+cards = {}
+while len(cards) < CARDS:
+    cards[random_uid()] = 'g%03d' % random.randint(0, GROUPS - 1)
+
+items = list(cards.items())
+before = heap()
+rules = AccessRules(DOORS)
+start = time.ticks_ms()
+rules.set_policy(policy)
+compile_ms = time.ticks_diff(time.ticks_ms(), start)
+start = time.ticks_ms()
+for i in range(0, CARDS, BATCH):
+    batch = {}
+    for uid, group in items[i:i + BATCH]:
+        batch.setdefault(group, []).append(uid)
+    rules.add_cards(batch)
+load_ms = time.ticks_diff(time.ticks_ms(), start)
+assert rules.count == CARDS
+print("policy compiled in {} ms, {} cards merged in {} ms ({} batches)".format(compile_ms, CARDS, load_ms, CARDS // BATCH))
+del batch
+print("tables: {} B ({:.1f} B per card), heap {} B".format(rules.stats()['table_bytes'], rules.stats()['table_bytes'] / CARDS, heap() - before))
+
+# Taps: 80% known cards, 20% unknown, random door and slot of the week
+taps = []
+for _ in range(DECISIONS):
+    text = random.choice(items)[0] if random.random() < 0.8 else random_uid()
+    taps.append((text, parse_uid(text), random.choice(DOORS), random.randint(0, 7 * 1440 // SLOT_MIN - 1)))
+
+verdicts = []
+start = time.ticks_us()
+for text, uid, door, slot in taps:
+    verdicts.append(rules.decide(uid, door, slot))
+compiled_us = time.ticks_diff(time.ticks_us(), start) / DECISIONS
+
+start = time.ticks_us()
+expected = [reference(policy, cards, text, door, slot) for text, uid, door, slot in taps]
+reference_us = time.ticks_diff(time.ticks_us(), start) / DECISIONS
+assert verdicts == expected, "compiled tables disagree with the policy"
+
+worst = 0
+for text, uid, door, slot in taps[:500]:
+    t = time.ticks_us()
+    rules.decide(uid, door, slot)
+    worst = max(worst, time.ticks_diff(time.ticks_us(), t))
+counts = {}
+for verdict in verdicts:
+    counts[verdict] = counts.get(verdict, 0) + 1
+print("decision: {:.1f} us average, {} us worst (policy walked per tap: {:.1f} us)".format(compiled_us, worst, reference_us))
+print("verdicts:", counts)
+
+# Unknown time (no NTP sync yet): only the groups open all week pass
+for text, uid, door, slot in taps[:200]:
+    verdict = rules.decide(uid, door, None)
+    if verdict is GRANTED:
+        assert rules.always[rules.group_of(uid)]
+
+# Storage round trip: what the boot loads instead of JSON
+rules.save('bench_access.json', 'bench_cards.bin')
+start = time.ticks_ms()
+loaded = AccessRules(DOORS)
+loaded.load('bench_access.json', 'bench_cards.bin')
+boot_ms = time.ticks_diff(time.ticks_ms(), start)
+assert loaded.count == CARDS and list(loaded.keys) == list(rules.keys)
+print("boot load of policy and cards: {} ms, cards file {} B".format(boot_ms, os.stat('bench_cards.bin')[6]))
+
+# Policy change: a removed group drops its cards, the others keep theirs
+del policy['groups']['g000']
+before = sum(1 for group in cards.values() if group == 'g000')
+loaded.set_policy(policy)
+assert loaded.count == CARDS - before
+some = next(uid for uid, group in items if group == 'g042')
+assert loaded.groups[loaded.group_of(parse_uid(some))] == 'g042'
+
+# Damaged files (reset during an old non-atomic write, hand edits): the boot goes on
+with open('bench_cards.bin', 'rb') as f:
+    data = f.read()
+for damaged in (data[:5], data[:len(data) // 2], b'JUNK' + data[4:]):
+    with open('bench_cards.bin', 'wb') as f:
+        f.write(damaged)
+    broken = AccessRules(DOORS)
+    assert broken.load('bench_access.json', 'bench_cards.bin')
+    assert broken.active and broken.count == 0, "policy kept, only the whitelist opens"
+with open('bench_access.json', 'w') as f:
+    f.write('{"groups": {"g001": {"sched')
+broken = AccessRules(DOORS)
+assert not broken.load('bench_access.json', 'bench_cards.bin') and not broken.active
+assert not [name for name in os.listdir() if name.endswith('.tmp')]
+os.remove('bench_access.json')
+os.remove('bench_cards.bin')
+print("OK")
@@ -0,0 +1,134 @@
+import os
+import random
+import time
+import uasyncio as asyncio
+from access_rules import GRANTED, UNKNOWN, SCHEDULE
+from passback import PASSBACK
+from audit_log import AuditLog, BLOCK
+
+# Write cost per tap and query time of the audit log over 100k decisions
+# (about 1.6 MB of flash: run it on a board with a large enough filesystem).
+# Taps are one every ~10 s over ~12 days from 2000 cards; queries must only
+# read the blocks their time range or UID can be in. On the host the
+# absolute figures are only indicative.
+
+DIR = 'test_audit'
+RECORDS = 100000
+SEGMENT = 16384
+CARDS = [bytes([n >> 8, n & 0xFF, 0x5A, 0x11]) for n in range(2000)]
+DOORS = ['main', 'back']
+VERDICTS = [GRANTED] * 8 + [UNKNOWN, SCHEDULE, PASSBACK]
+T0 = 1760000000
+
+def cleanup():
+    try:
+        for name in os.listdir(DIR):
+            os.remove(DIR + '/' + name)
+        os.rmdir(DIR)
+    except OSError:
+        pass
+
+async def timed_query(audit, name, since, until, uid=None, limit=100000):
+    records = []
+    def send(part, chunk):
+        records.extend(chunk)
+    start = time.ticks_ms()
+    summary = await audit.query(since, until, uid, send, 32, limit)
+    ms = time.ticks_diff(time.ticks_ms(), start)
+    print("{:34} {:6} records {:6} ms  {:5} blocks read, {:5} skipped".format(
+        name, len(records), ms, summary['blocks_read'], summary['blocks_skipped']))
+    return records, summary
+
+async def main():
+    cleanup()
+    random.seed(5)
+    audit = AuditLog(DOORS, DIR, SEGMENT, 8, flush_ms=1000)
+    taps = []
+    ts = T0
+    for _ in range(RECORDS):
+        ts += random.randint(1, 20)
+        taps.append((ts, random.choice(CARDS), random.choice(DOORS), random.choice(VERDICTS)))
+    start = time.ticks_us()
+    worst = 0
+    for n, (ts, uid, door, verdict) in enumerate(taps):
+        t = time.ticks_us()
+        audit.record(ts, uid, door, verdict, 'local', 'ok')
+        if n % 10 == 9:
+            audit.flush()  # AUDIT_FLUSH_MS at 1 tap/s (one write per 10 taps here)
+        worst = max(worst, time.ticks_diff(time.ticks_us(), t))
+    audit.flush()
+    us = time.ticks_diff(time.ticks_us(), start) / RECORDS
+    print("write: {:.1f} us per tap on average, {} us worst (block index written / segment rotated)".format(us, worst))
+    print("stats:", audit.stats())
+    last = taps[-1][0]
+
+    # One hour in the middle of the log, a day, one card over everything, everything
+    hour = (T0 + last) // 2
+    records, _ = await timed_query(audit, "one hour", hour, hour + 3599)
+    expected = [t for t in taps if hour <= t[0] <= hour + 3599]
+    assert len(records) == len(expected) and records[0][0] == expected[0][0]
+    await timed_query(audit, "one day", hour, hour + 86399)
+    card = taps[-1][1]
+    records, summary = await timed_query(audit, "one card, whole log", 0, 0xFFFFFFFF, card)
+    expected = [t for t in taps if t[1] == card]
+    assert len(records) == len(expected) and all(r[1] == '-'.join(str(b) for b in card) for r in records)
+    records, _ = await timed_query(audit, "one card, one day", hour, hour + 86399, card)
+    await timed_query(audit, "whole log, limit 2000", 0, 0xFFFFFFFF, limit=2000)
+    print("one card, whole log: {} of {} blocks read".format(summary['blocks_read'], RECORDS // BLOCK))
+
+    # Access control keeps running during a query: a task ticking every 10 ms is never held up for long
+    gaps = []
+    async def ticker():
+        t = time.ticks_ms()
+        while True:
+            await asyncio.sleep_ms(10)
+            now = time.ticks_ms()
+            gaps.append(time.ticks_diff(now, t))
+            t = now
+    task = asyncio.create_task(ticker())
+    await timed_query(audit, "whole log, next to a 10 ms task", 0, 0xFFFFFFFF)
+    task.cancel()
+    print("10 ms task: longest gap {} ms during the query".format(max(gaps)))
+
+    # Reset: a new instance continues the segment, a lost index is rebuilt
+    audit.close()
+    segment = audit.segments[-1]
+    os.remove('%s/%08d.idx' % (DIR, segment))
+    audit = AuditLog(DOORS, DIR, SEGMENT, 8)
+    audit.record(last + 1, CARDS[0], 'main', GRANTED, 'local', 'ok')
+    audit.flush()
+    records, _ = await timed_query(audit, "after reset, last 20 s", last - 20, last + 1)
+    assert records[-1][0] == last + 1 and records[-1][3] == GRANTED
+
+    # Failed write, stopping halfway (flash full): the records are dropped, count and index follow the file again
+    class Torn:
+        def __init__(self, f):
+            self.f = f
+        def write(self, data):
+            self.f.write(bytes(data[:len(data) // 2 + 3]))
+            self.f.flush()
+            raise OSError(28)  # ENOSPC
+        def flush(self):
+            pass
+        def close(self):
+            self.f.close()
+    audit._file = Torn(audit._file)
+    for n in range(5):
+        audit.record(last + 2 + n, CARDS[1], 'main', GRANTED, 'local', 'ok')
+    audit.flush()
+    assert audit.stats()['errors'] == 1
+    for n in range(BLOCK + 3):
+        audit.record(last + 10 + n, CARDS[2], 'back', UNKNOWN, 'local', 'ok')
+    audit.flush()
+    path = '%s/%08d' % (DIR, audit.segments[-1])
+    size = os.stat(path + '.log')[6]
+    assert size % 16 == 0 and audit.count == size // 16, "count follows the file"
+    assert os.stat(path + '.idx')[6] == audit.count // BLOCK * 24, "index follows the file"
+    records, _ = await timed_query(audit, "after a failed write", last + 2, last + 10 + BLOCK + 3)
+    assert [r[3] for r in records].count(UNKNOWN) == BLOCK + 3  # plus the records that made it before the failure
+    assert all(r[3] == UNKNOWN for r in records if r[0] >= last + 10)
+    audit.close()
+    cleanup()
+    print("OK")
+
+asyncio.run(main())
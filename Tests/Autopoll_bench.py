@@ -0,0 +1,72 @@
+import time
+import uasyncio as asyncio
+from reader_pool import ReaderPool
+from spi_arbiter import BusArbiter, heartbeat_age, PRIORITY_READ, PRIORITY_HEALTH
+from pn532_emulator import PN532Emulator, Card
+
+IDLE_MS = 1000  # measured idle time, results are scaled to one minute
+CHECK_INTERVAL_MS = 5000  # CONNECTION_CHECK_INTERVAL
+READ_TIMEOUT = 9  # NFC_READ_TIMEOUT
+AUTOPOLL_CHECK_MS = 100  # NFC_AUTOPOLL_CHECK_MS
+
+async def run(name, mode, use_irq):
+    emulator = PN532Emulator()
+    reader_cfg = {'name': 'main', 'cs': emulator.cs}
+    if use_irq:
+        reader_cfg['irq'] = emulator.irq
+    pool = ReaderPool(emulator.spi, [reader_cfg], poll_timeout=READ_TIMEOUT)
+    pool.init_drivers()
+    reader = pool.readers[0]
+    reader.pn532.SAM_configuration()
+    reader.connected = True
+    arbiter = BusArbiter()
+    asyncio.create_task(arbiter.run())
+    state = {'running': True, 'detected': None}
+    poll = pool.autopoll if mode == 'autopoll' else pool.poll
+
+    async def read_task():
+        while state['running']:
+            r, uids = await arbiter.submit(PRIORITY_READ, poll)
+            if uids and state['detected'] is None:
+                state['detected'] = time.ticks_ms()
+            if mode == 'autopoll':
+                await pool.wait_autopoll(AUTOPOLL_CHECK_MS)
+            else:
+                await asyncio.sleep(0.01)
+
+    async def health_task():
+        while state['running']:
+            await asyncio.sleep_ms(CHECK_INTERVAL_MS)
+            age = heartbeat_age(reader.pn532)
+            if age is None or age >= CHECK_INTERVAL_MS:
+                await arbiter.submit(PRIORITY_HEALTH, pool.probe, reader)
+
+    await asyncio.sleep_ms(0)
+    emulator.bus.transactions = 0
+    arbiter.busy_ms = 0
+    start = time.ticks_ms()
+    tasks = [asyncio.create_task(read_task()), asyncio.create_task(health_task())]
+    await asyncio.sleep_ms(IDLE_MS)
+    elapsed = time.ticks_diff(time.ticks_ms(), start)
+    transactions, busy = emulator.bus.transactions, arbiter.busy_ms
+
+    # Tap a card and see how long the mode takes to notice it. The emulator
+    # answers as soon as the card is there, the chip's own scan period comes on top.
+    tap = time.ticks_ms()
+    emulator.card = Card(b'\x0A\x0B\x0C\x0D')
+    while state['detected'] is None and time.ticks_diff(time.ticks_ms(), tap) < 3000:
+        await asyncio.sleep_ms(5)
+    state['running'] = False
+    arbiter.stop()
+    for t in tasks:
+        t.cancel()
+    latency = time.ticks_diff(state['detected'], tap) if state['detected'] else None
+    scale = 60000 / elapsed
+    print(f"{name:<22} SPI transactions/idle min: {transactions * scale:7.0f}  host busy in driver: {busy * scale / 1000:5.1f} s/min ({busy * 100 / elapsed:4.1f}%)  tap detected after: {latency} ms")
+
+async def main():
+    await run("InListPassiveTarget", 'loop', False)
+    await run("InAutoPoll, SPI status", 'autopoll', False)
+    await run("InAutoPoll, IRQ line", 'autopoll', True)
+
+asyncio.run(main())
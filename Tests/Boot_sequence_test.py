@@ -0,0 +1,81 @@
+import time
+import uasyncio as asyncio
+from startup import BootSequence
+from utils import wait_connected
+
+# Simulated phase durations (ms), close to what a reader with Ethernet sees
+NETWORK_MS = 3000   # DHCP lease
+NTP_MS = 300
+MQTT_MS = 500
+WAKEUP_MS = 2000    # the two settle delays of the PN532 wakeup
+PN532_MS = 100      # firmware version + SAM configuration
+
+class FakeLink:
+    """Interface that comes up after `ms`, like network.LAN()."""
+    def __init__(self, ms):
+        self.up_at = time.ticks_add(time.ticks_ms(), ms)
+
+    def isconnected(self):
+        return time.ticks_diff(time.ticks_ms(), self.up_at) >= 0
+
+async def network():
+    ok = await wait_connected(FakeLink(NETWORK_MS), timeout_ms=10000)
+    await asyncio.sleep_ms(NTP_MS)
+    return ok
+
+async def mqtt():
+    await asyncio.sleep_ms(MQTT_MS)
+    return True
+
+async def nfc(boot, ticks):
+    await asyncio.sleep_ms(WAKEUP_MS + PN532_MS)
+    boot.mark('first_poll')
+    # The event loop stays free while the network comes up
+    while 'mqtt' not in boot.phases or boot.phases['mqtt'][1] is None:
+        ticks[0] += 1
+        await asyncio.sleep_ms(10)
+    return True
+
+async def serial():
+    boot = BootSequence()
+    await boot.phase('network', network())
+    await boot.phase('mqtt', mqtt())
+    await boot.phase('nfc', asyncio.sleep_ms(WAKEUP_MS + PN532_MS))
+    boot.mark('first_poll')
+    return boot.report()
+
+async def parallel():
+    boot = BootSequence()
+    ticks = [0]
+    nfc_phase = boot.start('nfc', nfc(boot, ticks))
+    if await boot.phase('network', network()):
+        await boot.phase('mqtt', mqtt())
+    await nfc_phase
+    return boot.report(), ticks[0]
+
+async def failing():
+    boot = BootSequence()
+    async def broken():
+        raise OSError(110)
+    other = boot.start('nfc', asyncio.sleep_ms(50))
+    assert await boot.phase('network', broken()) is None
+    await other
+    report = boot.report()
+    assert not report['phases']['network']['ok'] and report['phases']['nfc']['ok']
+    assert not await wait_connected(FakeLink(10000), timeout_ms=200)
+
+async def main():
+    before = await serial()
+    after, ticks = await parallel()
+    for name, report in (("serial", before), ("parallel", after)):
+        print("{}: total {} ms, first poll at {} ms".format(name, report['total_ms'], report['milestones']['first_poll']))
+        for phase, p in report['phases'].items():
+            print("  {:8} start {:5} ms  took {:5} ms  ok={}".format(phase, p['start'], p['ms'], p['ok']))
+    print("loop ticks while the network was coming up:", ticks)
+    assert after['milestones']['first_poll'] < before['milestones']['first_poll'] - NETWORK_MS
+    assert after['total_ms'] < before['total_ms'] - WAKEUP_MS + 200
+    assert ticks > 50, "network wait must not block the loop"
+    await failing()
+    print("OK")
+
+asyncio.run(main())
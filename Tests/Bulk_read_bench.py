@@ -0,0 +1,63 @@
+import time
+import NFC_PN532 as nfc
+from pn532_emulator import PN532Emulator, Card
+
+KEY = b'\xFF' * 6
+NTAG_FIRST_PAGE, NTAG_LAST_PAGE = 4, 39  # NTAG213 user memory
+SECTORS = range(1, 4)
+
+def measure(name, emulator, fn):
+    emulator.reset_counters()
+    start = time.ticks_ms()
+    data = fn()
+    elapsed = time.ticks_diff(time.ticks_ms(), start)
+    exchanges = sum(emulator.commands.values())
+    print(f"{name:<34} PN532 commands: {exchanges:>3}  SPI transactions: {emulator.transactions:>4}  time: {elapsed:>5} ms")
+    return data
+
+# --- NTAG2xx user area ---
+emulator = PN532Emulator(card=Card(b'\x04\x11\x22\x33\x44\x55\x66', atqa=0x0044, sak=0x00, ntag_pages=45))
+pn532 = nfc.PN532(emulator.spi, emulator.cs)
+uid = pn532.read_passive_target()
+
+def ntag_page_by_page():
+    out = bytearray()
+    for page in range(NTAG_FIRST_PAGE, NTAG_LAST_PAGE + 1):
+        out += pn532.ntag2xx_read_block(page)
+    return out
+
+def ntag_four_pages_per_read():
+    out = bytearray()
+    for page in range(NTAG_FIRST_PAGE, NTAG_LAST_PAGE + 1, 4):
+        out += pn532.mifare_classic_read_block(page)
+    return out[:(NTAG_LAST_PAGE - NTAG_FIRST_PAGE + 1) * 4]
+
+buf = bytearray((NTAG_LAST_PAGE - NTAG_FIRST_PAGE + 1) * 4)
+a = measure("NTAG ntag2xx_read_block per page", emulator, ntag_page_by_page)
+b = measure("NTAG READ, 4 pages per exchange", emulator, ntag_four_pages_per_read)
+c = measure("NTAG FAST_READ", emulator, lambda: pn532.ntag2xx_fast_read(NTAG_FIRST_PAGE, NTAG_LAST_PAGE, buf))
+assert a == b == c, 'Bulk NTAG read returned different data'
+
+# --- MIFARE Classic sectors ---
+emulator = PN532Emulator(card=Card(b'\xDE\xAD\xBE\xEF', key=KEY))
+pn532 = nfc.PN532(emulator.spi, emulator.cs)
+uid = pn532.read_passive_target()
+
+def classic_auth_per_block():
+    out = bytearray()
+    for sector in SECTORS:
+        for block in range(sector * 4, sector * 4 + 3):
+            pn532.mifare_classic_authenticate_block(uid, block, nfc.MIFARE_CMD_AUTH_A, KEY)
+            out += pn532.mifare_classic_read_block(block)
+    return out
+
+sector_buf = bytearray(48 * len(SECTORS))
+def classic_sector_reads():
+    mv = memoryview(sector_buf)
+    for n, sector in enumerate(SECTORS):
+        pn532.mifare_classic_read_sector(uid, sector, nfc.MIFARE_CMD_AUTH_A, KEY, mv[n * 48:(n + 1) * 48])
+    return sector_buf
+
+a = measure("Classic auth + read per block", emulator, classic_auth_per_block)
+b = measure("Classic one auth per sector", emulator, classic_sector_reads)
+assert a == b, 'Sector read returned different data'
@@ -0,0 +1,80 @@
+import random
+import time
+import uasyncio as asyncio
+from reader_pool import ReaderPool
+from spi_arbiter import BusArbiter, heartbeat_age, PRIORITY_READ, PRIORITY_HEALTH
+from pn532_emulator import PN532Emulator, Card
+
+DURATION_MS = 5000
+POLL_TIMEOUT = 30
+PROBE_INTERVAL_MS = 50  # far more aggressive than CONNECTION_CHECK_INTERVAL
+CARD = Card(b'\x01\x02\x03\x04')
+
+class Counters:
+    def __init__(self):
+        self.polls = self.reads = self.read_errors = 0
+        self.probes = self.probe_failures = self.skipped_probes = 0
+
+async def flap_card(emulator, deadline):
+    # Cards come and go at random, so polls keep timing out right before a card shows up
+    while time.ticks_diff(deadline, time.ticks_ms()) > 0:
+        emulator.card = CARD if emulator.card is None else None
+        await asyncio.sleep_ms(random.randint(20, 150))
+
+async def reads(poll, c, deadline):
+    while time.ticks_diff(deadline, time.ticks_ms()) > 0:
+        try:
+            reader, uids = await poll()
+            c.polls += 1
+            c.reads += len(uids)
+        except Exception:
+            c.read_errors += 1
+        await asyncio.sleep_ms(1)
+
+async def health(probe, pn532, c, deadline, use_heartbeat):
+    while time.ticks_diff(deadline, time.ticks_ms()) > 0:
+        await asyncio.sleep_ms(PROBE_INTERVAL_MS)
+        age = heartbeat_age(pn532)
+        if use_heartbeat and age is not None and age < PROBE_INTERVAL_MS:
+            c.skipped_probes += 1
+            continue
+        c.probes += 1
+        try:
+            await probe()
+        except Exception:
+            c.probe_failures += 1  # would be reported as "PN532 connection lost"
+
+async def run(name, use_arbiter):
+    random.seed(7)
+    emulator = PN532Emulator()
+    pool = ReaderPool(emulator.spi, [{'name': 'main', 'cs': emulator.cs}], poll_timeout=POLL_TIMEOUT)
+    pool.init_drivers()
+    reader = pool.readers[0]
+    reader.pn532.SAM_configuration()
+    reader.connected = True
+    c = Counters()
+    deadline = time.ticks_add(time.ticks_ms(), DURATION_MS)
+    if use_arbiter:
+        arbiter = BusArbiter(idle_ms=20, max_defer_ms=1000)
+        owner = asyncio.create_task(arbiter.run())
+        poll = lambda: arbiter.submit(PRIORITY_READ, pool.poll)
+        probe = lambda: arbiter.submit(PRIORITY_HEALTH, reader.pn532.get_firmware_version)
+    else:
+        reader.pn532.abort = lambda: None  # the driver before the arbiter left timed out polls running
+        async def poll():
+            return pool.poll()
+        async def probe():
+            return reader.pn532.get_firmware_version()
+    await asyncio.gather(flap_card(emulator, deadline), reads(poll, c, deadline),
+                         health(probe, reader.pn532, c, deadline, use_arbiter))
+    if use_arbiter:
+        arbiter.stop()
+    print(f"--- {name}")
+    print(f"polls: {c.polls}  cards read: {c.reads}  read errors: {c.read_errors}  aborted polls: {emulator.aborts}")
+    print(f"firmware probes: {c.probes}  failed probes: {c.probe_failures}  skipped (heartbeat): {c.skipped_probes}  bus collisions: {emulator.bus.collisions}")
+
+async def main():
+    await run("independent tasks, old driver", False)
+    await run("bus arbiter", True)
+
+asyncio.run(main())
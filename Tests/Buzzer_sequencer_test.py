@@ -0,0 +1,157 @@
+import time
+import uasyncio as asyncio
+from buzzer import BuzzerController
+from utils import DEFAULT_CONFIG
+
+BUZZER_PIN = 35
+TAPS = 100
+TAP_INTERVAL_MS = 10  # 100 taps in one second
+DENIAL_AT = 50        # one denied card in the middle of the burst
+TOLERANCE_MS = 15
+
+class RecordingPWM:
+    """Stands in for the buzzer PWM and records every duty change."""
+    def __init__(self):
+        self.frequency = 0
+        self.events = []  # (ticks_ms, frequency, duty)
+
+    def freq(self, frequency):
+        self.frequency = frequency
+
+    def duty(self, duty):
+        self.events.append((time.ticks_ms(), self.frequency, duty))
+
+class LegacyBuzzer:
+    """The buzzer before the sequencer, one coroutine per tap."""
+    def __init__(self, pwm, aproval_melody, denial_melody):
+        self.pwm = pwm
+        self.volume = 512
+        self.aproval_melody = aproval_melody
+        self.denial_melody = denial_melody
+
+    async def play_tone(self, frequency, duration_ms, volume):
+        self.pwm.freq(frequency)
+        self.pwm.duty(volume)
+        await asyncio.sleep_ms(duration_ms)
+        self.pwm.duty(0)
+
+    async def play_approval(self):
+        for frequency, duration in self.aproval_melody:
+            await self.play_tone(frequency, duration, self.volume)
+            await self.play_tone(211, 10, 0)
+
+    async def play_denial(self):
+        for frequency, duration in self.denial_melody:
+            await self.play_tone(frequency, duration, self.volume)
+            await self.play_tone(211, 10, 0)
+
+class TaskCounter:
+    """
+    Counts the tasks created while installed: asyncio.create_task() calls,
+    including the ones of uasyncio's own modules (core.create_task), and
+    wait_for() / wait_for_ms() calls, which run their awaitable as a new task.
+    """
+    PATCHED = ('create_task', 'wait_for', 'wait_for_ms')
+
+    def __init__(self):
+        self.count = 0
+        self._saved = []
+
+    def _patch(self, module, name):
+        original = getattr(module, name, None)
+        if original is None:
+            return
+        def counted(*args, **kwargs):
+            self.count += 1
+            return original(*args, **kwargs)
+        self._saved.append((module, name, original))
+        setattr(module, name, counted)
+
+    def __enter__(self):
+        for name in self.PATCHED:
+            self._patch(asyncio, name)
+        core = getattr(asyncio, 'core', None)
+        if core is not None and core is not asyncio:
+            self._patch(core, 'create_task')
+        return self
+
+    def __exit__(self, *exc):
+        for module, name, original in self._saved:
+            setattr(module, name, original)
+
+def tone_errors(events, durations):
+    """
+    How far each tone was from its nominal length. A tone counts as clean when
+    the next duty change is the pause (duty 0) after it, a tone cut by another
+    tone is counted as clobbered.
+    """
+    errors = []
+    clobbered = 0
+    for i in range(len(events) - 1):
+        t, frequency, duty = events[i]
+        if not duty:
+            continue
+        if events[i + 1][2]:
+            clobbered += 1
+            continue
+        errors.append(abs(time.ticks_diff(events[i + 1][0], t) - durations[frequency]))
+    return errors, clobbered
+
+async def burst(play_approval, play_denial):
+    start = time.ticks_ms()
+    for tap in range(TAPS):
+        if tap == DENIAL_AT:
+            play_denial()
+        else:
+            play_approval()
+        await asyncio.sleep_ms(TAP_INTERVAL_MS)
+    return time.ticks_diff(time.ticks_ms(), start)
+
+def report(name, tasks, elapsed, errors, clobbered):
+    worst = max(errors) if errors else 0
+    mean = sum(errors) / len(errors) if errors else 0
+    print("{}: {} taps in {} ms, {} tasks spawned, {} clean tones (mean error {:.1f} ms, worst {} ms), {} tones clobbered".format(
+        name, TAPS, elapsed, tasks, len(errors), mean, worst, clobbered))
+
+async def run_legacy(durations):
+    pwm = RecordingPWM()
+    buzzer = LegacyBuzzer(pwm, DEFAULT_CONFIG['APROVAL_MELODY'], DEFAULT_CONFIG['DENIAL_MELODY'])
+    with TaskCounter() as tasks:
+        elapsed = await burst(lambda: asyncio.create_task(buzzer.play_approval()),
+                              lambda: asyncio.create_task(buzzer.play_denial()))
+    await asyncio.sleep_ms(1000)
+    errors, clobbered = tone_errors(pwm.events, durations)
+    report("legacy", tasks.count, elapsed, errors, clobbered)
+    return tasks.count, clobbered
+
+async def run_sequencer(durations):
+    buzzer = BuzzerController(BUZZER_PIN, DEFAULT_CONFIG['APROVAL_MELODY'], DEFAULT_CONFIG['DENIAL_MELODY'])
+    buzzer.pwm = RecordingPWM()
+    owner = asyncio.create_task(buzzer.run())
+    with TaskCounter() as tasks:
+        elapsed = await burst(buzzer.play_approval, buzzer.play_denial)
+    while buzzer.busy() or buzzer.stats()['queued']:
+        await asyncio.sleep_ms(50)
+    buzzer.running = False
+    buzzer.stop()
+    await owner
+    errors, clobbered = tone_errors(buzzer.pwm.events, durations)
+    report("sequencer", tasks.count, elapsed, errors, clobbered)
+    print("  stats:", buzzer.stats())
+    return tasks.count, clobbered, errors, buzzer.stats()
+
+async def main():
+    durations = {}
+    for frequency, duration in DEFAULT_CONFIG['APROVAL_MELODY'] + DEFAULT_CONFIG['DENIAL_MELODY']:
+        durations[frequency] = duration
+
+    await run_legacy(durations)
+    tasks, clobbered, errors, stats = await run_sequencer(durations)
+
+    assert tasks == 0, "taps must not spawn tasks"
+    assert clobbered <= stats['preempted'], "only a preemption may cut a tone short"
+    assert stats['preempted'] == 1, "the denial must preempt the approval"
+    assert errors and max(errors) <= TOLERANCE_MS, "tone timing off by more than {} ms".format(TOLERANCE_MS)
+    print("OK")
+
+asyncio.run(main())
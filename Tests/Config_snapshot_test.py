@@ -0,0 +1,70 @@
+import gc
+import os
+import time
+import ujson
+import config_store
+from utils import DEFAULT_CONFIG
+
+# Compares the two config load paths of config_store.load() and checks that a
+# changed config.json invalidates the snapshot. Works on its own copies of the
+# config. For the device figures cross-compile the snapshot this script writes
+# (mpy-cross bench_snapshot.py) and upload the .mpy, as extras/build_mpy.py does.
+
+CONFIG = 'bench_config.json'
+SNAPSHOT = 'bench_snapshot'
+LOOPS = 20
+
+def write_files():
+    with open('config.json') as f:
+        data = f.read()
+    with open(CONFIG, 'w') as f:
+        f.write(data)
+    config = DEFAULT_CONFIG.copy()
+    config.update(ujson.loads(data))
+    if not _exists(SNAPSHOT + '.mpy'):
+        with open(SNAPSHOT + '.py', 'w') as f:
+            f.write("FORMAT = %d\nSOURCE_CRC = %d\nCONFIG = %r\n" % (
+                config_store.SNAPSHOT_FORMAT, config_store.checksum(data.encode()), config))
+    return config
+
+def _exists(name):
+    try:
+        os.stat(name)
+        return True
+    except OSError:
+        return False
+
+def measure(module):
+    """ms per load and bytes allocated by one load, through the snapshot `module` (or JSON if it does not exist)."""
+    config_store.SNAPSHOT_MODULE = module
+    start = time.ticks_us()
+    for _ in range(LOOPS):
+        config, source = config_store.load(CONFIG, DEFAULT_CONFIG)
+    ms = time.ticks_diff(time.ticks_us(), start) / LOOPS / 1000
+    gc.collect()
+    gc.disable()
+    before = gc.mem_alloc()
+    config_store.load(CONFIG, DEFAULT_CONFIG)
+    allocated = gc.mem_alloc() - before
+    gc.enable()
+    return config, source, ms, allocated
+
+expected = write_files()
+config, source, json_ms, json_heap = measure('no_such_snapshot')
+assert source == 'json' and config == expected
+config, source, snap_ms, snap_heap = measure(SNAPSHOT)
+assert source == 'snapshot' and config == expected
+print("json:     {:.2f} ms, {} B allocated per load".format(json_ms, json_heap))
+print("snapshot: {:.2f} ms, {} B allocated per load ({})".format(
+    snap_ms, snap_heap, "mpy" if _exists(SNAPSHOT + '.mpy') else "py, compiled on every load"))
+
+# A config update rewrites the file: the snapshot must not be used any more
+with open(CONFIG, 'w') as f:
+    f.write(ujson.dumps(dict(expected, MAX_QUEUE_SIZE=10)))
+config, source = config_store.load(CONFIG, DEFAULT_CONFIG)
+assert source == 'json' and config['MAX_QUEUE_SIZE'] == 10
+assert not _exists(SNAPSHOT + '.py') and not _exists(SNAPSHOT + '.mpy'), "stale snapshot removed"
+
+os.remove(CONFIG)
+config_store.SNAPSHOT_MODULE = 'config_snapshot'
+print("OK")
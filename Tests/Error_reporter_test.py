@@ -0,0 +1,67 @@
+import gc
+import time
+from error_reporter import ErrorReporter
+
+LOOPS = 1000  # read_nfc iterations on a flapping SPI link
+
+class Broker:
+    def __init__(self):
+        self.messages = []
+
+    def publish(self, data):
+        self.messages.append(data)
+
+def flapping_link(errors, readers):
+    spi_error = OSError(5)
+    lost = RuntimeError('Failed to detect the PN532')
+    for n in range(LOOPS):
+        for reader in readers:
+            errors.report("read_nfc", spi_error, reader)
+            if n % 10 == 0:
+                errors.report("pn532_connection", lost, reader)
+
+def allocation_per_repeat(errors):
+    error = OSError(5)
+    errors.report("read_nfc", error, "main")  # first occurrence creates the entry
+    gc.collect()
+    gc.disable()
+    before = gc.mem_alloc()
+    for _ in range(100):
+        errors.report("read_nfc", error, "main")
+    per_call = (gc.mem_alloc() - before) / 100
+    gc.enable()
+    return per_call
+
+broker = Broker()
+errors = ErrorReporter(broker.publish, interval=60, burst=5, rate=6)
+readers = ["entry", "exit"]
+start = time.ticks_us()
+flapping_link(errors, readers)
+us = time.ticks_diff(time.ticks_us(), start) / errors.reported
+immediate = len(broker.messages)
+errors.flush()
+summary = broker.messages[-1]
+
+print(f"{errors.reported} errors reported, {immediate} published right away, 1 summary, {us:.1f} us per report")
+for item in summary['errors']:
+    print("  summary:", item)
+
+# The old behaviour published every one of them
+assert immediate == 4, "one first occurrence per key"
+totals = {(i['site'], i['source']): i['count'] for i in summary['errors']}
+assert totals[("read_nfc", "entry")] == LOOPS - 1
+assert totals[("pn532_connection", "exit")] == LOOPS // 10 - 1
+
+# A quiet window makes the next occurrence a first occurrence again
+errors.flush()
+errors.report("read_nfc", OSError(5), "entry")
+assert broker.messages[-1]['kind'] == 'error'
+
+# Token bucket: a burst of distinct errors from one reader is capped
+broker.messages.clear()
+for n in range(20):
+    errors.report("site%d" % n, ValueError(n), "noisy")
+assert len(broker.messages) == 5, "burst is capped at 5 per source"
+
+print(f"allocation per repeated error: {allocation_per_repeat(ErrorReporter(broker.publish)):.1f} B")
+print("OK")
@@ -0,0 +1,71 @@
+import os
+import time
+from event_history import EventHistory
+
+# Numbers events, drops some on the way like a full queue or a failed publish,
+# and checks that the gaps can be asked for again. Then restarts on the same
+# sequence file: numbers go on increasing, the skipped ones are missing.
+
+SEQ_FILE = 'test_event_seq'
+SIZE = 100
+EVENTS = 500
+
+def cleanup():
+    for name in (SEQ_FILE, SEQ_FILE + '.tmp'):
+        try:
+            os.remove(name)
+        except OSError:
+            pass
+
+cleanup()
+history = EventHistory(SIZE, SEQ_FILE, block=64)
+received = []
+start = time.ticks_us()
+for n in range(EVENTS):
+    seq = history.next_seq()
+    history.add(seq, '{"seq": %d}' % seq)
+    if n % 7:  # every 7th event lost on the way
+        received.append(seq)
+us = time.ticks_diff(time.ticks_us(), start) / EVENTS
+print("next_seq + add: {:.1f} us per event ({} flash writes)".format(us, EVENTS // 64 + 1))
+assert received[0] == 2 and history.seq == EVENTS
+
+# Backend side: find the gaps, ask for them
+gaps = [s for s in range(1, history.seq + 1) if s not in received]
+resent = []
+for seq in gaps:
+    report = history.retransmit(seq, seq, lambda p: resent.append(p) or True)
+    if seq >= history.oldest():
+        assert report == {'sent': 1, 'missing': [], 'failed': []}, report
+    else:
+        assert report == {'sent': 0, 'missing': [[seq, seq]], 'failed': []}, report
+print("{} gaps, {} recovered from the last {} events".format(len(gaps), len(resent), SIZE))
+
+# A range over the edge of the ring
+report = history.retransmit(history.oldest() - 5, history.oldest() + 4, lambda p: True)
+assert report == {'sent': 5, 'missing': [[history.oldest() - 5, history.oldest() - 1]], 'failed': []}, report
+
+# A failed publish is reported as failed, apart from the events no longer held: those can be asked for again
+report = history.retransmit(history.oldest() - 2, history.oldest() + 1, lambda p: False)
+assert report == {'sent': 0, 'missing': [[history.oldest() - 2, history.oldest() - 1]],
+                  'failed': [[history.oldest(), history.oldest() + 1]]}, report
+
+# Reset: the new instance continues after the reserved block
+last = history.seq
+history = EventHistory(SIZE, SEQ_FILE, block=64)
+seq = history.next_seq()
+assert seq > last, "the sequence went back after a reset"
+history.add(seq, '{"seq": %d}' % seq)
+report = history.retransmit(last, seq, lambda p: True)
+assert report == {'sent': 1, 'missing': [[last, seq - 1]], 'failed': []}, report
+print("after reset: {} -> {}, {} numbers skipped, stats {}".format(last, seq, seq - last - 1, history.stats()))
+
+# Reset while the next block was being reserved: the torn write is in the .tmp file, the block end on file is intact
+with open(SEQ_FILE + '.tmp', 'w') as f:
+    pass
+last = history.seq
+history = EventHistory(SIZE, SEQ_FILE, block=64)
+assert history.next_seq() > last, "the sequence went back after a reset during a reservation"
+
+cleanup()
+print("OK")
@@ -0,0 +1,88 @@
+import random
+import NFC_PN532 as nfc
+from mifare_keys import MifareKeyRing
+
+# --- Simulated card population ---
+# Every key the sites use. The reader tries them in this order.
+KEYS = ["FFFFFFFFFFFF", "A0A1A2A3A4A5", "D3F7D3F7D3F7", "B0B1B2B3B4B5"]
+# (share of cards, key index, ATQA, SAK) per card family
+FAMILIES = [
+    (50, 0, 0x0004, 0x08),  # factory-fresh MIFARE Classic 1K
+    (25, 1, 0x0004, 0x08),  # site A, same card class as factory cards
+    (15, 2, 0x0002, 0x18),  # site B, MIFARE Classic 4K
+    (10, 3, 0x0044, 0x08),  # site C, 7-byte UID cards
+]
+CARDS = 300
+TAPS = 3000
+
+class PlainKeyRing(MifareKeyRing):
+    """Baseline: tries the keys in config order and never learns."""
+    def remember(self, uid, card_class, index):
+        pass
+
+class FakePN532:
+    """Answers InListPassiveTarget and MIFARE AUTH/READ like a card in the field would."""
+    def __init__(self):
+        self.card = None
+        self.selected = False
+        self.round_trips = 0
+
+    def present(self, card):
+        self.card = card
+        self.selected = True
+        self.sens_res, self.sel_res = card['atqa'], card['sak']
+
+    def card_class(self):
+        return (self.sens_res << 8) | self.sel_res
+
+    def read_passive_target(self, card_baud=0, timeout=1000, uid=None):
+        self.round_trips += 1
+        self.selected = True
+        return self.card['uid']
+
+    def mifare_classic_authenticate_block(self, uid, block_number, key_number, key):
+        self.round_trips += 1
+        if self.selected and key == KEY_BYTES[self.card['key']]:
+            return True
+        self.selected = False  # failed AUTH drops the card out of selection
+        return False
+
+    def mifare_classic_read_block(self, block_number):
+        self.round_trips += 1
+        return self.card['data'] if self.selected else None
+
+def make_population():
+    cards = []
+    total = sum(f[0] for f in FAMILIES)
+    for _ in range(CARDS):
+        pick = random.randint(0, total - 1)
+        for share, key, atqa, sak in FAMILIES:
+            if pick < share:
+                break
+            pick -= share
+        uid_len = 7 if atqa == 0x0044 else 4
+        uid = bytearray(random.getrandbits(8) for _ in range(uid_len))
+        data = bytearray(random.getrandbits(8) for _ in range(16))
+        cards.append({'uid': uid, 'key': key, 'atqa': atqa, 'sak': sak, 'data': data})
+    return cards
+
+def run(name, keyring, cards, taps):
+    reader = FakePN532()
+    for card in taps:
+        reader.present(cards[card])
+        code = nfc.read_card_code_from_block4(reader, cards[card]['uid'], keyring=keyring)
+        assert code is not None, 'Card with a known key was not read'
+    s = keyring.stats()
+    print(f"{name:<22} avg auth attempts/tap: {s['avg_attempts']:.3f}  round trips/tap: {reader.round_trips / len(taps):.3f}  failures: {s['failures']}")
+
+random.seed(42)
+KEY_BYTES = MifareKeyRing(KEYS).keys
+cards = make_population()
+# Regulars tap more often than visitors: half of the taps come from a tenth of the cards.
+taps = [random.randint(0, CARDS // 10 - 1) if random.getrandbits(1) else random.randint(0, CARDS - 1) for _ in range(TAPS)]
+
+print(f"{CARDS} cards, {TAPS} taps, {len(KEYS)} keys")
+run("fixed key order", PlainKeyRing(KEYS), cards, taps)
+run("class hints only", MifareKeyRing(KEYS, cache_size=0), cards, taps)
+run("uid + class cache", MifareKeyRing(KEYS, cache_size=64), cards, taps)
+run("uid + class cache 512", MifareKeyRing(KEYS, cache_size=512), cards, taps)
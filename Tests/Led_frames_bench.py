@@ -0,0 +1,95 @@
+import gc
+import math
+import time
+from led import LedController
+from utils import DEFAULT_CONFIG
+
+FRAMES = 2000
+LED_PIN = 3
+NUM_PIXELS = 24
+
+class LegacySteps:
+    """The per-frame math of the LED animations before the frame tables."""
+    def __init__(self, led):
+        self.led = led
+        self.np = led.np
+        self.loading_pos = 0
+        self.pulse_angle = 0
+
+    def loading(self):
+        self.np.fill(self.led.BLACK)
+        for i in range(4):
+            pixel_index = (self.loading_pos - i + self.led.num_pixels) % self.led.num_pixels
+            intensity_factor = (4 - i) / 4.0
+            r, g, b = [int(c * intensity_factor) for c in self.led.LIGHT_BLUE]
+            self.np[pixel_index] = (r, g, b)
+        self.np.write()
+        self.loading_pos = (self.loading_pos + 1) % self.led.num_pixels
+
+    def pulsing(self):
+        brightness = (math.sin(self.pulse_angle) + 1) / 4
+        r, g, b = [int(c * brightness) for c in self.led.PULSE_BLUE]
+        self.np.fill((r, g, b))
+        self.np.write()
+        self.pulse_angle += self.led.pulse_speed
+        if self.pulse_angle > math.pi * 2:
+            self.pulse_angle -= math.pi * 2
+
+def measure(name, step, frame_ms):
+    # Bytes allocated per frame, with the collector off
+    gc.collect()
+    gc.disable()
+    before = gc.mem_alloc()
+    for _ in range(100):
+        step()
+    per_frame = (gc.mem_alloc() - before) / 100
+    gc.enable()
+
+    # CPU time per frame and collections seen (mem_alloc drops when the collector ran)
+    gc.collect()
+    collections = 0
+    last = gc.mem_alloc()
+    start = time.ticks_us()
+    for _ in range(FRAMES):
+        step()
+        now = gc.mem_alloc()
+        if now < last:
+            collections += 1
+        last = now
+    elapsed = time.ticks_diff(time.ticks_us(), start)
+    frames_per_min = 60000 / frame_ms
+    minutes = FRAMES / frames_per_min
+    print(f"{name:<18} {elapsed / FRAMES:7.1f} us/frame  {per_frame:6.1f} B allocated/frame  {collections / minutes:6.1f} GC collections/min")
+
+def table_steps(animation):
+    frames = led.animations[animation].frames
+    state = [0]
+    def step():
+        led.show_frame(frames[state[0]])
+        state[0] = (state[0] + 1) % len(frames)
+    return step
+
+def scheduler_writes(animation, tap_every_ms=0):
+    # One simulated minute of the frame scheduler, optionally with a success overlay every few seconds
+    writes = led.writes
+    led.set_annimation(animation)
+    start = time.ticks_ms()
+    for t in range(0, 60000, led.frame_ms):
+        now = time.ticks_add(start, t)
+        if tap_every_ms and t % tap_every_ms == 0:
+            led.overlay, led.overlay_started, led.overlay_until = led.animations['success'], now, time.ticks_add(now, 700)
+        led.render(now)
+    name = animation + (' + taps' if tap_every_ms else '')
+    print(f"{name:<18} np.write() calls/min: {led.writes - writes:5}  (fixed {led.frame_ms} ms loop: {60000 // led.frame_ms})")
+
+led = LedController(LED_PIN, NUM_PIXELS, DEFAULT_CONFIG)
+legacy = LegacySteps(led)
+print(f"{NUM_PIXELS} pixels, {FRAMES} frames, free heap {gc.mem_free()} B")
+measure("pulsing (old)", legacy.pulsing, 20)
+measure("pulsing (table)", table_steps('waiting'), 20)
+measure("loading (old)", legacy.loading, 40)
+measure("loading (table)", table_steps('loading'), 40)
+scheduler_writes('waiting')
+scheduler_writes('loading')
+scheduler_writes('off')
+scheduler_writes('waiting', 5000)
@@ -0,0 +1,35 @@
+import gc
+import time
+import logger
+
+CALLS = 2000
+PRINTED_CALLS = 200  # the printing cases flood the console, keep them short
+UID = bytes([0x86, 0xE1, 0x8D, 0x5A])
+
+def legacy_log(message):
+    print(f"[{time.time()}] {message}")
+
+def bench(call, calls=CALLS):
+    gc.collect()
+    start = time.ticks_us()
+    for _ in range(calls):
+        call()
+    return time.ticks_diff(time.ticks_us(), start) / calls
+
+log = logger.get('bench')
+reader = 'main'
+results = []
+
+results.append(("legacy f-string + print", bench(lambda: legacy_log(f"Card Found on {reader}! UID: {UID}"), PRINTED_CALLS)))
+
+logger.configure(level=logger.INFO, uart=False)
+results.append(("debug(), level INFO (disabled)", bench(lambda: log.debug("Card Found on %s! UID: %s", reader, UID))))
+results.append(("info(), ring only", bench(lambda: log.info("Card Found on %s! UID: %s", reader, UID))))
+
+logger.configure(uart=True)
+results.append(("info(), ring + UART", bench(lambda: log.info("Card Found on %s! UID: %s", reader, UID), PRINTED_CALLS)))
+logger.configure(uart=False)
+
+for name, us in results:
+    print(f"{name:<34}{us:8.2f} us per call")
+print(f"ring holds {len(logger.records())} records, {logger.dropped} overwritten, last: {logger.records(1)[0]}")
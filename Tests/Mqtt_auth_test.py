@@ -2,7 +2,7 @@ from mqtt_manager import MqttManager
 import ujson
 import time
 import uasyncio as asyncio
-from utils import connect_wifi, generate_default_reader_id, load_credentials
+from utils import start_wifi, wait_connected, generate_default_reader_id, load_credentials
 
 def log(message):
     print(f"[{time.time()}] MAIN: {message}")
@@ -21,7 +21,10 @@ async def main():
     credits = load_credentials()
     log(f"Device ID: {credits['CLIENT_ID']}")
     log(f"Reader ID: {credits.get('READER_ID', generate_default_reader_id())}")
-    connect_wifi(credits['WIFI_SSID'], credits['WIFI_PASSWORD'])
+    sta_if = start_wifi(credits['WIFI_SSID'], credits['WIFI_PASSWORD'])
+    if sta_if is None or not await wait_connected(sta_if, timeout_ms=20000):
+        log("WiFi not connected")
+        return
 
     load_config()
 
@@ -30,7 +33,7 @@ async def main():
                             config_cb=lambda var, val: log(f"Config update: {var} = {val}"),
                             reset_cb=lambda: log("Reset triggered"))    
 
-    mqtt_manager.log("Starting MQTT Manager...")
+    log("Starting MQTT Manager...")
 
     await mqtt_manager.connect()
 
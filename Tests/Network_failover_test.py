@@ -0,0 +1,95 @@
+import time
+import uasyncio as asyncio
+from fake_network import FakeNetwork, PHY_IP101
+from network_manager import NetworkManager, ETHERNET, WIFI
+from supervisor import Supervisor, OK
+
+CHECK_MS = 100
+TIMEOUT_MS = 4000
+FAILBACK_S = 2
+LAN_UP_MS = 1500   # PHY link + DHCP
+WLAN_UP_MS = 2500  # association + DHCP
+
+config = {'PREFERED_NETWORK': 'ethernet', 'ETH_TYPE': 'IP101', 'ETH_PHY_ADDR': 0, 'ETH_POWER': -1}
+credits = {'WIFI_SSID': 'door', 'WIFI_PASSWORD': 'secret'}
+
+async def wait_for(manager, name, limit_ms):
+    start = time.ticks_ms()
+    while manager.active != name or manager.down_since is not None:
+        assert time.ticks_diff(time.ticks_ms(), start) < limit_ms, "no switch to " + name
+        await asyncio.sleep_ms(20)
+    return time.ticks_diff(time.ticks_ms(), start)
+
+async def main():
+    net = FakeNetwork(LAN_UP_MS, WLAN_UP_MS)
+    manager = NetworkManager(config, credits, net, CHECK_MS, TIMEOUT_MS, FAILBACK_S)
+    changes = []
+    manager.on_change(lambda name, ifconfig: changes.append(name))  # main.py reattaches MQTT here
+
+    start = time.ticks_ms()
+    print("boot:", await manager.connect(), "after", time.ticks_diff(time.ticks_ms(), start), "ms")
+    assert manager.active == ETHERNET and net.lan_args['phy_type'] == PHY_IP101, "ETH_TYPE is honoured"
+    monitor = asyncio.create_task(manager.run())
+
+    # Cable pulled: WiFi is not on standby, so failover = detection + association
+    net.lan.set_link(False)
+    took = await wait_for(manager, WIFI, CHECK_MS + TIMEOUT_MS)
+    print("cable pulled: on wifi after {} ms, reported {} ms".format(took, manager.last_failover_ms))
+    assert manager.failovers == 1 and manager.last_failover_ms <= CHECK_MS * 2 + WLAN_UP_MS + 200
+
+    # Cable back: Ethernet is taken back once stable for FAILBACK_S, WiFi is dropped
+    net.lan.set_link(True)
+    took = await wait_for(manager, ETHERNET, LAN_UP_MS + FAILBACK_S * 1000 + 1000)
+    print("cable back: on ethernet after {} ms".format(took))
+    assert not net.wlan.isconnected()
+
+    # A flapping cable shorter than the failback hold does not move traffic back
+    net.lan.set_link(False)
+    await wait_for(manager, WIFI, CHECK_MS + TIMEOUT_MS)
+    net.lan.set_link(True)
+    await asyncio.sleep_ms(LAN_UP_MS + 300)
+    net.lan.set_link(False)
+    await asyncio.sleep_ms(FAILBACK_S * 1000)
+    assert manager.active == WIFI, "no failback on a flapping link"
+
+    # Both links down: the manager keeps trying, WiFi comes back first
+    net.wlan.set_link(False)
+    await asyncio.sleep_ms(500)
+    net.wlan.set_link(True)
+    took = await wait_for(manager, WIFI, 2 * TIMEOUT_MS + WLAN_UP_MS)
+    print("both down, access point back: on wifi after {} ms".format(took))
+
+    manager.stop()
+    await monitor
+    print("interface changes:", changes)
+    print("stats:", manager.stats())
+    assert changes[0] == ETHERNET and changes.count(WIFI) >= 3
+
+    # Boot without any link: connect() gives up after one pass, the supervisor brings the cable up later
+    net = FakeNetwork(300, 400)
+    net.lan.set_link(False)
+    net.wlan.set_link(False)
+    manager = NetworkManager(config, credits, net, CHECK_MS, 500, FAILBACK_S)
+    start = time.ticks_ms()
+    assert await asyncio.wait_for_ms(manager.connect(), 2 * 500 + 300) is None and manager.active is None, "one pass over both interfaces"
+    took = time.ticks_diff(time.ticks_ms(), start)
+    print("boot without link: gave up after", took, "ms")
+    monitor = asyncio.create_task(manager.run())
+    supervisor = Supervisor(CHECK_MS, 200, 1000, 100, 1, 5, 600)
+    supervisor.add('network', lambda: manager.is_up(manager.active), lambda attempt: manager.restart(),
+                   grace_ms=2 * manager.timeout_ms + manager.check_ms)
+    asyncio.create_task(supervisor.run())
+    await asyncio.sleep_ms(3000)
+    assert manager.active is None and supervisor.subsystems['network'].failures >= 1
+    net.lan.set_link(True)
+    start = time.ticks_ms()
+    while supervisor.subsystems['network'].state != OK or manager.active != ETHERNET:
+        assert time.ticks_diff(time.ticks_ms(), start) < 4000, "network not brought up by the supervisor"
+        await asyncio.sleep_ms(20)
+    print("cable plugged in: up after", time.ticks_diff(time.ticks_ms(), start), "ms,", supervisor.subsystems['network'].restarts, "restarts")
+    supervisor.stop()
+    manager.stop()
+    await monitor
+    print("OK")
+
+asyncio.run(main())
@@ -0,0 +1,163 @@
+import random
+import time
+import ujson
+import uasyncio as asyncio
+import utils
+from access_rules import GRANTED
+from online_auth import OnlineAuth, ONLINE, CACHE, FALLBACK, DENIED
+from mqtt_manager import MqttManager
+
+# Decision latency of the online authorization against a local stand-in of
+# the backend: it answers after a random delay, like a broker round trip plus
+# a database lookup, and may be slow or gone. The decision time must never
+# exceed the deadline by more than one poll period.
+
+DEADLINE_MS = 150
+CARDS = ['10-20-30-%d' % n for n in range(100)]
+TAPS = 300
+
+class StandInBackend:
+    """Receives the requests the reader publishes and answers on its reply topic after `delay()` ms."""
+    def __init__(self, delay, revoked=(), extra=None):
+        self.delay = delay
+        self.revoked = set(revoked)
+        self.extra = extra or {}  # added to every reply
+        self.pending = []  # (due ticks_ms, reply)
+        self.is_connected = True
+        self.handler = None  # OnlineAuth.handle_reply, subscribed by MqttManager in main.py
+        self.requests = []
+
+    def request_auth(self, data):
+        request = ujson.loads(data)
+        self.requests.append(request)
+        revoked = request['uid'] in self.revoked
+        reply = {'id': request['id'], 'verdict': 'revoked' if revoked else GRANTED}
+        reply.update(self.extra)
+        if revoked:
+            reply['ttl'] = 0  # never cached on the reader
+        self.pending.append((time.ticks_add(time.ticks_ms(), self.delay()), ujson.dumps(reply)))
+        return True
+
+    def poll(self, only):
+        now = time.ticks_ms()
+        due = [p for p in self.pending if time.ticks_diff(now, p[0]) >= 0]
+        for p in due:
+            self.pending.remove(p)
+            self.handler(p[1])
+
+def percentiles(samples):
+    samples = sorted(samples)
+    n = len(samples)
+    return "p50 {:4} ms  p90 {:4} ms  p99 {:4} ms  max {:4} ms".format(
+        samples[n // 2], samples[n * 9 // 10], samples[n * 99 // 100], samples[-1])
+
+async def run(name, backend, cache_s=30, taps=TAPS):
+    auth = OnlineAuth(backend, DEADLINE_MS, cache_s)
+    backend.handler = auth.handle_reply
+    times = []
+    verdicts = {}
+    for _ in range(taps):
+        uid = random.choice(CARDS)
+        start = time.ticks_ms()
+        verdict, source = await auth.authorize(uid, 'main', GRANTED)
+        times.append(time.ticks_diff(time.ticks_ms(), start))
+        verdicts[source] = verdicts.get(source, 0) + 1
+        await asyncio.sleep_ms(random.randint(0, 20))
+    print("{:28} {}  {}".format(name, percentiles(times), verdicts))
+    return auth, times
+
+async def main():
+    random.seed(11)
+    # Backend answering in 10-60 ms, no cache: every tap waits for the round trip
+    auth, times = await run("backend 10-60 ms, no cache", StandInBackend(lambda: random.randint(10, 60)), cache_s=0)
+    assert auth.counts[ONLINE] == TAPS and max(times) < 60 + 20
+    print("  answer time seen by the reader:", auth.percentiles())
+
+    # Same with the verdict cache: repeated cards are answered without a request
+    auth, times = await run("backend 10-60 ms, cached", StandInBackend(lambda: random.randint(10, 60)))
+    assert auth.counts[CACHE] > TAPS // 2
+
+    # Slow backend, 1 in 4 answers after the deadline: the local decision stands, bounded wait
+    slow = lambda: random.randint(200, 400) if random.random() < 0.25 else random.randint(10, 60)
+    auth, times = await run("backend 25% > 200 ms", StandInBackend(slow), cache_s=0)
+    assert auth.counts[FALLBACK] > 0 and max(times) <= DEADLINE_MS + 20
+    await asyncio.sleep_ms(400)
+
+    # Broker gone: immediate local decision
+    backend = StandInBackend(lambda: 10)
+    backend.is_connected = False
+    auth, times = await run("broker down", backend, taps=50)
+    assert auth.counts[FALLBACK] == 50 and max(times) <= 2
+
+    # Revocation applies at once: a revoked card is refused and never cached
+    backend = StandInBackend(lambda: 20, revoked=[CARDS[0]])
+    auth = OnlineAuth(backend, DEADLINE_MS, 30)
+    backend.handler = auth.handle_reply
+    for _ in range(3):
+        verdict, source = await auth.authorize(CARDS[0], 'main', GRANTED)
+        assert verdict == DENIED and source == ONLINE
+    print("revoked card refused online 3 times out of 3, stats:", auth.stats())
+
+    # A malformed ttl must not break the tap: numbers are taken, anything else caches for cache_s
+    for ttl, cached in (("abc", True), (None, True), ([1], True), (True, True), ("0", False), (1e30, True)):
+        backend = StandInBackend(lambda: 5, extra={'ttl': ttl})
+        auth = OnlineAuth(backend, DEADLINE_MS, 30)
+        backend.handler = auth.handle_reply
+        assert (await auth.authorize(CARDS[1], 'main', GRANTED)) == (GRANTED, ONLINE)
+        assert (await auth.authorize(CARDS[1], 'main', GRANTED))[1] == (CACHE if cached else ONLINE), ttl
+    print("malformed ttl values fall back to the cache time")
+
+    # A verdict holds for the door it was asked for: granted at 'main', 'side' still asks the backend
+    backend = StandInBackend(lambda: 5)
+    auth = OnlineAuth(backend, DEADLINE_MS, 30)
+    backend.handler = auth.handle_reply
+    assert (await auth.authorize(CARDS[2], 'main', GRANTED)) == (GRANTED, ONLINE)
+    assert (await auth.authorize(CARDS[2], 'main', GRANTED))[1] == CACHE
+    assert (await auth.authorize(CARDS[2], 'side', GRANTED))[1] == ONLINE
+    assert [r['door'] for r in backend.requests] == ['main', 'side']
+    print("cached verdicts are per door")
+
+    await management_waits()
+    print("OK")
+
+class FakeClient:
+    """umqtt's MQTTClient: check_msg() hands over one received message, like the real one."""
+    def __init__(self):
+        self.inbox = []
+        self.published = []
+
+    def set_callback(self, cb):
+        self.cb = cb
+
+    def check_msg(self):
+        if self.inbox:
+            self.cb(*self.inbox.pop(0))
+
+    def publish(self, topic, msg, *args, **kwargs):
+        self.published.append((topic, msg))
+
+async def management_waits():
+    """A config message arriving while a tap waits for its verdict is applied by message_loop, after the decision."""
+    if not utils.load_credentials():
+        utils._credentials = {'CLIENT_ID': 'test', 'BROKER_ADDR': '127.0.0.1', 'BROKER_PORT': 1883,
+                              'CLIENT_NAME': 'test', 'MQTT_PASSWORD': ''}
+    config = dict(utils.DEFAULT_CONFIG)
+    events = []
+    manager = MqttManager(config, lambda *a: None, None, lambda var, val: events.append('config'), None)
+    manager.mqttc = client = FakeClient()
+    client.set_callback(manager._callback)
+    manager.is_connected = True
+    auth = OnlineAuth.from_config(config, manager)
+    manager.register_command(config["MANAGE_AUTH_REPLY"], lambda msg: events.append('reply') or auth.handle_reply(msg))
+    reply_topic = manager.form_topic_sub(config["MANAGE_AUTH_REPLY"]).encode()
+    config_topic = (manager.topic_config_base + '/MQTT_DELAY').encode()
+    client.inbox = [(config_topic, b'100'), (reply_topic, b'{"id": 1, "verdict": "granted"}')]
+    assert (await auth.authorize(CARDS[3], 'main', GRANTED)) == (GRANTED, ONLINE)
+    assert events == ['reply'], events
+    loop = asyncio.create_task(manager.message_loop())
+    await asyncio.sleep_ms(50)
+    loop.cancel()
+    assert events == ['reply', 'config'], events
+    print("management messages received during a decision wait for the message loop")
+
+asyncio.run(main())
@@ -0,0 +1,69 @@
+import time
+import NFC_PN532 as nfc
+from pn532_emulator import PN532Emulator, Card
+
+CALLS = 300
+CARD = Card(b'\x01\x02\x03\x04')
+
+class NoSleep:
+    """The driver's time module without the SPI settle sleeps, so only CPU cost is measured."""
+    ticks_ms = staticmethod(time.ticks_ms)
+    ticks_us = staticmethod(time.ticks_us)
+    ticks_diff = staticmethod(time.ticks_diff)
+    ticks_add = staticmethod(time.ticks_add)
+
+    @staticmethod
+    def sleep(s):
+        pass
+
+    @staticmethod
+    def sleep_ms(ms):
+        pass
+
+class FaultyEmulator(PN532Emulator):
+    """Corrupts the data checksum of every `every`-th response frame."""
+    def __init__(self, every=0, **kwargs):
+        super().__init__(**kwargs)
+        self.every = every
+        self.replies = 0
+
+    def _reply(self, command, data):
+        super()._reply(command, data)
+        self.replies += 1
+        if self.every and self.replies % self.every == 0:
+            frame = bytearray(self._pending[-1])
+            frame[-2] ^= 0xFF
+            self._pending[-1] = bytes(frame)
+
+def cost(trace):
+    emulator = PN532Emulator(card=CARD)
+    pn532 = nfc.PN532(emulator.spi, emulator.cs)
+    pn532.enable_trace(trace)
+    start = time.ticks_us()
+    for _ in range(CALLS):
+        pn532.get_firmware_version()
+    return time.ticks_diff(time.ticks_us(), start) / CALLS
+
+real_time = nfc.time
+nfc.time = NoSleep
+try:
+    off = min(cost(False) for _ in range(3))
+    on = min(cost(True) for _ in range(3))
+finally:
+    nfc.time = real_time
+print(f"call_function CPU time: {off:.1f} us untraced, {on:.1f} us traced ({on - off:+.1f} us)")
+
+# Real timings with faults: empty field timeouts and corrupted frames
+emulator = FaultyEmulator(every=7, card=CARD)
+pn532 = nfc.PN532(emulator.spi, emulator.cs)
+pn532.enable_trace()
+for n in range(40):
+    emulator.card = None if n % 4 == 3 else CARD
+    try:
+        if pn532.read_passive_target(timeout=50) is None:
+            pn532.abort()
+        pn532.get_firmware_version()
+    except RuntimeError:
+        pass
+for command, stats in pn532.trace_stats().items():
+    print(command, stats)
@@ -0,0 +1,70 @@
+import time
+import uasyncio as asyncio
+from profiler import Profiler
+from telemetry import Telemetry
+
+DURATION_MS = 3000
+RESUMES = 2000
+
+async def polite(state):
+    # Yields often and never blocks, like the LED frame loop
+    while state['running']:
+        await asyncio.sleep_ms(5)
+
+async def blocking(state):
+    # A blocking call every 200 ms, like check_msg() on a slow socket
+    while state['running']:
+        time.sleep_ms(60)
+        await asyncio.sleep_ms(200)
+
+async def spinner(n):
+    for _ in range(n):
+        await asyncio.sleep_ms(0)
+
+async def overhead():
+    """Extra time per resume of a wrapped task."""
+    start = time.ticks_us()
+    await asyncio.create_task(spinner(RESUMES))
+    plain = time.ticks_diff(time.ticks_us(), start)
+    profiler = Profiler()
+    start = time.ticks_us()
+    await asyncio.create_task(profiler.wrap('spinner', spinner(RESUMES)))
+    wrapped = time.ticks_diff(time.ticks_us(), start)
+    print("wrapper overhead: {:.1f} us per resume".format((wrapped - plain) / RESUMES))
+
+async def main():
+    await overhead()
+
+    profiler = Profiler(lag_probe_ms=50, slow_us=20000)
+    telemetry = Telemetry(interval=1, profiler=profiler)
+    state = {'running': True}
+    probe = asyncio.create_task(profiler.run())
+    tasks = [asyncio.create_task(profiler.wrap('polite', polite(state))),
+             asyncio.create_task(profiler.wrap('blocking', blocking(state)))]
+    snapshots = []
+    for _ in range(3):  # telemetry snapshots take their own intervals...
+        await asyncio.sleep_ms(DURATION_MS // 3)
+        snapshots.append(telemetry.snapshot())
+    state['running'] = False
+    profiler.stop()
+    for t in tasks + [probe]:
+        await t
+
+    profiler.print_top()
+    top = profiler.top()
+    lag = profiler.lag()
+    assert top[0]['task'] == 'blocking', "the blocking task must be the top offender"
+    assert top[0]['max_ms'] >= 60 and top[0]['slow'] > 0
+    assert lag['max'] >= 40 and lag['spikes'] > 0, "the lag probe must see the blocking calls"
+    assert top[0]['blamed'] == lag['spikes'], "lag spikes must be blamed on the blocking task"
+    # ...and leave the profiler window alone: it still covers the whole run
+    interval_spikes = sum(s['loop_lag_ms']['spikes'] for s in snapshots)
+    assert interval_spikes <= lag['spikes'] and all(s['top_tasks'][0]['task'] == 'blocking' for s in snapshots)
+    assert top[0]['busy_ms'] >= sum(s['top_tasks'][0]['busy_ms'] for s in snapshots)
+    print("telemetry intervals:", [s['loop_lag_ms'] for s in snapshots])
+    profiler.reset()  # the profile command's reset does not disturb telemetry either
+    assert profiler.top()[0]['busy_ms'] == 0 and profiler.lag()['spikes'] == 0
+    assert telemetry.snapshot()['loop_lag_ms']['spikes'] == lag['spikes'] - interval_spikes
+    print("OK")
+
+asyncio.run(main())
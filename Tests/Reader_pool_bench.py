@@ -0,0 +1,62 @@
+import time
+from reader_pool import ReaderPool
+from pn532_emulator import PN532Emulator, FakeBus, Card
+
+POLLS = 100
+
+bus = FakeBus()
+entry = PN532Emulator(bus, card=Card(b'\x11\x22\x33\x44'))
+exit_ = PN532Emulator(bus)  # nobody at the exit, polls time out
+entry.second_card = Card(b'\x55\x66\x77\x88')
+
+def run(name, readers):
+    pool = ReaderPool(bus, readers, poll_timeout=20)
+    pool.init_drivers()
+    for reader in pool.readers:
+        reader.pn532.SAM_configuration()
+        reader.connected = True
+    pool.reset_stats()
+    collisions = bus.collisions
+    events = {}
+    for _ in range(POLLS):
+        reader, uids = pool.poll()
+        events[reader.name] = events.get(reader.name, 0) + len(uids)
+    print(f"--- {name}: {POLLS} polls, bus collisions: {bus.collisions - collisions}")
+    for antenna, s in pool.stats().items():
+        print(f"{antenna:<6} polls: {s['polls']:>4}  reads: {events.get(antenna, 0):>4}  polls/s: {s['polls_per_s']:6.1f}  reads/min: {s['reads_per_min']:8.1f}  avg poll: {s['avg_poll_ms']:5.1f} ms  bus share: {s['bus_share'] * 100:4.1f}%")
+
+run("round-robin, MaxTg=1", [{'name': 'entry', 'cs': entry.cs}, {'name': 'exit', 'cs': exit_.cs}])
+run("round-robin, MaxTg=2", [{'name': 'entry', 'cs': entry.cs, 'max_targets': 2}, {'name': 'exit', 'cs': exit_.cs, 'max_targets': 2}])
+run("entry priority 3", [{'name': 'entry', 'cs': entry.cs, 'priority': 3, 'max_targets': 2}, {'name': 'exit', 'cs': exit_.cs}])
+
+# ISO14443-4 cards (DESFire, phones) answer with an ATS after their UID: the
+# second target must be parsed after it, with the frame read in full
+for first in (Card(b'\x04\x52\x19\x8A\x3C\x5E\x80', atqa=0x0344, sak=0x20, ats=b'\x06\x75\x77\x81\x02\x80'),
+              Card(b'\x08\x9A\x1B\x2C', sak=0x20, ats=b'\x14\x78\x80\x70\x02' + bytes(range(15)))):
+    entry.card = first
+    entry.second_card = Card(b'\x55\x66\x77\x88')
+    pool = ReaderPool(bus, [{'name': 'entry', 'cs': entry.cs, 'max_targets': 2}], poll_timeout=20)
+    pool.init_drivers()
+    pool.readers[0].pn532.SAM_configuration()
+    pool.readers[0].connected = True
+    reader, uids = pool.poll()
+    assert [bytes(u) for u in uids] == [first.uid, b'\x55\x66\x77\x88'], uids
+    assert reader.pn532.card_class() & 0xFF == 0x20
+print("ATS cards next to a second card: both UIDs read")
+
+# Key ring next to a second card: after each failed key the card is selected
+# again by its UID, the keys are never tried on the other card
+import NFC_PN532 as nfc
+from mifare_keys import MifareKeyRing
+site_key = b'\xA0\xA1\xA2\xA3\xA4\xA5'
+entry.card = Card(b'\x11\x22\x33\x44', key=site_key)
+entry.second_card = Card(b'\x55\x66\x77\x88')
+keyring = MifareKeyRing(['FFFFFFFFFFFF', 'D3F7D3F7D3F7', 'A0A1A2A3A4A5'])
+pool = ReaderPool(bus, [{'name': 'entry', 'cs': entry.cs, 'max_targets': 2}], poll_timeout=20)
+pool.init_drivers()
+pool.readers[0].pn532.SAM_configuration()
+pool.readers[0].connected = True
+reader, uids = pool.poll()
+assert nfc.authenticate_with_keyring(reader.pn532, uids[0], keyring) == 2
+assert entry.selected is entry.card and keyring.failures == 0
+print("key ring next to a second card: third key found on the right card")
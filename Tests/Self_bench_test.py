@@ -0,0 +1,66 @@
+import time
+import uasyncio as asyncio
+from machine import Pin
+import neopixel
+from reader_pool import ReaderPool
+from spi_arbiter import BusArbiter, PRIORITY_READ
+from pn532_emulator import PN532Emulator, Card, FakeBus
+from self_bench import SelfBenchmark
+
+# Runs the self-benchmark against the PN532 emulator while cards are being
+# read: the report must be complete, and the reads must keep their pace
+# during the run: the suite uses the bus when it is idle, or once deferred
+# for max_defer_ms, and then delays one read by a single probe at most.
+
+READ_GAP_MS = 10
+WHITELIST = set('%d-%d-%d-%d' % (n >> 8, n & 0xFF, 7, 9) for n in range(1000))
+
+class Bus(FakeBus):
+    """As on the board, a transfer with every CS high reaches no chip (the SPI throughput step)."""
+    def write(self, buf):
+        if self.selected is not None:
+            FakeBus.write(self, buf)
+
+async def main():
+    emulator = PN532Emulator(Bus(), card=Card(b'\x01\x02\x03\x04'))
+    pool = ReaderPool(emulator.spi, [{'name': 'main', 'cs': emulator.cs}], poll_timeout=30)
+    pool.init_drivers()
+    reader = pool.readers[0]
+    reader.pn532.SAM_configuration()
+    reader.connected = True
+    arbiter = BusArbiter(idle_ms=20, max_defer_ms=1000)
+    owner = asyncio.create_task(arbiter.run())
+    np = neopixel.NeoPixel(Pin(5), 24)
+    bench = SelfBenchmark(arbiter, pool, np, samples=10, flash_kb=16, flash_file='test_bench.tmp')
+
+    waits = []
+    reads = [0]
+    async def read_loop():
+        while True:
+            start = time.ticks_ms()
+            _, uids = await arbiter.submit(PRIORITY_READ, pool.poll)
+            waits.append(time.ticks_diff(time.ticks_ms(), start))
+            reads[0] += len(uids)
+            await asyncio.sleep_ms(READ_GAP_MS)
+
+    task = asyncio.create_task(read_loop())
+    await asyncio.sleep_ms(500)
+    alone = sorted(waits)
+    waits.clear()
+    report = await bench.run(WHITELIST)
+    task.cancel()
+    owner.cancel()
+    print("report:", report)
+    for key in ('pn532_rtt_us', 'spi_kbps', 'flash', 'encode', 'np_write_us', 'whitelist'):
+        assert key in report and not (isinstance(report[key], dict) and 'error' in report[key]), key
+    assert report['pn532_rtt_us']['main'][2] == 0, "lost probes"
+    assert report['encode']['binary_bytes'] < report['encode']['json_bytes']
+    during = sorted(waits)
+    print("card read time: p50 {} ms, max {} ms alone; p50 {} ms, max {} ms during the benchmark ({} reads)".format(
+        alone[len(alone) // 2], alone[-1], during[len(during) // 2], during[-1], reads[0]))
+    # A bench job never runs between the frames of a read: a read waits for one of them at most
+    assert during[-1] <= alone[-1] + report['pn532_rtt_us']['main'][1] // 1000 + 10
+    assert not bench.running and bench.runs == 1
+    print("OK")
+
+asyncio.run(main())
@@ -0,0 +1,104 @@
+import sys
+import time
+import gc
+
+# Run after a reset, before main.py has imported anything (e.g. with main.py renamed).
+# Imports what main.py imported at load time before and after the lazy imports,
+# each time from scratch, and compares the import cost that comes before the first
+# poll. Then boots main.py's NFC phase up to the first_poll milestone against an
+# emulated PN532, once with the modules that are now lazy imported first as they
+# used to be, once as main.py is now. The other boot phases (config, hardware)
+# are the same in both cases, see the boot report of main.py (BOOT_PROFILE).
+
+EAGER = ['NFC_PN532', 'utils', 'buzzer', 'led', 'mqtt_manager', 'mifare_keys', 'reader_pool', 'spi_arbiter',
+         'telemetry', 'profiler', 'error_reporter', 'startup', 'network_manager', 'time_service', 'logger',
+         'ntptime', 'json']
+FIRST_TAP = ['logger', 'startup', 'NFC_PN532', 'utils', 'buzzer', 'led', 'mifare_keys', 'reader_pool',
+             'spi_arbiter', 'telemetry', 'profiler', 'error_reporter', 'time_service']
+LAZY = [name for name in EAGER if name not in FIRST_TAP and name != 'startup']  # imported by their boot phase now
+ROUNDS = 5
+MAIN = 'main'  # main.py, under the name it was renamed to on the board
+KEEP = set(sys.modules)  # built-ins and whatever the runner needs
+
+def forget():
+    for name in list(sys.modules):
+        if name not in KEEP:
+            del sys.modules[name]
+    gc.collect()
+
+def import_all(names):
+    forget()
+    times = {}
+    free = gc.mem_free()
+    start = time.ticks_ms()
+    for name in names:
+        t = time.ticks_ms()
+        try:
+            __import__(name)
+        except ImportError as e:
+            print("  skipped", name, e)
+        times[name] = time.ticks_diff(time.ticks_ms(), t)
+    return time.ticks_diff(time.ticks_ms(), start), free - gc.mem_free(), times
+
+before, before_heap, before_times = import_all(EAGER)
+after, after_heap, _ = import_all(FIRST_TAP)
+
+print("module imports before the first poll:")
+for name, ms in sorted(before_times.items(), key=lambda item: -item[1]):
+    print("  {:16} {:5} ms{}".format(name, ms, "" if name in FIRST_TAP else "  (not before the first poll any more)"))
+print("before: {} ms, {} B of heap".format(before, before_heap))
+print("after:  {} ms, {} B of heap".format(after, after_heap))
+
+# secrets.json used to be parsed twice (main and MqttManager)
+forget()
+import utils
+start = time.ticks_us()
+first = utils.load_credentials(log=lambda *a: None)
+parse = time.ticks_diff(time.ticks_us(), start)
+start = time.ticks_us()
+assert utils.load_credentials(log=lambda *a: None) is first or not first
+cached = time.ticks_diff(time.ticks_us(), start)
+print("load_credentials(): {} us parsed, {} us cached".format(parse, cached))
+
+class Leds:
+    def set_annimation(self, name, duration=0):
+        pass
+
+def first_poll(first):
+    """Imports `first` then main.py and runs its NFC phase: (import ms, first_poll ms) counted from before the imports."""
+    forget()
+    start = time.ticks_ms()
+    for name in first:
+        try:
+            __import__(name)
+        except ImportError as e:
+            print("  skipped", name, e)
+    main = __import__(MAIN)
+    imported = time.ticks_diff(time.ticks_ms(), start)
+    import uasyncio as asyncio
+    from startup import BootSequence
+    from pn532_emulator import PN532Emulator
+    from reader_pool import ReaderPool
+    from spi_arbiter import BusArbiter
+    from supervisor import Supervisor
+    emulator = PN532Emulator()
+    main.led_controller = Leds()
+    main.supervisor = Supervisor(wdt=None)
+    main.reader_pool = ReaderPool(emulator.spi, [{'name': 'main', 'cs': emulator.cs}], poll_timeout=20)
+    main.arbiter = BusArbiter()
+    boot = BootSequence(start)
+    async def nfc():
+        asyncio.create_task(main.arbiter.run())
+        assert await main.bring_up_nfc(boot)
+    asyncio.run(nfc())
+    return imported, boot.milestones['first_poll']
+
+old = []
+new = []
+for _ in range(ROUNDS):  # alternated, the best of each
+    old.append(first_poll(LAZY))
+    new.append(first_poll([]))
+print("boot to first poll, emulated PN532, best and worst of {} (includes the 2 x 1 s wakeup settle):".format(ROUNDS))
+for name, runs in (("before", old), ("after", new)):
+    runs.sort(key=lambda run: run[1])
+    print("  {:6}  {} - {} ms, of which {} - {} ms of imports".format(name, runs[0][1], runs[-1][1], runs[0][0], runs[-1][0]))
@@ -0,0 +1,159 @@
+import time
+import uasyncio as asyncio
+from fake_network import FakeNetwork
+from network_manager import NetworkManager, ETHERNET
+from supervisor import Supervisor, OK, OPEN
+
+# Injects the failures the supervisor has to recover from, without a reset,
+# and prints the recovery time of each. Timings are scaled down (50 ms checks,
+# 100 ms first backoff) so the run takes seconds. A local access task keeps
+# deciding taps all along: it must never stall.
+
+INTERVAL_MS = 50
+BACKOFF_MS = 100
+BREAKER_FAILURES = 5
+BREAKER_OPEN_S = 2
+MAX_DOWN_S = 2
+
+class FakeWDT:
+    def __init__(self):
+        self.last_feed = time.ticks_ms()
+
+    def feed(self):
+        self.last_feed = time.ticks_ms()
+
+    def starving_ms(self):
+        return time.ticks_diff(time.ticks_ms(), self.last_feed)
+
+class FakeBroker:
+    """The MQTT client and its broker: connect() fails while the broker is down."""
+    def __init__(self):
+        self.up = True
+        self.connected = True
+        self.attempts = 0
+
+    def drop(self):
+        self.up = False
+        self.connected = False
+
+    async def connect(self, attempt):
+        self.attempts += 1
+        await asyncio.sleep_ms(20)  # TCP + CONNECT round trip
+        self.connected = self.up
+        return self.connected
+
+class FakeReader:
+    """A PN532 that hangs: a plain reconnect does not help, a fresh driver (and wakeup) does."""
+    def __init__(self):
+        self.connected = True
+        self.hung = False
+        self.drivers = 1
+
+    def hang(self):
+        self.hung = True
+        self.connected = False
+
+    async def restart(self, attempt):
+        if attempt > 1:
+            self.drivers += 1
+            self.hung = False
+            await asyncio.sleep_ms(200)  # settle after the wakeup
+        self.connected = not self.hung
+        return self.connected
+
+async def local_decisions(counter):
+    """Stands in for read_nfc: taps keep being decided locally whatever else is down."""
+    while True:
+        counter[0] += 1
+        await asyncio.sleep_ms(10)
+
+async def recovered(supervisor, name, limit_ms):
+    sub = supervisor.subsystems[name]
+    start = time.ticks_ms()
+    while sub.down_since is None and sub.last_recovery_ms is None:
+        assert time.ticks_diff(time.ticks_ms(), start) < limit_ms, name + " never seen down"
+        await asyncio.sleep_ms(10)
+    while sub.state != OK or sub.down_since is not None or sub.task is not None:
+        assert time.ticks_diff(time.ticks_ms(), start) < limit_ms, name + " did not recover"
+        await asyncio.sleep_ms(10)
+    return sub.last_recovery_ms
+
+async def keeps_deciding(counter, ms):
+    before = counter[0]
+    await asyncio.sleep_ms(ms)
+    return counter[0] - before
+
+async def main():
+    # The watchdog is armed by main.py after the hardware init, never by from_config (a halted board must not reset)
+    assert Supervisor.from_config({'SUPERVISOR_WDT_MS': 60000}).wdt is None
+    wdt = FakeWDT()
+    supervisor = Supervisor(INTERVAL_MS, BACKOFF_MS, 2000, BREAKER_FAILURES, BREAKER_OPEN_S, 5, MAX_DOWN_S, wdt)
+    broker = FakeBroker()
+    reader = FakeReader()
+    net = FakeNetwork(lan_up_ms=300, wlan_up_ms=400)
+    network = NetworkManager({'ETH_TYPE': 'LAN8720', 'ETH_POWER': -1}, {}, net, 50, 500, 2)
+    await network.connect()
+    asyncio.create_task(network.run())
+
+    supervisor.add('pn532', lambda: reader.connected, reader.restart, critical=True)
+    supervisor.add('network', lambda: network.is_up(network.active), lambda attempt: network.restart(),
+                   grace_ms=2 * network.timeout_ms + network.check_ms)
+    supervisor.add('mqtt', lambda: broker.connected or not network.is_up(network.active), broker.connect)
+    taps = [0]
+    asyncio.create_task(local_decisions(taps))
+    asyncio.create_task(supervisor.run())
+    results = []
+
+    # 1. Broker down for 1 s: reconnects with backoff, recovered at the first attempt after it is back
+    broker.drop()
+    await asyncio.sleep_ms(1000)
+    broker.up = True
+    results.append(('mqtt broker down 1 s', await recovered(supervisor, 'mqtt', 3000), broker.attempts))
+
+    # 2. Ethernet PHY wedged (link up, no DHCP) and no access point: failover cannot help, the interface is restarted
+    net.wlan.set_link(False)
+    net.lan.started = None
+    took = await recovered(supervisor, 'network', 5000)
+    assert network.active == ETHERNET and net.lan.starts >= 2
+    results.append(('network interface wedged', took, supervisor.subsystems['network'].restarts))
+    net.wlan.set_link(True)
+    await recovered(supervisor, 'mqtt', 2000)  # mqtt was not restarted while the network was down
+
+    # 3. PN532 hung: the reconnect fails, the second attempt recreates the driver
+    reader.hang()
+    results.append(('pn532 hung', await recovered(supervisor, 'pn532', 3000), reader.drivers - 1))
+
+    # 4. Broker gone for good: the circuit opens after BREAKER_FAILURES restarts, then one trial per BREAKER_OPEN_S
+    broker.attempts = 0
+    broker.drop()
+    sub = supervisor.subsystems['mqtt']
+    while sub.state != OPEN:
+        await asyncio.sleep_ms(10)
+    opened = broker.attempts
+    assert opened == BREAKER_FAILURES
+    decided = await keeps_deciding(taps, BREAKER_OPEN_S * 1000 - 200)
+    assert broker.attempts == opened, "no attempt while the circuit is open"
+    assert decided > 50, "local decisions kept going"
+    broker.up = True
+    results.append(('mqtt broker dead, circuit open', await recovered(supervisor, 'mqtt', BREAKER_OPEN_S * 1000 + 500), broker.attempts))
+
+    # 5. Critical subsystem down for good: the watchdog is no longer fed after MAX_DOWN_S
+    async def broken(attempt):
+        raise OSError("SPI bus stuck")
+    supervisor.subsystems['pn532'].restart = broken
+    reader.hang()
+    await asyncio.sleep_ms(MAX_DOWN_S * 1000 + 500)
+    assert wdt.starving_ms() >= 300, "watchdog left to reset the board"
+    decided = await keeps_deciding(taps, 300)
+    assert decided > 10
+
+    print("{:32} {:>8} {:>9}".format("failure", "recovery", "restarts"))
+    for name, ms, count in results:
+        print("{:32} {:>5} ms {:>9}".format(name, ms, count))
+    print("watchdog starving for {} ms with the readers down {} s".format(wdt.starving_ms(), MAX_DOWN_S))
+    print("stats:", supervisor.stats())
+    supervisor.stop()
+    network.stop()
+    print("OK")
+
+asyncio.run(main())
@@ -0,0 +1,169 @@
+import time
+import uasyncio as asyncio
+import utils
+import main
+from pn532_emulator import PN532Emulator, FakeBus
+from reader_pool import ReaderPool
+from spi_arbiter import BusArbiter
+from supervisor import Supervisor, OK
+from error_reporter import ErrorReporter
+from telemetry import Telemetry
+from mqtt_manager import MqttManager
+
+# Drives the real restart paths of main.py (bring_up_nfc, restart_pn532,
+# restart_mqtt) against two emulated PN532 on one bus. A hung chip must be
+# restarted on its own while the other reader keeps polling, and the critical
+# 'pn532' subsystem must only go down once no reader is left. A third chip
+# fails with SPI errors at boot: the others must come up all the same.
+# Timings are scaled down (50 ms checks, 100 ms first backoff).
+
+INTERVAL_MS = 50
+BACKOFF_MS = 100
+
+class HungEmulator(PN532Emulator):
+    """A PN532 that hangs: it ignores every frame until it is woken up again (a lone byte with CS low)."""
+    hung = False
+
+    def write(self, buf):
+        if self.hung:
+            self.hung = len(buf) != 1
+            return
+        PN532Emulator.write(self, buf)
+
+    def write_readinto(self, out, into):
+        if self.hung:
+            for i in range(len(into)):
+                into[i] = 0
+            return
+        PN532Emulator.write_readinto(self, out, into)
+
+class BrokenEmulator(PN532Emulator):
+    """A PN532 whose SPI transfers fail (e.g. a loose connector) while `broken`."""
+    broken = True
+
+    def write(self, buf):
+        if self.broken:
+            raise OSError(5)  # EIO
+        PN532Emulator.write(self, buf)
+
+    def write_readinto(self, out, into):
+        if self.broken:
+            raise OSError(5)
+        PN532Emulator.write_readinto(self, out, into)
+
+class Leds:
+    def set_annimation(self, name, duration=0):
+        pass
+
+class FakeClient:
+    """umqtt's MQTTClient with a broker that can go away: connect() fails while it is down."""
+    class Sock:
+        def close(self):
+            pass
+
+    def __init__(self):
+        self.up = True
+        self.connects = 0
+        self.sock = self.Sock()
+
+    def connect(self, clean_session=True):
+        self.connects += 1
+        if not self.up:
+            raise OSError('ECONNREFUSED')
+
+    def subscribe(self, *args, **kwargs):
+        pass
+
+    def set_last_will(self, *args, **kwargs):
+        pass
+
+    def publish(self, *args, **kwargs):
+        pass
+
+async def recovered(supervisor, name, limit_ms):
+    sub = supervisor.subsystems[name]
+    start = time.ticks_ms()
+    while sub.down_since is None and sub.last_recovery_ms is None:
+        assert time.ticks_diff(time.ticks_ms(), start) < limit_ms, name + " never seen down"
+        await asyncio.sleep_ms(10)
+    while sub.state != OK or sub.down_since is not None or sub.task is not None:
+        assert time.ticks_diff(time.ticks_ms(), start) < limit_ms, name + " did not recover"
+        await asyncio.sleep_ms(10)
+    return sub.last_recovery_ms
+
+class Boot:
+    def mark(self, name):
+        pass
+
+async def run():
+    bus = FakeBus()
+    chips = {'main': HungEmulator(bus), 'side': HungEmulator(bus), 'gate': BrokenEmulator(bus)}
+    main.config["CONNECTION_CHECK_INTERVAL"] = 1
+    main.config["CONNECTION_RETRIES"] = 2
+    main.config["NFC_POLL_MODE"] = "loop"
+    main.led_controller = Leds()
+    main.errors = ErrorReporter.from_config(main.publish_error, main.config)
+    main.telemetry = Telemetry.from_config(main.config)
+    main.supervisor = supervisor = Supervisor(INTERVAL_MS, BACKOFF_MS, 2000, 5, 2, 5, 600)
+    main.reader_pool = pool = ReaderPool(bus, [{'name': name, 'cs': chip.cs} for name, chip in chips.items()], poll_timeout=20)
+    main.arbiter = BusArbiter(idle_ms=20, max_defer_ms=1000)
+    asyncio.create_task(main.arbiter.run())
+    asyncio.create_task(supervisor.run())
+    assert await main.bring_up_nfc(Boot()), "readers up at boot"
+    assert not pool.get('gate').connected and pool.get('main').connected and pool.get('side').connected and main.connected_nfc
+    assert sorted(supervisor.subsystems) == ['pn532', 'pn532.gate', 'pn532.main', 'pn532.side']
+    assert supervisor.subsystems['pn532'].restart is None and supervisor.subsystems['pn532'].critical
+    results = []
+
+    # 0. The chip that failed at boot is restarted once its bus works again
+    chips['gate'].broken = False
+    results.append(('SPI errors at boot', await recovered(supervisor, 'pn532.gate', 5000), supervisor.subsystems['pn532.gate'].restarts))
+
+    # 1. One chip hangs: read_nfc drops it, only its subsystem restarts (driver recreated at attempt 2)
+    driver = pool.get('side').pn532
+    polls = chips['main'].commands.get(0x4A, 0)
+    chips['side'].hung = True
+    took = await recovered(supervisor, 'pn532.side', 10000)
+    assert pool.get('side').pn532 is not driver, "fresh driver"
+    assert chips['main'].commands.get(0x4A, 0) > polls + 5, "the other reader kept polling"
+    assert supervisor.subsystems['pn532'].down_since is None and supervisor.subsystems['pn532'].last_recovery_ms is None
+    assert supervisor.subsystems['pn532.main'].restarts == 0
+    results.append(('one reader hung', took, supervisor.subsystems['pn532.side'].restarts))
+
+    # 2. Both chips hang: now the critical subsystem is down, each reader is restarted on its own
+    chips['main'].hung = chips['side'].hung = True
+    chips['gate'].broken = True
+    took = await recovered(supervisor, 'pn532', 10000)
+    await recovered(supervisor, 'pn532.main', 5000)
+    await recovered(supervisor, 'pn532.side', 5000)
+    chips['gate'].broken = False
+    assert main.connected_nfc and supervisor.subsystems['pn532'].restarts == 0, "watched only"
+    results.append(('every reader hung', took, supervisor.subsystems['pn532.main'].restarts))
+
+    # 3. The broker goes away and comes back: restart_mqtt reattaches and connects once per attempt
+    if not utils.load_credentials():
+        utils._credentials = {'CLIENT_ID': 'test', 'BROKER_ADDR': '127.0.0.1', 'BROKER_PORT': 1883,
+                              'CLIENT_NAME': 'test', 'MQTT_PASSWORD': ''}
+    manager = MqttManager(main.config, main.led_controller.set_annimation, None, None, None)
+    manager.mqttc = client = FakeClient()
+    assert await manager.connect(retries=1)
+    main.mqtt_manager = manager
+    supervisor.add('mqtt', lambda: manager.is_connected, main.restart_mqtt)
+    client.up = False
+    manager.is_connected = False
+    await asyncio.sleep_ms(4 * BACKOFF_MS)
+    failed = client.connects
+    assert failed >= 3 and supervisor.subsystems['mqtt'].failures >= 2
+    client.up = True
+    took = await recovered(supervisor, 'mqtt', 3000)
+    assert manager.reconnects == 1
+    results.append(('broker down', took, supervisor.subsystems['mqtt'].restarts))
+
+    print("{:24} {:>8} {:>9}".format("failure", "recovery", "restarts"))
+    for name, ms, count in results:
+        print("{:24} {:>5} ms {:>9}".format(name, ms, count))
+    print("stats:", supervisor.stats())
+    supervisor.stop()
+    print("OK")
+
+asyncio.run(run())
@@ -0,0 +1,54 @@
+import gc
+import time
+from telemetry import Telemetry
+
+EVENTS = 5000
+QUEUE_SIZE = 50
+
+class NaiveTelemetry:
+    """Baseline: keeps a record per event and works the numbers out at publish time."""
+    def __init__(self):
+        self.events = []
+        self.pending = []
+
+    def tap(self, detected):
+        self.events.append({'type': 'tap', 'latency': time.ticks_diff(time.ticks_ms(), detected)})
+
+    def read_queued(self, detected):
+        self.pending.append(detected)
+
+    def published_read(self):
+        detected = self.pending.pop(0)
+        self.events.append({'type': 'publish', 'latency': time.ticks_diff(time.ticks_ms(), detected)})
+
+def one_tap(t, n):
+    detected = time.ticks_add(time.ticks_ms(), -(n % 300))
+    t.tap(detected)
+    t.read_queued(detected)
+    t.published_read()
+
+def bench(name, t):
+    for n in range(QUEUE_SIZE): # warm up, fills the pending ring once
+        one_tap(t, n)
+    gc.collect()
+    gc.disable()
+    before = gc.mem_alloc()
+    for n in range(100):
+        one_tap(t, n)
+    per_tap = (gc.mem_alloc() - before) / 100
+    gc.enable()
+
+    gc.collect()
+    start = time.ticks_us()
+    for n in range(EVENTS):
+        one_tap(t, n)
+    us = time.ticks_diff(time.ticks_us(), start) / EVENTS
+    print(f"{name:>9}: {us:7.1f} us per tap, {per_tap:6.1f} B allocated per tap")
+
+bench("naive", NaiveTelemetry())
+t = Telemetry(queue_size=QUEUE_SIZE)
+bench("telemetry", t)
+gc.collect()
+start = time.ticks_us()
+data = t.snapshot()
+print(f"snapshot: {time.ticks_diff(time.ticks_us(), start)} us, feedback_ms {data['feedback_ms']}")
@@ -0,0 +1,85 @@
+import gc
+import time
+import uasyncio as asyncio
+from time_service import TimeService, EPOCH_OFFSET, SYNC_NONE, SYNC_OK, SYNC_STALE
+
+DRIFT_PPM = 150      # the server clock runs this much faster than our crystal
+DELAY_MS = 40        # network round trip, split evenly
+HOUR_MS = 3600000
+CALLS = 2000
+
+class SimulatedNtp(TimeService):
+    """NTP answers from a simulated server; `ticks` is a simulated ticks_ms the test moves forward."""
+    def __init__(self, **kwargs):
+        TimeService.__init__(self, **kwargs)
+        self.ticks = self._ticks
+        self.start = self.ticks
+        self.true_start = (int(time.time()) + EPOCH_OFFSET) * 1000 + 1234  # the RTC is 1.2 s behind
+        self.fail = False
+
+    def truth(self, ticks):
+        elapsed = ticks - self.start
+        return self.true_start + elapsed + elapsed * DRIFT_PPM // 1000000
+
+    async def _query(self):
+        if self.fail:
+            raise OSError('NTP timeout')
+        sent = self.ticks
+        server = self.truth(sent + DELAY_MS // 2)
+        return server, server + 1, sent, sent + DELAY_MS + 1
+
+def stamp_cost(clock):
+    ticks = time.ticks_ms()
+    start = time.ticks_us()
+    for _ in range(CALLS):
+        time.time()
+    legacy = time.ticks_diff(time.ticks_us(), start) / CALLS
+    start = time.ticks_us()
+    for _ in range(CALLS):
+        clock.at(ticks)
+        clock.quality()
+    stamped = time.ticks_diff(time.ticks_us(), start) / CALLS
+    gc.collect()
+    before = gc.mem_alloc()
+    for _ in range(100):
+        clock.at(ticks)
+    return legacy, stamped, (gc.mem_alloc() - before) / 100
+
+async def main():
+    clock = SimulatedNtp()
+    assert clock.quality() == SYNC_NONE
+
+    assert await clock.sync()
+    print("first sync: step {} ms, delay {} ms".format(clock.last_step_ms, clock.last_delay_ms))
+    assert abs(clock.at(clock.ticks) - clock.truth(clock.ticks)) <= 2
+
+    clock.ticks += HOUR_MS
+    error = clock.at(clock.ticks) - clock.truth(clock.ticks)
+    print("after 1 h without correction: {} ms off".format(error))
+    await clock.sync()
+    print("second sync: step {} ms, drift {} ppm".format(clock.last_step_ms, clock._ppm))
+    assert abs(clock._ppm - DRIFT_PPM) <= 2
+
+    # With the drift known, the next hour stays within a few ms
+    for minute in range(60):
+        clock.ticks += 60000
+        assert abs(clock.at(clock.ticks) - clock.truth(clock.ticks)) <= 2, minute
+    await clock.sync()
+    print("third sync: step {} ms".format(clock.last_step_ms))
+    assert abs(clock.last_step_ms) <= 2
+
+    # Failed syncs are counted, the estimate keeps running
+    clock.fail = True
+    assert not await clock.sync() and clock.failures == 1
+
+    stale = SimulatedNtp(stale_s=0)
+    await stale.sync()
+    time.sleep_ms(DELAY_MS + 10)  # the simulated answer arrived DELAY_MS after the real ticks
+    assert stale.quality() == SYNC_STALE and clock.quality() == SYNC_OK
+
+    legacy, stamped, alloc = stamp_cost(clock)
+    print("time.time(): {:.2f} us, at() + quality(): {:.2f} us, {:.0f} B per stamp".format(legacy, stamped, alloc))
+    print("stats:", clock.stats())
+    print("OK")
+
+asyncio.run(main())
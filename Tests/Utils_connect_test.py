@@ -1,3 +1,4 @@
-from utils import connect
+import uasyncio as asyncio
+from network_manager import NetworkManager
 
-print(connect('ethernet', {}, {}))
\ No newline at end of file
+print(asyncio.run(NetworkManager({'PREFERED_NETWORK': 'ethernet'}, {}).connect()))
@@ -0,0 +1,82 @@
+# Fake `network` module for the network manager tests.
+# Interfaces come up a fixed time after they are started (PHY link + DHCP,
+# WiFi association + DHCP) and the test pulls the cable or kills the access
+# point with set_link(), so failovers can be timed without touching the board.
+import time
+
+STA_IF = 0
+AP_IF = 1
+PHY_LAN8720 = 0
+PHY_IP101 = 1
+PHY_RTL8201 = 2
+
+class FakeInterface:
+    def __init__(self, name, up_ms, ip):
+        self.name = name
+        self.up_ms = up_ms  # time from start (or link back) to connected
+        self.ip = ip
+        self._active = False
+        self.link = True      # cable plugged / access point in range
+        self.started = None   # ticks_ms of the last start, None when stopped
+        self.starts = 0
+
+    def active(self, value=None):
+        if value is None:
+            return self._active
+        self._active = bool(value)
+        if not value:
+            self.started = None
+
+    def _start(self):
+        self.starts += 1
+        self.started = time.ticks_ms()
+
+    def isconnected(self):
+        if not (self._active and self.link and self.started is not None):
+            return False
+        return time.ticks_diff(time.ticks_ms(), self.started) >= self.up_ms
+
+    def ifconfig(self):
+        return (self.ip, '255.255.255.0', '192.168.31.1', '192.168.31.1')
+
+    def set_link(self, up):
+        """Plugs / unplugs the cable (LAN) or brings the access point up / down (WLAN)."""
+        self.link = up
+        if up and self.name == 'lan' and self._active:
+            self._start()  # the PHY negotiates again and DHCP renews
+        elif not up and self.name == 'wlan':
+            self.started = None  # association lost, needs connect() again
+
+class FakeLAN(FakeInterface):
+    def active(self, value=None):
+        result = FakeInterface.active(self, value)
+        if value:
+            self._start()
+        return result
+
+class FakeWLAN(FakeInterface):
+    def connect(self, ssid, password):
+        self.ssid = ssid
+        self._start()
+
+    def disconnect(self):
+        self.started = None
+
+class FakeNetwork:
+    """Stands in for the `network` module: pass it as NetworkManager(net=...)."""
+    STA_IF = STA_IF
+    PHY_LAN8720 = PHY_LAN8720
+    PHY_IP101 = PHY_IP101
+    PHY_RTL8201 = PHY_RTL8201
+
+    def __init__(self, lan_up_ms=1500, wlan_up_ms=2500):
+        self.lan = FakeLAN('lan', lan_up_ms, '192.168.31.50')
+        self.wlan = FakeWLAN('wlan', wlan_up_ms, '192.168.31.51')
+        self.lan_args = None
+
+    def LAN(self, **kwargs):
+        self.lan_args = kwargs
+        return self.lan
+
+    def WLAN(self, interface):
+        return self.wlan
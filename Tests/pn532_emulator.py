@@ -0,0 +1,273 @@
+# PN532 emulator for the test and benchmark scripts.
+# Speaks the PN532 SPI protocol (LSB first status/data read/data write frames),
+# so the real NFC_PN532 driver can be exercised without a reader attached.
+import time
+
+_ACK = b'\x00\x00\xFF\x00\xFF\x00'
+
+def _rev(num):
+    result = 0
+    for _ in range(8):
+        result = (result << 1) | (num & 1)
+        num >>= 1
+    return result
+
+_REV = bytes(_rev(i) for i in range(256))
+
+class FakeCS:
+    """Chip select pin that counts SPI transactions and reports overlapping ones."""
+    def __init__(self, bus=None):
+        self.bus = bus
+        self.level = 1
+
+    def on(self):
+        self.level = 1
+        if self.bus:
+            self.bus.release(self)
+
+    def off(self):
+        self.level = 0
+        if self.bus:
+            self.bus.select(self)
+
+    def value(self, v=None):
+        if v is None:
+            return self.level
+        self.on() if v else self.off()
+
+    def init(self, *args, **kwargs):
+        pass
+
+class FakeBus:
+    """Shared SPI bus: routes transfers to the emulator whose CS is low."""
+    def __init__(self):
+        self.devices = {}
+        self.selected = None
+        self.collisions = 0
+        self.transactions = 0
+
+    def attach(self, emulator):
+        cs = FakeCS(self)
+        self.devices[id(cs)] = emulator
+        return cs
+
+    def select(self, cs):
+        if self.selected is not None and self.selected is not cs:
+            self.collisions += 1
+        self.selected = cs
+        self.transactions += 1
+
+    def release(self, cs):
+        if self.selected is cs:
+            self.selected = None
+
+    def _target(self):
+        if self.selected is None:
+            raise OSError('SPI transfer without chip select')
+        return self.devices[id(self.selected)]
+
+    def write(self, buf):
+        self._target().write(buf)
+
+    def write_readinto(self, out, into):
+        self._target().write_readinto(out, into)
+
+class FakeIRQ:
+    """PN532 IRQ line: low while a response is waiting to be read."""
+    def __init__(self, emulator):
+        self.emulator = emulator
+
+    def value(self):
+        return 0 if self.emulator.ready() else 1
+
+    def irq(self, *args, **kwargs):
+        pass
+
+class Card:
+    """
+    A MIFARE Classic / NTAG2xx card in the field of the emulated antenna.
+    With an `ats` (TL first) and SAK bit 0x20 it answers like an ISO14443-4
+    card (DESFire, phone): InListPassiveTarget reports the ATS after the UID.
+    """
+    def __init__(self, uid, atqa=0x0004, sak=0x08, key=b'\xFF' * 6, blocks=64, ntag_pages=0, ats=None):
+        self.uid = bytes(uid)
+        self.atqa = atqa
+        self.sak = sak
+        self.ats = bytes(ats) if ats else b''
+        self.key = key
+        # MIFARE memory is 16-byte blocks, NTAG memory is 4-byte pages
+        self.memory = bytearray((i * 7 + 3) & 0xFF for i in range(max(blocks * 16, ntag_pages * 4)))
+        self.ntag_pages = ntag_pages
+
+class PN532Emulator:
+    """
+    Emulates a PN532 on the SPI side. Use `spi` and `cs` as the driver's
+    spi device and cs pin, `card` to put a card into the field.
+    """
+    FIRMWARE = bytes([0x32, 0x01, 0x06, 0x07])
+
+    def __init__(self, bus=None, card=None, response_delay_ms=0):
+        self.bus = bus or FakeBus()
+        self.cs = self.bus.attach(self)
+        self.spi = self.bus
+        self.card = card
+        self.second_card = None  # only reported when the host asks for 2 targets
+        self.response_delay_ms = response_delay_ms
+        self.selected = None  # card selected by InListPassiveTarget
+        self.halted = None  # card halted by a failed AUTH
+        self._listing = None  # InListPassiveTarget still waiting for a card
+        self._autopoll = None  # (command, types) while InAutoPoll scans
+        self.irq = FakeIRQ(self)
+        self.authenticated = False
+        self._pending = []  # frames waiting to be read by the host
+        self._ready_at = 0
+        self.commands = {}  # command code -> count
+        self.transactions = 0
+        self.aborts = 0
+
+    # --- SPI side ---
+    def write(self, buf):
+        self.transactions += 1
+        data = bytes(_REV[b] for b in buf)
+        if len(data) > 1 and data[0] == 0x01:
+            self._command(data[1:])
+
+    def write_readinto(self, out, into):
+        self.transactions += 1
+        op = _REV[out[0]]
+        for i in range(len(into)):
+            into[i] = 0
+        if op == 0x02:
+            into[1] = _REV[0x01] if self.ready() else 0
+        elif op == 0x03 and self._pending:
+            frame = self._pending.pop(0)
+            for i in range(min(len(frame), len(into) - 1)):
+                into[i + 1] = _REV[frame[i]]
+
+    def ready(self):
+        self._check_waiting()
+        return bool(self._pending) and time.ticks_diff(time.ticks_ms(), self._ready_at) >= 0
+
+    # --- PN532 side ---
+    def _reply(self, command, data):
+        frame = bytearray(len(data) + 9)
+        frame[0:3] = b'\x00\x00\xFF'
+        length = len(data) + 2
+        frame[3] = length
+        frame[4] = (~length + 1) & 0xFF
+        frame[5] = 0xD5
+        frame[6] = command + 1
+        frame[7:7 + len(data)] = data
+        frame[-2] = (~(0xD5 + command + 1 + sum(data)) + 1) & 0xFF
+        frame[-1] = 0x00
+        self._pending.append(bytes(frame))
+
+    def _check_waiting(self):
+        # A card entering the field answers an InListPassiveTarget the host gave up on, or ends an InAutoPoll
+        if self._listing is not None and self.card is not None:
+            command, params = self._listing
+            self._listing = None
+            self._cmd_4a(command, params)
+        if self._autopoll is not None and self.card is not None:
+            command, types = self._autopoll
+            self._autopoll = None
+            card = self.card
+            self.selected = card
+            target = bytearray([0x01, card.atqa >> 8, card.atqa & 0xFF, card.sak, len(card.uid)]) + card.uid
+            self._reply(command, bytearray([0x01, types[0], len(target)]) + target)
+
+    def _command(self, frame):
+        if frame[0:3] != b'\x00\x00\xFF':
+            return
+        if frame[0:6] == _ACK:  # abort the running command
+            self._listing = None
+            self._autopoll = None
+            self._pending = []
+            self.aborts += 1
+            return
+        length = frame[3]
+        body = frame[5:5 + length]
+        if body[0] != 0xD4:
+            return
+        command, params = body[1], body[2:]
+        self.commands[command] = self.commands.get(command, 0) + 1
+        # An unread late response is still in the output buffer ahead of the new ACK
+        self._check_waiting()
+        self._pending = [f for f in self._pending if f != _ACK] + [_ACK]
+        self._ready_at = time.ticks_add(time.ticks_ms(), self.response_delay_ms)
+        handler = getattr(self, '_cmd_%02x' % command, None)
+        if handler:
+            handler(command, params)
+
+    @staticmethod
+    def _target(number, card):
+        """Target data of InListPassiveTarget: Tg, SENS_RES, SEL_RES, NFCID and, for ISO14443-4 cards, the ATS."""
+        data = bytearray([number, card.atqa >> 8, card.atqa & 0xFF, card.sak, len(card.uid)]) + card.uid
+        return data + card.ats if card.sak & 0x20 else data
+
+    def _cmd_02(self, command, params):  # GetFirmwareVersion
+        self._reply(command, self.FIRMWARE)
+
+    def _cmd_14(self, command, params):  # SAMConfiguration
+        self._reply(command, b'')
+
+    def _cmd_4a(self, command, params):  # InListPassiveTarget
+        self.authenticated = False
+        if self.card is None:
+            self.selected = None
+            self._listing = (command, params)
+            return  # no answer until a card shows up
+        cards = [card for card in (self.card, self.second_card) if card is not None]
+        if len(params) > 2:  # InitiatorData: the UID of the one card to select
+            cards = [card for card in cards if card.uid == bytes(params[2:])]
+        elif self.halted in cards and len(cards) > 1:
+            cards.remove(self.halted)  # the halted card loses the anticollision to the one still idle
+        cards = cards[:params[0]]
+        self.halted = None
+        if not cards:
+            self.selected = None
+            self._listing = (command, params)
+            return  # no answer until that card shows up
+        self.selected = cards[0]
+        data = bytearray([len(cards)])
+        for n, card in enumerate(cards):
+            data += self._target(n + 1, card)
+        self._reply(command, data)
+
+    def _cmd_40(self, command, params):  # InDataExchange
+        card = self.selected
+        if card is None or card not in (self.card, self.second_card):
+            return self._reply(command, b'\x01')  # timeout, card gone
+        op = params[1]
+        if op in (0x60, 0x61):
+            if bytes(params[3:9]) == card.key and bytes(params[9:13]) == card.uid[-4:]:
+                self.authenticated = True
+                return self._reply(command, b'\x00')
+            self.selected = None  # failed AUTH halts the card
+            self.halted = card
+            self.authenticated = False
+            return self._reply(command, b'\x14')
+        if op == 0x30:
+            if card.ntag_pages:
+                start = params[2] * 4
+            elif self.authenticated:
+                start = params[2] * 16
+            else:
+                return self._reply(command, b'\x14')
+            return self._reply(command, b'\x00' + bytes(card.memory[start:start + 16]))
+        self._reply(command, b'\x00')
+
+    def _cmd_42(self, command, params):  # InCommunicateThru
+        card = self.selected
+        if card is None or not card.ntag_pages or params[0] != 0x3A:
+            return self._reply(command, b'\x01')
+        start, end = params[1], params[2]
+        self._reply(command, b'\x00' + bytes(card.memory[start * 4:(end + 1) * 4]))
+
+    def _cmd_60(self, command, params):  # InAutoPoll
+        self._autopoll = (command, bytes(params[2:]) or b'\x10')
+
+    def reset_counters(self):
+        self.commands = {}
+        self.transactions = 0
+        self.aborts = 0
@@ -0,0 +1,127 @@
+"""
+Builds the firmware bundle for the reader: every module of Esp-software
+compiled to .mpy bytecode and the config frozen into config_snapshot.mpy, so
+the device neither compiles sources nor parses config.json at boot.
+
+    pip install mpy-cross        # same MicroPython version as the firmware
+    python extras/build_mpy.py   # -> build/, upload its content to the board
+
+main.py is shipped as app.mpy with a two line main.py that runs it (MicroPython
+only runs main.py from source). boot.py is copied as is. secrets.json is never
+put in the bundle, upload it separately. The snapshot records the CRC of the
+config.json it was built from: once the device rewrites config.json (a config
+update over MQTT) it deletes the snapshot and parses the JSON again.
+"""
+import argparse
+import binascii
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SNAPSHOT_FORMAT = 1  # config_store.SNAPSHOT_FORMAT
+COPY = ('boot.py',)
+SKIP = ('secrets.json', 'secrets.ex.json', 'pymakr.conf')
+
+MAIN_STUB = """# Generated by extras/build_mpy.py, the application is app.mpy
+import app
+app.run()
+"""
+
+def mpy_cross_command(path):
+    if path:
+        return [path]
+    if shutil.which('mpy-cross'):
+        return ['mpy-cross']
+    try:
+        import mpy_cross  # noqa: F401  (pip install mpy-cross)
+        return [sys.executable, '-m', 'mpy_cross']
+    except ImportError:
+        sys.exit("mpy-cross not found: pip install mpy-cross, or pass --mpy-cross")
+
+def compile_module(command, arch, source, target):
+    args = command + ['-o', target, source]
+    if arch:
+        args.insert(len(command), '-march=' + arch)
+    subprocess.run(args, check=True)
+
+def validate(config, defaults):
+    """Checks the value types against DEFAULT_CONFIG. Returns the list of problems."""
+    problems = []
+    for key, value in config.items():
+        if key not in defaults:
+            print("warning: %s is not a known config key" % key)
+            continue
+        expected = defaults[key]
+        if isinstance(expected, bool) or expected is None:
+            continue
+        if isinstance(expected, float) and isinstance(value, (int, float)):
+            continue
+        if type(value) is not type(expected):
+            problems.append("%s: expected %s, got %r" % (key, type(expected).__name__, value))
+    return problems
+
+def snapshot_source(config_file, source_dir):
+    with open(config_file, 'rb') as f:
+        data = f.read()
+    sys.path.insert(0, source_dir)
+    try:
+        from utils import DEFAULT_CONFIG
+    finally:
+        sys.path.pop(0)
+    loaded = json.loads(data)
+    problems = validate(loaded, DEFAULT_CONFIG)
+    if problems:
+        sys.exit("config.json is not valid:\n  " + "\n  ".join(problems))
+    config = dict(DEFAULT_CONFIG)
+    config.update(loaded)
+    return ("# Generated by extras/build_mpy.py from config.json, do not edit\n"
+            "FORMAT = %d\nSOURCE_CRC = %d\nCONFIG = %r\n"
+            % (SNAPSHOT_FORMAT, binascii.crc32(data) & 0xFFFFFFFF, config))
+
+def build(source_dir, out_dir, config_file, command, arch):
+    if os.path.isdir(out_dir):
+        shutil.rmtree(out_dir)
+    os.makedirs(out_dir)
+    total = 0
+    for name in sorted(os.listdir(source_dir)):
+        source = os.path.join(source_dir, name)
+        if not os.path.isfile(source) or name in SKIP:
+            continue
+        if name in COPY or not name.endswith('.py'):
+            shutil.copy(source, os.path.join(out_dir, name))
+            continue
+        module = 'app' if name == 'main.py' else name[:-3]
+        target = os.path.join(out_dir, module + '.mpy')
+        compile_module(command, arch, source, target)
+        total += os.path.getsize(target)
+        print("%-24s %6d B -> %6d B" % (name, os.path.getsize(source), os.path.getsize(target)))
+    with open(os.path.join(out_dir, 'main.py'), 'w') as f:
+        f.write(MAIN_STUB)
+
+    shutil.copy(config_file, os.path.join(out_dir, 'config.json'))
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, 'config_snapshot.py')
+        with open(source, 'w') as f:
+            f.write(snapshot_source(config_file, source_dir))
+        target = os.path.join(out_dir, 'config_snapshot.mpy')
+        compile_module(command, arch, source, target)
+        print("%-24s %6d B -> %6d B" % ('config snapshot', os.path.getsize(config_file), os.path.getsize(target)))
+    print("%d B of bytecode in %s" % (total, out_dir))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--src', default=os.path.join(ROOT, 'Esp-software'))
+    parser.add_argument('--out', default=os.path.join(ROOT, 'build'))
+    parser.add_argument('--config', help="config file to freeze, default <src>/config.json")
+    parser.add_argument('--mpy-cross', help="path of the mpy-cross binary")
+    parser.add_argument('--arch', default='xtensawin', help="native arch for mpy-cross (xtensawin = ESP32), '' for none")
+    args = parser.parse_args()
+    build(args.src, args.out, args.config or os.path.join(args.src, 'config.json'),
+          mpy_cross_command(args.mpy_cross), args.arch)
+
+if __name__ == '__main__':
+    main()